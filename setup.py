@@ -48,6 +48,7 @@ setup(
         'plotly~=5.0',
         'python-dateutil~=2.8',
         'requests~=2.25',
+        'scipy~=1.6',
         'specutils==1.4.0',
     ],
     extras_require={
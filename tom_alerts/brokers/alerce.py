@@ -1,5 +1,4 @@
 import logging
-import requests
 from urllib.parse import urlencode
 
 from astropy.time import Time, TimezoneInfo
@@ -8,6 +7,7 @@ from django import forms
 from django.core.cache import cache
 
 from tom_alerts.alerts import GenericAlert, GenericBroker, GenericQueryForm
+from tom_common import http_client
 from tom_targets.models import Target
 
 logger = logging.getLogger(__name__)
@@ -183,7 +183,7 @@ class ALeRCEQueryForm(GenericQueryForm):
         cached_classifiers = cache.get('alerce_classifiers')
 
         if not cached_classifiers:
-            response = requests.get(ALERCE_CLASSES_URL)
+            response = http_client.get(ALERCE_CLASSES_URL)
             response.raise_for_status()
             cached_classifiers = response.json()
 
@@ -296,7 +296,7 @@ class ALeRCEBroker(GenericBroker):
         payload = self._clean_parameters(parameters)
         logger.log(msg=f'Fetching alerts from ALeRCE with payload {payload}', level=logging.INFO)
         args = urlencode(self._clean_parameters(parameters))
-        response = requests.get(f'{ALERCE_SEARCH_URL}/objects/?count=false&{args}')
+        response = http_client.get(f'{ALERCE_SEARCH_URL}/objects/?count=false&{args}')
         response.raise_for_status()
         return response.json()
 
@@ -319,7 +319,7 @@ class ALeRCEBroker(GenericBroker):
             ...
         }
         """
-        response = requests.get(f'{ALERCE_SEARCH_URL}/objects/{id}')
+        response = http_client.get(f'{ALERCE_SEARCH_URL}/objects/{id}')
         response.raise_for_status()
         return response.json()
 
@@ -1,7 +1,6 @@
 from dateutil.parser import parse
 import json
 import re
-import requests
 from requests.exceptions import HTTPError
 
 from astropy.coordinates import SkyCoord
@@ -11,7 +10,8 @@ from bs4 import BeautifulSoup
 from django import forms
 
 from tom_alerts.alerts import GenericAlert, GenericBroker, GenericQueryForm
-from tom_dataproducts.models import ReducedDatum
+from tom_common import http_client
+from tom_dataproducts.ingest import ingest_reduced_data
 
 BASE_BROKER_URL = 'http://gsaweb.ast.cam.ac.uk'
 
@@ -46,7 +46,7 @@ class GaiaBroker(GenericBroker):
 
     def fetch_alerts(self, parameters):
         """Must return an iterator"""
-        response = requests.get(f'{BASE_BROKER_URL}/alerts/alertsindex')
+        response = http_client.get(f'{BASE_BROKER_URL}/alerts/alertsindex')
         response.raise_for_status()
 
         soup = BeautifulSoup(response.content, 'html.parser')
@@ -134,30 +134,24 @@ class GaiaBroker(GenericBroker):
         else:
             return
 
-        response = requests.get(lc_url)
+        response = http_client.get(lc_url)
         response.raise_for_status()
         html_data = response.text.split('\n')
 
+        photometry = []
         for entry in html_data[2:]:
             phot_data = entry.split(',')
 
             if len(phot_data) == 3:
                 if 'untrusted' not in phot_data[2] and 'null' not in phot_data[2]:
                     jd = Time(float(phot_data[1]), format='jd', scale='utc')
-                    jd.to_datetime(timezone=TimezoneInfo())
 
                     value = {
                         'magnitude': float(phot_data[2]),
                         'filter': 'G'
                     }
+                    photometry.append((jd.to_datetime(timezone=TimezoneInfo()), value))
 
-                    rd, _ = ReducedDatum.objects.get_or_create(
-                        timestamp=jd.to_datetime(timezone=TimezoneInfo()),
-                        value=value,
-                        source_name=self.name,
-                        source_location=alert_url,
-                        data_type='photometry',
-                        target=target)
-                    rd.save()
+        ingest_reduced_data(target, self.name, photometry, source_location=alert_url)
 
         return
@@ -1,8 +1,7 @@
-import requests
-
 from django import forms
 
 from tom_alerts.alerts import GenericQueryForm, GenericAlert, GenericBroker
+from tom_common import http_client
 from tom_targets.models import Target
 
 LASAIR_URL = 'https://lasair.roe.ac.uk'
@@ -25,7 +24,7 @@ class LasairBrokerForm(GenericQueryForm):
 
 def get_lasair_object(objectId):
     url = LASAIR_URL + '/object/' + objectId + '/json/'
-    response = requests.get(url)
+    response = http_client.get(url)
     obj = response.json()
     jdmax = obj['candidates'][0]['mjd']
     ra = obj['objectData']['ramean']
@@ -55,7 +54,7 @@ class LasairBroker(GenericBroker):
 
     def fetch_alerts(self, parameters):
         if 'cone' in parameters and len(parameters['cone'].strip()) > 0:
-            response = requests.post(
+            response = http_client.post(
                 LASAIR_URL + '/conesearch/',
                 data={'cone': parameters['cone'], 'json': 'on'}
             )
@@ -67,7 +66,7 @@ class LasairBroker(GenericBroker):
 
         # note: the sql SELECT must include objectId
         if 'sqlquery' in parameters and len(parameters['sqlquery'].strip()) > 0:
-            response = requests.post(
+            response = http_client.post(
                 LASAIR_URL + '/objlist/',
                 data={'sqlquery': parameters['sqlquery'], 'json': 'on', 'page': ''}
             )
@@ -79,7 +78,7 @@ class LasairBroker(GenericBroker):
 
     def fetch_alert(self, alert_id):
         url = LASAIR_URL + '/object/' + alert_id + '/json/'
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         parsed = response.json()
         return parsed
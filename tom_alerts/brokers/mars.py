@@ -1,4 +1,3 @@
-import requests
 from requests.exceptions import HTTPError
 from urllib.parse import urlencode
 from dateutil.parser import parse
@@ -7,7 +6,9 @@ from crispy_forms.layout import Layout, Div, Fieldset, HTML
 from astropy.time import Time, TimezoneInfo
 
 from tom_alerts.alerts import GenericAlert, GenericBroker, GenericQueryForm
+from tom_common import http_client
 from tom_targets.models import Target
+from tom_dataproducts.ingest import ingest_reduced_data
 from tom_dataproducts.models import ReducedDatum
 
 MARS_URL = 'https://mars.lco.global'
@@ -190,7 +191,7 @@ class MARSBroker(GenericBroker):
             parameters['page'],
             args
         )
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         return response.json()
 
@@ -204,7 +205,7 @@ class MARSBroker(GenericBroker):
 
     def fetch_alert(self, id):
         url = f'{MARS_URL}/{id}/?format=json'
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         parsed = response.json()
         return parsed
@@ -225,6 +226,7 @@ class MARSBroker(GenericBroker):
             alert = self.fetch_alert(alert['lco_id'])
 
         candidates = [{'candidate': alert.get('candidate')}] + alert.get('prv_candidate')
+        photometry = []
         for candidate in candidates:
             if all([key in candidate['candidate'] for key in ['jd', 'magpsf', 'fid', 'sigmapsf']]):
                 nondetection = False
@@ -233,7 +235,6 @@ class MARSBroker(GenericBroker):
             else:
                 continue
             jd = Time(candidate['candidate']['jd'], format='jd', scale='utc')
-            jd.to_datetime(timezone=TimezoneInfo())
             value = {
                 'filter': filters[candidate['candidate']['fid']]
             }
@@ -242,13 +243,9 @@ class MARSBroker(GenericBroker):
             else:
                 value['magnitude'] = candidate['candidate']['magpsf']
                 value['error'] = candidate['candidate']['sigmapsf']
-            rd, _ = ReducedDatum.objects.get_or_create(
-                timestamp=jd.to_datetime(timezone=TimezoneInfo()),
-                value=value,
-                source_name=self.name,
-                source_location=alert['lco_id'],
-                data_type='photometry',
-                target=target)
+            photometry.append((jd.to_datetime(timezone=TimezoneInfo()), value))
+
+        ingest_reduced_data(target, self.name, photometry, source_location=alert['lco_id'])
 
     def to_target(self, alert):
         alert_copy = alert.copy()
@@ -1,4 +1,3 @@
-import requests
 from urllib.parse import urlencode
 from dateutil.parser import parse
 from astropy import units as u
@@ -6,6 +5,7 @@ from astropy.coordinates import Angle
 
 
 from tom_alerts.alerts import GenericAlert, GenericQueryForm, GenericBroker
+from tom_common import http_client
 from tom_targets.models import Target
 
 SCOUT_URL = 'https://ssd-api.jpl.nasa.gov/scout.api'
@@ -34,7 +34,7 @@ class ScoutBroker(GenericBroker):
     def fetch_alerts(self, parameters):
         args = urlencode(self.clean_parameters(parameters))
         url = '{0}?{1}'.format(SCOUT_URL, args)
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         parsed = response.json()['data']
         parsed.sort(key=lambda x: parse(x['lastRun']), reverse=True)
@@ -43,7 +43,7 @@ class ScoutBroker(GenericBroker):
     def fetch_alert(self, id):
         url = f'{SCOUT_URL}/{id}/?format=json'
         url = '{0}?tdes={1}'.format(SCOUT_URL, id)
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         return response.json()
 
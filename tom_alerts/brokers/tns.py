@@ -1,7 +1,7 @@
 from tom_alerts.alerts import GenericQueryForm, GenericAlert, GenericBroker
+from tom_common import http_client
 from django import forms
 from django.conf import settings
-import requests
 import json
 from datetime import datetime, timedelta
 from crispy_forms.layout import Layout, Div, Fieldset
@@ -114,7 +114,7 @@ class TNSBroker(GenericBroker):
                 'public_timestamp': public_timestamp,
             })
          }
-        response = requests.post(TNS_SEARCH_URL, data, headers=cls.tns_headers())
+        response = http_client.post(TNS_SEARCH_URL, data, headers=cls.tns_headers())
         response.raise_for_status()
         transients = response.json()
         alerts = []
@@ -127,7 +127,7 @@ class TNSBroker(GenericBroker):
                     'spectroscopy': 0,
                 })
             }
-            response = requests.post(TNS_OBJECT_URL, data, headers=cls.tns_headers())
+            response = http_client.post(TNS_OBJECT_URL, data, headers=cls.tns_headers())
             response.raise_for_status()
             alert = response.json()['data']['reply']
 
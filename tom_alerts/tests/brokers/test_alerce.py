@@ -138,7 +138,7 @@ class TestALeRCEBrokerForm(TestCase):
                               form.errors['__all__'])
 
     @patch('tom_alerts.brokers.alerce.cache.get')
-    @patch('tom_alerts.brokers.alerce.requests.get')
+    @patch('tom_alerts.brokers.alerce.http_client.get')
     def test_get_classifiers(self, mock_requests_get, mock_cache_get):
         mock_response = Response()
         mock_response._content = str.encode(json.dumps(alerce_classifiers_response))
@@ -269,7 +269,7 @@ class TestALeRCEBrokerClass(TestCase):
         with self.subTest():
             self.assertIn(('page', 1), payload)
 
-    @patch('tom_alerts.brokers.alerce.requests.get')
+    @patch('tom_alerts.brokers.alerce.http_client.get')
     @patch('tom_alerts.brokers.alerce.ALeRCEBroker._clean_parameters')
     def test_fetch_alerts(self, mock_clean_parameters, mock_requests_get):
         """Test fetch_alerts broker method."""
@@ -303,7 +303,7 @@ class TestALeRCEBrokerClass(TestCase):
                 alerts.append(alert)
             self.assertEqual(20, len(alerts))
 
-    @patch('tom_alerts.brokers.alerce.requests.get')
+    @patch('tom_alerts.brokers.alerce.http_client.get')
     def test_fetch_alert(self, mock_requests_post):
         """Test fetch_alert broker method."""
         alert = create_alerce_alert(1)
@@ -111,7 +111,7 @@ class TestGaiaBroker(TestCase):
             value=12345.6789
         )
 
-    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    @mock.patch('tom_alerts.brokers.gaia.http_client.get')
     def test_fetch_alerts(self, mock_requests_get):
         mock_response = Response()
         mock_response._content = self.test_html
@@ -130,7 +130,7 @@ class TestGaiaBroker(TestCase):
         alert = GaiaBroker().to_generic_alert(self.alert_list[0])
         self.assertEqual(alert.name, self.alert_list[0]['name'])
 
-    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    @mock.patch('tom_alerts.brokers.gaia.http_client.get')
     def test_process_reduced_data_with_alert(self, mock_requests_get):
 
         mock_photometry_response = Response()
@@ -144,7 +144,7 @@ class TestGaiaBroker(TestCase):
         reduced_data = ReducedDatum.objects.filter(target=self.test_target, source_name='Gaia')
         self.assertGreater(reduced_data.count(), 1)
 
-    @mock.patch('tom_alerts.brokers.gaia.requests.get')
+    @mock.patch('tom_alerts.brokers.gaia.http_client.get')
     @mock.patch('tom_alerts.brokers.gaia.GaiaBroker.fetch_alerts')
     def test_process_reduced_data_without_alert(self, mock_fetch_alerts, mock_requests_get):
         mock_fetch_alerts.return_value = iter([self.alert_list[1]])
@@ -56,7 +56,7 @@ class TestMARSBrokerClass(TestCase):
         with self.assertRaises(ImportError):
             get_service_class('LASAIR')
 
-    @mock.patch('tom_alerts.brokers.mars.requests.get')
+    @mock.patch('tom_alerts.brokers.mars.http_client.get')
     def test_fetch_alerts(self, mock_requests_get):
         mock_return_data = {
             "has_next": "false",
@@ -89,6 +89,10 @@ class TestMARSBrokerClass(TestCase):
         reduced_data = ReducedDatum.objects.filter(target=self.test_target, source_name='MARS')
         self.assertEqual(reduced_data.count(), 2)
 
+        # Photometry that is already stored is not stored again
+        MARSBroker().process_reduced_data(self.test_target, alert=test_alert)
+        self.assertEqual(reduced_data.count(), 2)
+
     @mock.patch('tom_alerts.brokers.mars.MARSBroker.fetch_alert')
     def test_process_reduced_data_no_alert(self, mock_fetch_alert):
         self.test_data = self.test_data[1]
@@ -245,12 +245,38 @@ AUTH_STRATEGY = 'READ_ONLY'
 # `ObservationRecord`, `DataProduct`, and `ReducedDatum` objects.
 TARGET_PERMISSIONS_ONLY = True
 
+# Outbound requests to facilities, brokers and catalogs share a pooled HTTP session. Timeouts, in seconds to connect
+# and to wait for data, retries of idempotent requests on 429 and 5xx responses, and the connection pool size per host
+# can be changed here, for example:
+# HTTP_CLIENT = {
+#     'timeout': (5, 60),
+#     'retries': 3,
+#     'backoff_factor': 0.5,
+#     'pool_maxsize': 20,
+# }
+
+# Number of observation statuses that the updatestatus management command fetches in parallel from each robotic
+# facility
+OBSERVATION_STATUS_CONCURRENCY = 1
+
+# Number of data product files that are downloaded in parallel from a robotic facility
+DATA_PRODUCT_DOWNLOAD_CONCURRENCY = 4
+
+# Backend that runs background jobs, such as processing uploaded data products, creating thumbnails and updating
+# broker data. The ImmediateJobBackend runs jobs within the web request that enqueues them. To run them in the
+# background instead, use 'tom_common.jobs.DatabaseJobBackend' and keep a worker running with ./manage.py processjobs
+JOB_BACKEND = 'tom_common.jobs.ImmediateJobBackend'
+
+# Seconds after which a running job is marked as failed by ./manage.py processjobs, e.g. when its worker was killed
+JOB_TIMEOUT = 3600
+
 # URLs that should be allowed access even with AUTH_STRATEGY = LOCKED
 # for example: OPEN_URLS = ['/', '/about']
 OPEN_URLS = []
 
 HOOKS = {
     'target_post_save': 'tom_common.hooks.target_post_save',
+    'multiple_targets_post_save': 'tom_common.hooks.multiple_targets_post_save',
     'observation_change_state': 'tom_common.hooks.observation_change_state',
     'data_product_post_upload': 'tom_dataproducts.hooks.data_product_post_upload'
 }
@@ -261,6 +287,14 @@ THUMBNAIL_MAX_SIZE = (0, 0)
 
 THUMBNAIL_DEFAULT_SIZE = (200, 200)
 
+# Additional named thumbnail sizes, which are created along with the default size the first time that a thumbnail of a
+# data product is needed, for example:
+# THUMBNAIL_SIZES = {'large': (600, 600)}
+
+# Maximum number of points plotted per photometric series. Larger series are downsampled, keeping the brightest and
+# faintest points in each time bin.
+PHOTOMETRY_PLOT_MAX_POINTS = 2000
+
 HINTS_ENABLED = False
 HINT_LEVEL = 20
 
@@ -1,5 +1,4 @@
 import json
-import requests
 
 from astropy import units as u
 from astropy.coordinates import SkyCoord
@@ -7,6 +6,7 @@ from collections import OrderedDict
 from django.conf import settings
 
 from tom_catalogs.harvester import AbstractHarvester
+from tom_common import http_client
 from tom_common.exceptions import ImproperCredentialsException
 
 TNS_URL = 'https://www.wis-tns.org'
@@ -30,7 +30,7 @@ def get(term):
     get_data = [('api_key', (None, TNS_CREDENTIALS['api_key'])),
                 ('data', (None, json.dumps(json_file)))]
 
-    response = requests.post(get_url, files=get_data)
+    response = http_client.post(get_url, files=get_data)
     response_data = json.loads(response.text)
 
     if 400 <= response_data.get('id_code') <= 403:
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from tom_common.models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    model = Job
+    list_display = ('__str__', 'status', 'user', 'created', 'finished')
+    list_filter = ('status',)
+
+
+admin.site.register(Job, JobAdmin)
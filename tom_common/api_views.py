@@ -1,7 +1,14 @@
-from rest_framework.mixins import ListModelMixin
-from rest_framework.viewsets import GenericViewSet
+import os
 
-from tom_common.serializers import GroupSerializer
+from django_filters import rest_framework as drf_filters
+from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet, ViewSet
+
+from tom_common.http_client import get_request_stats
+from tom_common.models import Job
+from tom_common.serializers import GroupSerializer, JobSerializer
 
 
 class GroupViewSet(ListModelMixin, GenericViewSet):
@@ -13,3 +20,31 @@ class GroupViewSet(ListModelMixin, GenericViewSet):
 
     def get_queryset(self):
         return self.request.user.groups.all()
+
+
+class JobViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+    """
+    Viewset for background Job objects. Supports list and retrieve, and filtering by ``status``. Superusers see all
+    jobs, and other users see the jobs that they enqueued.
+    """
+    serializer_class = JobSerializer
+    filter_backends = (drf_filters.DjangoFilterBackend,)
+    filterset_fields = ('status',)
+
+    def get_queryset(self):
+        queryset = Job.objects.select_related('user')
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+
+class HTTPRequestStatsViewSet(ViewSet):
+    """
+    Viewset for the statistics of the outbound HTTP requests, per host, made by the process that serves the request,
+    as returned by ``tom_common.http_client.get_request_stats``. With several worker processes, each reports its own
+    requests, along with its ``pid``. Only available to staff users.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        return Response({'pid': os.getpid(), 'hosts': get_request_stats()})
@@ -1,5 +1,12 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class TomCommonConfig(AppConfig):
     name = 'tom_common'
+
+    def ready(self):
+        from tom_common.http_client import log_request_stats
+        # Summarizes the outbound HTTP requests of each process, such as a management command, when it exits
+        atexit.register(log_request_stats)
@@ -23,11 +23,34 @@ def run_hook(name, *args, **kwargs):
         return method(*args, **kwargs)
 
 
+def run_multiple_targets_post_save(targets, created):
+    """
+    Runs the ``multiple_targets_post_save`` hook once with all of the targets saved by a bulk operation. If that hook is
+    not configured, as in settings written before it was added, runs the ``target_post_save`` hook for each target
+    instead, so that custom ``target_post_save`` hooks still run on bulk operations.
+
+    :param targets: The saved targets
+    :type targets: list
+
+    :param created: Whether the targets were created, rather than updated
+    :type created: bool
+    """
+    if settings.HOOKS.get('multiple_targets_post_save'):
+        return run_hook('multiple_targets_post_save', targets=targets, created=created)
+    for target in targets:
+        run_hook('target_post_save', target=target, created=created)
+
+
 def target_post_save(target, created):
     """This hook runs following update of a target."""
     logger.info('Target post save hook: %s created: %s', target, created)
 
 
+def multiple_targets_post_save(targets, created):
+    """This hook runs once following the bulk creation or update of many targets, such as a bulk import."""
+    logger.info('Multiple targets post save hook: %s targets created: %s', len(targets), created)
+
+
 def observation_change_state(observation, previous_state):
     """This hook runs upon the status of an observation changing."""
     logger.info('Observation change state hook: %s from %s to %s', observation, previous_state, observation.status)
@@ -0,0 +1,155 @@
+"""
+Shared HTTP session for the outbound requests of the TOM, e.g. to facilities, brokers and catalogs, configured with
+``HTTP_CLIENT`` in settings. The number and duration of the requests to each host are recorded per process. They are
+logged when the process exits, e.g. when a management command finishes, and staff users can get those of a web worker
+from ``/api/http-stats/``.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_CLIENT_SETTINGS = {
+    'timeout': (5, 60),  # seconds to connect, and to wait for data
+    'retries': 3,
+    'backoff_factor': 0.5,
+    'pool_maxsize': 20,
+}
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_http_client_settings():
+    """
+    Returns the settings of the shared session, which are the defaults updated with ``HTTP_CLIENT`` in settings.
+
+    :returns: dictionary with ``timeout``, ``retries``, ``backoff_factor`` and ``pool_maxsize``
+    :rtype: dict
+    """
+    return {**DEFAULT_HTTP_CLIENT_SETTINGS, **getattr(settings, 'HTTP_CLIENT', {})}
+
+
+class InstrumentedSession(requests.Session):
+    """
+    ``requests.Session`` that keeps connections alive per host, retries idempotent requests with exponential backoff
+    on connection errors and on 429 and 5xx responses, applies a default timeout, and records the number and duration
+    of requests per host.
+    """
+
+    def __init__(self, timeout, retries, backoff_factor, pool_maxsize):
+        super().__init__()
+        self.timeout = timeout
+        # Responses are returned after the last retry rather than raising, so that callers can inspect their status
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            _record_request(host, time.perf_counter() - start, error=True)
+            raise
+        duration = time.perf_counter() - start
+        _record_request(host, duration, error=response.status_code >= 400)
+        logger.debug('%s %s returned %s in %.3fs', method, url, response.status_code, duration)
+        return response
+
+
+def _record_request(host, duration, error):
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {'count': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0})
+        host_stats['count'] += 1
+        host_stats['errors'] += int(error)
+        host_stats['total_time'] += duration
+        host_stats['max_time'] = max(host_stats['max_time'], duration)
+
+
+def get_session():
+    """
+    Returns the session shared by all outbound HTTP requests of this process. The session is safe to use from multiple
+    threads.
+
+    :returns: shared session
+    :rtype: InstrumentedSession
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = InstrumentedSession(**get_http_client_settings())
+    return _session
+
+
+def request(method, url, **kwargs):
+    """
+    Makes a request with the shared session. Takes the same arguments as ``requests.request``.
+    """
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    """
+    Makes a GET request with the shared session. Takes the same arguments as ``requests.get``.
+    """
+    return request('GET', url, params=params, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    """
+    Makes a POST request with the shared session. Takes the same arguments as ``requests.post``.
+    """
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def get_request_stats():
+    """
+    Returns statistics of the requests made by this process with the shared session, per host.
+
+    :returns: dictionary of host to a dictionary of the ``count`` of requests, the number of ``errors`` (failed
+        connections and 4xx or 5xx responses), and the ``total_time``, ``mean_time`` and ``max_time`` in seconds
+    :rtype: dict
+    """
+    with _stats_lock:
+        return {
+            host: {**host_stats, 'mean_time': host_stats['total_time'] / host_stats['count']}
+            for host, host_stats in _stats.items()
+        }
+
+
+def log_request_stats():
+    """
+    Logs the statistics of the requests made by this process with the shared session, with one line per host, slowest
+    host first. This is done when the process exits, e.g. when a management command finishes.
+    """
+    stats = get_request_stats()
+    for host, host_stats in sorted(stats.items(), key=lambda item: item[1]['total_time'], reverse=True):
+        logger.info(
+            'HTTP requests to %s: %d requests, %d errors, %.3fs total, %.3fs mean, %.3fs max', host,
+            host_stats['count'], host_stats['errors'], host_stats['total_time'], host_stats['mean_time'],
+            host_stats['max_time']
+        )
+
+
+def reset_request_stats():
+    """
+    Clears the request statistics of this process.
+    """
+    with _stats_lock:
+        _stats.clear()
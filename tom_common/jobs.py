@@ -0,0 +1,191 @@
+from datetime import timedelta
+from importlib import import_module
+import logging
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from tom_common.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_BACKEND = 'tom_common.jobs.ImmediateJobBackend'
+
+# Number of pending jobs considered at once when a worker claims the next job
+CLAIM_CANDIDATES = 10
+
+# Seconds after which a running job is considered stale, e.g. because its worker was killed
+DEFAULT_JOB_TIMEOUT = 3600
+
+
+class BaseJobBackend:
+    """
+    Base class of job backends, which decide where and when enqueued jobs run. Custom backends, e.g. for an external
+    task queue, subclass this and are selected with ``JOB_BACKEND`` in settings.
+    """
+
+    def submit(self, job):
+        """
+        Called after a job has been saved to the database as pending.
+
+        :param job: The enqueued job
+        :type job: Job
+        """
+        raise NotImplementedError
+
+
+class ImmediateJobBackend(BaseJobBackend):
+    """
+    Runs jobs in the process that enqueues them, as soon as they are enqueued. No worker is needed, but web requests
+    wait for their jobs to finish.
+    """
+
+    def submit(self, job):
+        run_job(job)
+
+
+class DatabaseJobBackend(BaseJobBackend):
+    """
+    Leaves jobs in the database, from which they are run by the ``processjobs`` management command.
+    """
+
+    def submit(self, job):
+        pass
+
+
+def get_job_backend():
+    """
+    Returns the job backend specified by ``JOB_BACKEND`` in settings, which defaults to ``ImmediateJobBackend``.
+
+    :returns: job backend
+    :rtype: BaseJobBackend
+    """
+    backend = getattr(settings, 'JOB_BACKEND', DEFAULT_JOB_BACKEND)
+    mod_name, class_name = backend.rsplit('.', 1)
+    try:
+        clazz = getattr(import_module(mod_name), class_name)
+    except (ImportError, AttributeError):
+        raise ImportError('Could not import {}. Did you provide the correct path?'.format(backend))
+    return clazz()
+
+
+def get_function_path(function):
+    if isinstance(function, str):
+        return function
+    return '{0}.{1}'.format(function.__module__, function.__qualname__)
+
+
+def enqueue(function, args=None, kwargs=None, description='', user=None, unique=False):
+    """
+    Enqueues a call of a function as a background job.
+
+    :param function: Module-level function, or its dotted path
+    :type function: function or str
+
+    :param args: Positional arguments of the function, which must be serializable to JSON
+    :type args: list
+
+    :param kwargs: Keyword arguments of the function, which must be serializable to JSON
+    :type kwargs: dict
+
+    :param description: Human-readable description of the job
+    :type description: str
+
+    :param user: The user that enqueued the job
+    :type user: User
+
+    :param unique: If True, no job is enqueued if a job with the same function and arguments is pending or running,
+                   and that job is returned instead. Running jobs that are stale are not taken into account.
+    :type unique: bool
+
+    :returns: The enqueued job
+    :rtype: Job
+    """
+    job_fields = {'function': get_function_path(function), 'args': list(args or []), 'kwargs': kwargs or {}}
+    if unique:
+        existing_job = Job.objects.filter(
+            Q(status=Job.PENDING) | Q(status=Job.RUNNING, started__gte=get_stale_job_cutoff()), **job_fields
+        ).first()
+        if existing_job:
+            return existing_job
+    job = Job.objects.create(description=description[:200], user=user, **job_fields)
+    get_job_backend().submit(job)
+    return job
+
+
+def run_job(job):
+    """
+    Runs a job and records its result, or the error that it raised.
+
+    :param job: The job to run
+    :type job: Job
+
+    :returns: The job, after it finished
+    :rtype: Job
+    """
+    job.status = Job.RUNNING
+    job.started = timezone.now()
+    job.save(update_fields=['status', 'started'])
+    try:
+        mod_name, function_name = job.function.rsplit('.', 1)
+        function = getattr(import_module(mod_name), function_name)
+        result = function(*job.args, **job.kwargs)
+    except Exception as e:
+        logger.exception('Job {0} failed'.format(job.id))
+        job.status = Job.FAILED
+        job.error = str(e) or e.__class__.__name__
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = '' if result is None else str(result)
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished'])
+    return job
+
+
+def get_stale_job_cutoff():
+    """
+    Returns the time before which running jobs are stale, which is ``JOB_TIMEOUT`` seconds ago. ``JOB_TIMEOUT``
+    defaults to one hour.
+
+    :returns: The start time of the newest stale job
+    :rtype: datetime
+    """
+    return timezone.now() - timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT))
+
+
+def fail_stale_jobs():
+    """
+    Marks the running jobs that started more than ``JOB_TIMEOUT`` seconds ago as failed. Such jobs are usually left
+    running by a worker that crashed or was killed, and would otherwise never finish. If the worker of a stale job is
+    still running it, the job is updated with its result once it finishes.
+
+    :returns: The number of jobs marked as failed
+    :rtype: int
+    """
+    stale_jobs = Job.objects.filter(status=Job.RUNNING, started__lt=get_stale_job_cutoff())
+    count = stale_jobs.update(status=Job.FAILED, error='The job did not finish in time', finished=timezone.now())
+    if count:
+        logger.warning('Marked {0} stale running jobs as failed'.format(count))
+    return count
+
+
+def claim_job():
+    """
+    Claims the oldest pending job by marking it as running. A job can only be claimed by one worker, even when several
+    workers run at once. Stale running jobs are marked as failed first.
+
+    :returns: The claimed job, or None if there are no pending jobs
+    :rtype: Job
+    """
+    fail_stale_jobs()
+    while True:
+        pending_jobs = Job.objects.filter(status=Job.PENDING).order_by('created', 'id')
+        candidates = list(pending_jobs.values_list('id', flat=True)[:CLAIM_CANDIDATES])
+        if not candidates:
+            return None
+        for job_id in candidates:
+            # The status check makes the update a no-op if another worker claimed the job first
+            claimed = Job.objects.filter(pk=job_id, status=Job.PENDING)
+            if claimed.update(status=Job.RUNNING, started=timezone.now()):
+                return Job.objects.get(pk=job_id)
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tom_common.jobs import claim_job, run_job
+from tom_common.models import Job
+
+
+class Command(BaseCommand):
+    """
+    Runs the background jobs enqueued with the ``DatabaseJobBackend``, oldest first. By default the worker keeps polling
+    for new jobs; with ``--once`` it exits when no jobs are pending, so that it can be run as a cron job instead.
+    Several workers can run at once.
+
+    Example: ./manage.py processjobs --sleep 2
+    """
+
+    help = 'Runs pending background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no jobs are pending, rather than waiting for new jobs.'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5,
+            help='Seconds to wait before checking again when no jobs are pending.'
+        )
+        parser.add_argument(
+            '--max_jobs',
+            type=int,
+            help='Exit after running this many jobs.'
+        )
+
+    def handle(self, *args, **options):
+        succeeded = 0
+        failed = 0
+        while options['max_jobs'] is None or succeeded + failed < options['max_jobs']:
+            close_old_connections()
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            job = run_job(job)
+            if job.status == Job.SUCCEEDED:
+                succeeded += 1
+            else:
+                failed += 1
+        return f'Ran {succeeded + failed} jobs, of which {failed} failed.'
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
@@ -8,3 +9,73 @@ from rest_framework.authtoken.models import Token
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+
+class Job(models.Model):
+    """
+    Class representing a background job, which calls a function outside of the web request that enqueued it.
+
+    :param function: Dotted path of the function called by the job.
+    :type function: str
+
+    :param args: Positional arguments of the function, which must be serializable to JSON.
+    :type args: list
+
+    :param kwargs: Keyword arguments of the function, which must be serializable to JSON.
+    :type kwargs: dict
+
+    :param description: Human-readable description of the job.
+    :type description: str
+
+    :param status: The status of the job, one of ``PENDING``, ``RUNNING``, ``SUCCEEDED`` or ``FAILED``.
+    :type status: str
+
+    :param result: The value returned by the function, as a string.
+    :type result: str
+
+    :param error: The error raised by the function, if it failed.
+    :type error: str
+
+    :param user: The user that enqueued the job, if any.
+    :type user: User
+
+    :param created: The time at which the job was enqueued.
+    :type created: datetime
+
+    :param started: The time at which the job started running.
+    :type started: datetime
+
+    :param finished: The time at which the job finished running.
+    :type finished: datetime
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    function = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    description = models.CharField(max_length=200, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    result = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['status', 'created'], name='tom_common_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return self.description or self.function
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import Group
 from rest_framework import serializers
 
+from tom_common.models import Job
+
 
 class GroupSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
@@ -9,3 +11,13 @@ class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
         fields = ('id', 'name',)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    user = serializers.StringRelatedField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'function', 'args', 'kwargs', 'description', 'status', 'result', 'error', 'user', 'created',
+                  'started', 'finished')
+        read_only_fields = fields
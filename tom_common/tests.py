@@ -1,7 +1,17 @@
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+
+from tom_common import http_client
+from tom_common.jobs import claim_job, enqueue
+from tom_common.models import Job
 
 
 class TestCommonViews(TestCase):
@@ -114,3 +124,163 @@ class TestAuthScheme(TestCase):
         response = self.client.get(reverse('tom_targets:list'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Create Targets')
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Responds with 503 Service Unavailable to every other request.
+    """
+    calls = 0
+
+    def do_GET(self):
+        FlakyHandler.calls += 1
+        self.send_response(503 if FlakyHandler.calls % 2 else 200)
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHttpClient(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        FlakyHandler.calls = 0
+        http_client.reset_request_stats()
+
+    def test_retries_and_stats(self):
+        session = http_client.InstrumentedSession(timeout=5, retries=2, backoff_factor=0, pool_maxsize=2)
+        for _ in range(3):
+            response = session.get(self.url)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(FlakyHandler.calls, 6)
+
+        stats = http_client.get_request_stats()[f'127.0.0.1:{self.server.server_port}']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['errors'], 0)
+        self.assertGreater(stats['total_time'], 0)
+        self.assertLessEqual(stats['mean_time'], stats['max_time'])
+
+    def test_failed_request_is_returned(self):
+        session = http_client.InstrumentedSession(timeout=5, retries=0, backoff_factor=0, pool_maxsize=2)
+        self.assertEqual(session.get(self.url).status_code, 503)
+        self.assertEqual(http_client.get_request_stats()[f'127.0.0.1:{self.server.server_port}']['errors'], 1)
+
+    def test_log_request_stats(self):
+        session = http_client.InstrumentedSession(timeout=5, retries=0, backoff_factor=0, pool_maxsize=2)
+        session.get(self.url)
+        with self.assertLogs('tom_common.http_client', level='INFO') as logs:
+            http_client.log_request_stats()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f'HTTP requests to 127.0.0.1:{self.server.server_port}: 1 requests, 1 errors', logs.output[0])
+
+    def test_request_stats_api(self):
+        session = http_client.InstrumentedSession(timeout=5, retries=2, backoff_factor=0, pool_maxsize=2)
+        session.get(self.url)
+        self.client.force_login(User.objects.create_user(username='user', password='user'))
+        # The 403 response is turned into a redirect to the login page by Raise403Middleware
+        self.assertRedirects(self.client.get(reverse('api:http-stats-list')),
+                             reverse('login') + '?next=' + reverse('api:http-stats-list'))
+
+        self.client.force_login(User.objects.create_superuser(username='admin', password='admin'))
+        response = self.client.get(reverse('api:http-stats-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['hosts'][f'127.0.0.1:{self.server.server_port}']['count'], 1)
+
+
+def add(a, b):
+    return a + b
+
+
+def fail():
+    raise ValueError('Something went wrong')
+
+
+@override_settings(JOB_BACKEND='tom_common.jobs.DatabaseJobBackend')
+class TestJobs(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='user')
+        self.admin = User.objects.create_superuser(username='admin', password='admin', email='test@example.com')
+
+    def test_enqueue_and_run_jobs(self):
+        job = enqueue(add, args=[1, 2], description='Add numbers', user=self.user)
+        failed_job = enqueue('tom_common.tests.fail')
+        self.assertEqual(job.function, 'tom_common.tests.add')
+        self.assertEqual(job.status, Job.PENDING)
+
+        result = call_command('processjobs', once=True)
+
+        self.assertEqual(result, 'Ran 2 jobs, of which 1 failed.')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, '3')
+        self.assertIsNotNone(job.finished)
+        failed_job.refresh_from_db()
+        self.assertEqual(failed_job.status, Job.FAILED)
+        self.assertEqual(failed_job.error, 'Something went wrong')
+
+    @override_settings(JOB_BACKEND='tom_common.jobs.ImmediateJobBackend')
+    def test_enqueue_immediate(self):
+        job = enqueue(add, args=[1, 2])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, '3')
+
+    def test_enqueue_unique(self):
+        job = enqueue(add, args=[1, 2], unique=True)
+        self.assertEqual(enqueue(add, args=[1, 2], unique=True), job)
+        self.assertNotEqual(enqueue(add, args=[2, 1], unique=True), job)
+        call_command('processjobs', once=True)
+        self.assertNotEqual(enqueue(add, args=[1, 2], unique=True), job)
+
+    def test_claim_job(self):
+        first_job = enqueue(add, args=[1, 2])
+        second_job = enqueue(add, args=[3, 4])
+
+        self.assertEqual(claim_job(), first_job)
+        self.assertEqual(claim_job(), second_job)
+        self.assertIsNone(claim_job())
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 2)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_stale_running_job(self):
+        job = enqueue(add, args=[1, 2], unique=True)
+        self.assertEqual(claim_job(), job)
+        Job.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(seconds=120))
+
+        new_job = enqueue(add, args=[1, 2], unique=True)
+        self.assertNotEqual(new_job, job)
+        self.assertEqual(claim_job(), new_job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, 'The job did not finish in time')
+        new_job.refresh_from_db()
+        self.assertEqual(new_job.status, Job.RUNNING)
+
+    def test_job_list(self):
+        enqueue(add, args=[1, 2], description='Job of user', user=self.user)
+        enqueue(add, args=[3, 4], description='Job of admin', user=self.admin)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('job-list'))
+        self.assertContains(response, 'Job of user')
+        self.assertNotContains(response, 'Job of admin')
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('job-list'), {'status': Job.PENDING})
+        self.assertContains(response, 'Job of user')
+        self.assertContains(response, 'Job of admin')
+
+    def test_job_api(self):
+        job = enqueue(add, args=[1, 2], description='Job of user', user=self.user)
+        enqueue(add, args=[3, 4], description='Job of admin', user=self.admin)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('api:jobs-list'), {'status': Job.PENDING})
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get(reverse('api:jobs-detail', args=(job.id,)))
+        self.assertEqual(response.json()['status'], Job.PENDING)
+        self.assertEqual(response.json()['user'], 'user')
@@ -22,14 +22,16 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.authtoken import views
 
-from tom_common.api_views import GroupViewSet
+from tom_common.api_views import GroupViewSet, HTTPRequestStatsViewSet, JobViewSet
 from tom_common.views import UserListView, UserPasswordChangeView, UserCreateView, UserDeleteView, UserUpdateView
-from tom_common.views import CommentDeleteView, GroupCreateView, GroupUpdateView, GroupDeleteView
+from tom_common.views import CommentDeleteView, GroupCreateView, GroupUpdateView, GroupDeleteView, JobListView
 
 from .api_router import collect_api_urls, SharedAPIRootRouter  # DRF routers are setup in each INSTALL_APPS url.py
 
 router = SharedAPIRootRouter()
 router.register(r'groups', GroupViewSet, 'groups')
+router.register(r'jobs', JobViewSet, 'jobs')
+router.register(r'http-stats', HTTPRequestStatsViewSet, 'http-stats')
 
 urlpatterns = [
     path('', TemplateView.as_view(template_name='tom_common/index.html'), name='home'),
@@ -47,6 +49,7 @@ urlpatterns = [
     path('groups/create/', GroupCreateView.as_view(), name='group-create'),
     path('groups/<int:pk>/update/', GroupUpdateView.as_view(), name='group-update'),
     path('groups/<int:pk>/delete/', GroupDeleteView.as_view(), name='group-delete'),
+    path('jobs/', JobListView.as_view(), name='job-list'),
     path('accounts/login/', LoginView.as_view(), name='login'),
     path('accounts/logout/', LogoutView.as_view(), name='logout'),
     path('comment/<int:pk>/delete', CommentDeleteView.as_view(), name='comment-delete'),
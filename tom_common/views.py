@@ -1,4 +1,4 @@
-from django.views.generic import TemplateView
+from django.views.generic import ListView, TemplateView
 from django.views.generic.edit import FormView, DeleteView
 from django.views.generic.edit import UpdateView, CreateView
 from django.contrib.auth.models import User, Group
@@ -12,6 +12,7 @@ from django.shortcuts import redirect
 
 from tom_common.forms import ChangeUserPasswordForm, CustomUserCreationForm, GroupForm
 from tom_common.mixins import SuperuserRequiredMixin
+from tom_common.models import Job
 
 
 class GroupCreateView(SuperuserRequiredMixin, CreateView):
@@ -186,3 +187,37 @@ class CommentDeleteView(LoginRequiredMixin, DeleteView):
             return super().delete(request, *args, **kwargs)
         else:
             return HttpResponseForbidden('Not authorized')
+
+
+class JobListView(LoginRequiredMixin, ListView):
+    """
+    View that handles display of the list of background ``Job`` objects. Superusers see all jobs, and other users see
+    the jobs that they enqueued. Requires authentication.
+    """
+    model = Job
+    paginate_by = 25
+
+    def get_queryset(self):
+        """
+        Gets the set of ``Job`` objects that the user may view, optionally filtered by the ``status`` query parameter.
+
+        :returns: Set of ``Job`` objects
+        :rtype: QuerySet
+        """
+        queryset = super().get_queryset().select_related('user')
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(user=self.request.user)
+        if self.request.GET.get('status'):
+            queryset = queryset.filter(status=self.request.GET['status'])
+        return queryset
+
+    def get_context_data(self, *args, **kwargs):
+        """
+        Adds the job statuses to the context dictionary.
+
+        :returns: context dictionary
+        :rtype: dict
+        """
+        context = super().get_context_data(*args, **kwargs)
+        context['statuses'] = Job.STATUS_CHOICES
+        return context
@@ -1,7 +1,7 @@
 from django.conf import settings
 from django_filters import rest_framework as drf_filters
 from guardian.mixins import PermissionListMixin
-from guardian.shortcuts import assign_perm, get_objects_for_user
+from guardian.shortcuts import get_objects_for_user
 from rest_framework import status
 from rest_framework.mixins import CreateModelMixin, DestroyModelMixin, ListModelMixin
 from rest_framework.parsers import MultiPartParser
@@ -9,10 +9,12 @@ from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 from tom_common.hooks import run_hook
-from tom_dataproducts.data_processor import run_data_processor
+from tom_common.jobs import enqueue
+from tom_common.models import Job
 from tom_dataproducts.filters import DataProductFilter
-from tom_dataproducts.models import DataProduct, ReducedDatum
+from tom_dataproducts.models import DataProduct
 from tom_dataproducts.serializers import DataProductSerializer
+from tom_dataproducts.tasks import process_data_product
 
 
 class DataProductViewSet(CreateModelMixin, DestroyModelMixin, ListModelMixin, GenericViewSet, PermissionListMixin):
@@ -41,18 +43,20 @@ class DataProductViewSet(CreateModelMixin, DestroyModelMixin, ListModelMixin, Ge
             dp = DataProduct.objects.get(pk=response.data['id'])
             try:
                 run_hook('data_product_post_upload', dp)
-                reduced_data = run_data_processor(dp)
-                if not settings.TARGET_PERMISSIONS_ONLY:
-                    for group in response.data['group']:
-                        assign_perm('tom_dataproducts.view_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
             except Exception:
-                ReducedDatum.objects.filter(data_product=dp).delete()
                 dp.delete()
+                job = None
+            else:
+                group_ids = []
+                if not settings.TARGET_PERMISSIONS_ONLY:
+                    group_ids = [group['id'] for group in response.data['groups']]
+                job = enqueue(process_data_product, args=[dp.id, group_ids], description=f'Process {dp}',
+                              user=request.user)
+            if job is None or job.status == Job.FAILED:
                 return Response({'Data processing error': '''There was an error in processing your DataProduct into \
                                                              individual ReducedDatum objects.'''},
                                 status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            response.data['job'] = job.id
         return response
 
     def get_queryset(self):
@@ -1,4 +1,5 @@
 import mimetypes
+from itertools import islice
 
 from django.conf import settings
 from importlib import import_module
@@ -8,6 +9,9 @@ from tom_dataproducts.models import ReducedDatum
 
 DEFAULT_DATA_PROCESSOR_CLASS = 'tom_dataproducts.data_processor.DataProcessor'
 
+# Number of ReducedDatum objects created per INSERT statement
+REDUCED_DATUM_BATCH_SIZE = 5000
+
 
 def run_data_processor(dp):
     """
@@ -36,9 +40,14 @@ def run_data_processor(dp):
     data_processor = clazz()
     data = data_processor.process_data(dp)
 
-    reduced_datums = [ReducedDatum(target=dp.target, data_product=dp, data_type=dp.data_product_type,
-                                   timestamp=datum[0], value=datum[1]) for datum in data]
-    ReducedDatum.objects.bulk_create(reduced_datums)
+    # Model instances are built one batch at a time, so that only a single batch is held in memory at once
+    reduced_datums = (ReducedDatum(target=dp.target, data_product=dp, data_type=dp.data_product_type,
+                                   timestamp=datum[0], value=datum[1]) for datum in data)
+    while True:
+        batch = list(islice(reduced_datums, REDUCED_DATUM_BATCH_SIZE))
+        if not batch:
+            break
+        ReducedDatum.objects.bulk_create(batch, batch_size=REDUCED_DATUM_BATCH_SIZE)
 
     return ReducedDatum.objects.filter(data_product=dp)
 
@@ -1,7 +1,7 @@
 import django_filters
-from django.db.models import Q
 
 from tom_dataproducts.models import DataProduct
+from tom_targets.name_index import search_target_ids
 
 
 class DataProductFilter(django_filters.FilterSet):
@@ -13,4 +13,4 @@ class DataProductFilter(django_filters.FilterSet):
         fields = ['target_name', 'facility']
 
     def filter_name(self, queryset, name, value):
-        return queryset.filter(Q(target__name__icontains=value) | Q(target__aliases__name__icontains=value))
+        return queryset.filter(target__in=search_target_ids(value))
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+import os
+
+from astropy.io import fits
+
+
+def _get_fits_source(file):
+    if isinstance(file, (str, os.PathLike)):
+        return file
+    try:
+        # FieldFile of a storage on the local filesystem
+        return file.path
+    except (AttributeError, NotImplementedError, ValueError):
+        pass
+    name = getattr(file, 'name', None)
+    if name and os.path.isfile(name):
+        return name
+    file.open('rb')
+    file.seek(0)
+    return file
+
+
+@contextmanager
+def open_fits(file):
+    """
+    Opens a FITS file for reading. Files on the local filesystem are memory-mapped, and HDUs are only read when they
+    are accessed, so that only the headers and sections of data that are used are read from disk, however large the
+    file is.
+
+    :param file: Path, or Django file, of the FITS file
+    :type file: str or django.core.files.File
+
+    :returns: context manager that yields the list of HDUs in the file, and closes it on exit
+    :rtype: astropy.io.fits.HDUList
+    """
+    source = _get_fits_source(file)
+    try:
+        with fits.open(source, memmap=True, lazy_load_hdus=True) as hdul:
+            yield hdul
+    finally:
+        if source is file and not isinstance(file, (str, os.PathLike)):
+            # Files on remote storage are read as a stream, which is opened above
+            file.close()
+
+
+def get_data_hdu(hdul):
+    """
+    Returns the first HDU with data, which is the primary HDU unless it is empty, in the same way as
+    ``astropy.io.fits.getdata``. Only headers are read.
+
+    :param hdul: List of HDUs, as returned by ``open_fits``
+    :type hdul: astropy.io.fits.HDUList
+
+    :returns: HDU with data
+    :rtype: astropy.io.fits.hdu.base.ExtensionHDU
+    """
+    if hdul[0].header.get('NAXIS', 0) > 0:
+        return hdul[0]
+    return hdul[1]
+
+
+def get_science_hdu(hdul):
+    """
+    Returns the first HDU with an ``EXTNAME`` of ``SCI``, which marks a FITS image. Only headers are read, up to the
+    first match.
+
+    :param hdul: List of HDUs, as returned by ``open_fits``
+    :type hdul: astropy.io.fits.HDUList
+
+    :returns: science HDU, or None if there is none
+    :rtype: astropy.io.fits.hdu.base.ExtensionHDU
+    """
+    for hdu in hdul:
+        if hdu.header.get('EXTNAME') == 'SCI':
+            return hdu
+    return None
+
+
+def get_image_size(hdul):
+    """
+    Returns the largest image dimensions in any header of a FITS file. Only headers are read.
+
+    :param hdul: List of HDUs, as returned by ``open_fits``
+    :type hdul: astropy.io.fits.HDUList
+
+    :returns: Tuple of horizontal/vertical dimensions
+    :rtype: tuple
+    """
+    xsize = 0
+    ysize = 0
+    for hdu in hdul:
+        xsize = max(xsize, hdu.header.get('NAXIS1', 0))
+        ysize = max(ysize, hdu.header.get('NAXIS2', 0))
+    return (xsize, ysize)
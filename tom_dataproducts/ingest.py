@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from tom_dataproducts.data_processor import REDUCED_DATUM_BATCH_SIZE
+from tom_dataproducts.models import ReducedDatum
+
+
+def get_value_hash(value):
+    """
+    Returns the hash of the value of a ``ReducedDatum``, which is the same for equal values, whatever the order of
+    their keys.
+
+    :param value: Value of a ``ReducedDatum``
+    :type value: dict
+
+    :returns: Hexadecimal SHA-256 hash
+    :rtype: str
+    """
+    serialized_value = json.dumps(value, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return hashlib.sha256(serialized_value.encode()).hexdigest()
+
+
+def _get_existing_keys(target, source_name, data_type):
+    existing_data = ReducedDatum.objects.filter(
+        target=target, source_name=source_name, data_type=data_type, data_product__isnull=True
+    )
+    existing_keys = set(existing_data.exclude(value_hash='').values_list('timestamp', 'value_hash'))
+
+    # Data stored before hashes were added, or by other means than ingest_reduced_data, are hashed once here. Only the
+    # first of any duplicates gets a hash, which keeps the unique constraint satisfied.
+    unhashed_data = []
+    for datum in existing_data.filter(value_hash='').only('id', 'timestamp', 'value').order_by('id'):
+        key = (datum.timestamp, get_value_hash(datum.value))
+        if key not in existing_keys:
+            existing_keys.add(key)
+            datum.value_hash = key[1]
+            unhashed_data.append(datum)
+    ReducedDatum.objects.bulk_update(unhashed_data, ['value_hash'], batch_size=REDUCED_DATUM_BATCH_SIZE)
+    return existing_keys
+
+
+def ingest_reduced_data(target, source_name, data, data_type='photometry', source_location=''):
+    """
+    Stores the data of a target from a source, such as a broker, that are not already stored. The timestamps and value
+    hashes of the stored data of the target from the source are read in one query, and only the new data are inserted,
+    in batches, so that refreshing a light curve costs a few queries however many points it has.
+
+    :param target: The target of the data
+    :type target: Target
+
+    :param source_name: Name of the source, e.g. the name of the broker
+    :type source_name: str
+
+    :param data: Iterable of 2-tuples, each with a timestamp and the corresponding value
+    :type data: iterable
+
+    :param data_type: Data type of the data, defaults to photometry
+    :type data_type: str
+
+    :param source_location: Location of the data at the source, e.g. the URL of the alert
+    :type source_location: str
+
+    :returns: The created ``ReducedDatum`` objects
+    :rtype: list
+    """
+    with transaction.atomic():
+        existing_keys = _get_existing_keys(target, source_name, data_type)
+        new_data = []
+        for timestamp, value in data:
+            key = (timestamp, get_value_hash(value))
+            if key in existing_keys:
+                continue
+            existing_keys.add(key)
+            new_data.append(ReducedDatum(
+                target=target, source_name=source_name, source_location=source_location, data_type=data_type,
+                timestamp=timestamp, value=value, value_hash=key[1]
+            ))
+        # Conflicts only arise when the same data are ingested concurrently, and are then already stored
+        return ReducedDatum.objects.bulk_create(new_data, batch_size=REDUCED_DATUM_BATCH_SIZE, ignore_conflicts=True)
@@ -0,0 +1,60 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tom_dataproducts.models import ReducedDatum
+from tom_dataproducts.processors.data_serializers import SpectrumSerializer
+
+
+class Command(BaseCommand):
+    """
+    This management command converts spectroscopic ``ReducedDatum`` values that were stored with flux and wavelength as
+    lists of numbers to the binary encoding used by ``SpectrumSerializer``. List-encoded spectra remain readable, so
+    running it is optional, but converted spectra take several times less space and are faster to plot.
+
+    Example: ./manage.py convertspectra --batch_size 500
+    """
+
+    help = 'Converts list-encoded spectra to the binary spectrum encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=200,
+            help='Number of spectra to update per database query.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        converted = 0
+        failed = []
+        batch = []
+        datums = ReducedDatum.objects.filter(
+            data_type=settings.DATA_PRODUCT_TYPES['spectroscopy'][0]
+        ).only('id', 'value').order_by('id')
+        for datum in datums.iterator(chunk_size=batch_size):
+            value = datum.value
+            if not isinstance(value, dict) or value.get('encoding') == SpectrumSerializer.BINARY_ENCODING:
+                continue
+            try:
+                for key in ['flux', 'wavelength']:
+                    value[key], value[f'{key}_dtype'] = SpectrumSerializer.encode_array(
+                        np.asarray(value[key], dtype=float)
+                    )
+            except (KeyError, TypeError, ValueError):
+                failed.append(datum.id)
+                continue
+            value['encoding'] = SpectrumSerializer.BINARY_ENCODING
+            batch.append(datum)
+            if len(batch) >= batch_size:
+                ReducedDatum.objects.bulk_update(batch, ['value'])
+                converted += len(batch)
+                batch = []
+        if batch:
+            ReducedDatum.objects.bulk_update(batch, ['value'])
+            converted += len(batch)
+
+        if failed:
+            return f'Converted {converted} spectra. Could not convert ReducedDatums: {failed}'
+        return f'Converted {converted} spectra.'
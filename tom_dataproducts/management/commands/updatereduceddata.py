@@ -1,46 +1,149 @@
-from requests.exceptions import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import threading
+import time
+
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections
+from django.utils import timezone
 
 from tom_alerts import alerts
 from tom_targets.models import Target
-from tom_dataproducts.models import ReducedDatum
+from tom_dataproducts.models import DataSourceRefresh, ReducedDatum
+
+logger = logging.getLogger(__name__)
+
+
+class BrokerLimiter:
+    """
+    Limits the number of simultaneous updates from a broker, and the rate at which they start.
+    """
+
+    def __init__(self, concurrency, rate=None):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_start = 0
+
+    @contextmanager
+    def limit(self):
+        with self.semaphore:
+            if self.interval:
+                with self.lock:
+                    now = time.monotonic()
+                    wait = self.next_start - now
+                    self.next_start = max(now, self.next_start) + self.interval
+                if wait > 0:
+                    time.sleep(wait)
+            yield
 
 
 class Command(BaseCommand):
+    """
+    Gets new time-series data for alert-generated targets from the brokers that their data came from. Each target is
+    only updated from the brokers that it already has data from. With ``--workers``, targets are updated in parallel,
+    while ``--broker_concurrency`` and ``--broker_rate`` limit the load on each broker. With ``--stale_after``, only
+    targets that have not been updated from a broker recently are updated, so that the command can be run frequently
+    as a cron job.
+
+    Example: ./manage.py updatereduceddata --workers 8 --broker_rate 2 --stale_after 12
+    """
+
     help = 'Gets and updates time-series data for alert-generated targets from the original alert source.'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--target_id',
+            help='Update only this target, however recently it was updated.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of updates to run at once.'
+        )
+        parser.add_argument(
+            '--broker_concurrency',
+            type=int,
+            default=2,
+            help='Maximum number of updates to run at once from any one broker.'
+        )
+        parser.add_argument(
+            '--broker_rate',
+            type=float,
+            help='Maximum number of updates per second to start from any one broker. Unlimited by default.'
+        )
+        parser.add_argument(
+            '--stale_after',
+            type=float,
+            help='Only update targets that have not been updated from a broker for this many hours.'
         )
 
-    def handle(self, *args, **options):
-        brokers = alerts.get_service_classes()
-        broker_classes = {}
-        for broker in brokers:
-            broker_classes[broker] = alerts.get_service_class(broker)()
-
-        target = None
+    def get_updates(self, broker_names, options):
+        """
+        Returns the pairs of target and broker name to update, which are the brokers that the data of each target came
+        from.
+        """
+        sources = ReducedDatum.objects.filter(source_name__in=broker_names)
         if options['target_id']:
             try:
-                targets = [Target.objects.get(pk=options['target_id'])]
+                target = Target.objects.get(pk=options['target_id'])
             except ObjectDoesNotExist:
                 raise Exception('Invalid target id provided')
+            sources = sources.filter(target=target)
+        sources = set(sources.values_list('target_id', 'source_name').distinct())
+
+        if options['stale_after'] is not None and not options['target_id']:
+            cutoff = timezone.now() - timedelta(hours=options['stale_after'])
+            recent_refreshes = DataSourceRefresh.objects.filter(source_name__in=broker_names, refreshed__gt=cutoff)
+            sources -= set(recent_refreshes.values_list('target_id', 'source_name'))
+
+        targets = Target.objects.in_bulk({target_id for target_id, _ in sources})
+        return sorted(((targets[target_id], source_name) for target_id, source_name in sources),
+                      key=lambda update: (update[0].id, update[1]))
+
+    def update(self, broker, target, limiter):
+        """
+        Updates the data of a target from a broker, and returns the error that the update raised, if any.
+        """
+        try:
+            with limiter.limit():
+                broker.process_reduced_data(target)
+        except Exception as e:
+            logger.warning('Unable to update the data of %s from %s: %s', target, broker.name, e)
+            return e
+        finally:
+            # Connections of worker threads are not closed by Django
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+        return None
+
+    def handle(self, *args, **options):
+        # Updates are recorded as of the start of the run, so that a cron job with the same interval as --stale_after
+        # updates every target on every run
+        started = timezone.now()
+        brokers = {name: alerts.get_service_class(name)() for name in alerts.get_service_classes()}
+        limiters = {name: BrokerLimiter(options['broker_concurrency'], options['broker_rate']) for name in brokers}
+        updates = self.get_updates(brokers.keys(), options)
+
+        arguments = [(brokers[broker_name], target, limiters[broker_name]) for target, broker_name in updates]
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                errors = list(executor.map(lambda update_arguments: self.update(*update_arguments), arguments))
         else:
-            sources = ReducedDatum.objects.filter(source_name__in=broker_classes.keys()).distinct()
-            targets = Target.objects.filter(
-                id__in=ReducedDatum.objects.filter(
-                    source_name__in=sources
-                ).values_list('target').distinct())
+            errors = [self.update(*update_arguments) for update_arguments in arguments]
 
         failed_records = {}
-        for target in targets:
-            for class_name, clazz in broker_classes.items():
-                try:
-                    clazz.process_reduced_data(target)
-                except HTTPError:
-                    failed_records[class_name] = target.id
+        for (target, broker_name), error in zip(updates, errors):
+            if error:
+                failed_records.setdefault(broker_name, []).append(target.id)
+            else:
+                DataSourceRefresh.objects.update_or_create(
+                    target=target, source_name=broker_name, defaults={'refreshed': started}
+                )
 
         if len(failed_records) == 0:
             return 'Update completed successfully'
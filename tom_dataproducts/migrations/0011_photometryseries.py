@@ -0,0 +1,32 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0020_target_sky_pixel'),
+        ('tom_dataproducts', '0010_manual_20210305_fix_spectroscopy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotometrySeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filter', models.CharField(blank=True, default='', max_length=100)),
+                ('timestamp', models.BinaryField()),
+                ('magnitude', models.BinaryField()),
+                ('error', models.BinaryField()),
+                ('limit', models.BinaryField()),
+                ('datum_count', models.IntegerField()),
+                ('last_datum_id', models.IntegerField(null=True)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tom_targets.target')),
+            ],
+            options={
+                'unique_together': {('target', 'filter')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_dataproducts', '0011_photometryseries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataproduct',
+            name='thumbnail_checksum',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='dataproduct',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
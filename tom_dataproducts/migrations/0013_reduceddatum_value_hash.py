@@ -0,0 +1,22 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_dataproducts', '0012_dataproduct_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reduceddatum',
+            name='value_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='reduceddatum',
+            constraint=models.UniqueConstraint(condition=models.Q(('data_product__isnull', True), models.Q(('value_hash', ''), _negated=True)), fields=('target', 'data_type', 'source_name', 'timestamp', 'value_hash'), name='tom_dataproducts_unique_source_datum'),
+        ),
+    ]
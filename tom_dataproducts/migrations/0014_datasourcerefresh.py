@@ -0,0 +1,27 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0020_target_sky_pixel'),
+        ('tom_dataproducts', '0013_reduceddatum_value_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSourceRefresh',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(max_length=100)),
+                ('refreshed', models.DateTimeField()),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tom_targets.target')),
+            ],
+            options={
+                'unique_together': {('target', 'source_name')},
+            },
+        ),
+    ]
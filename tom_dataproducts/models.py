@@ -1,9 +1,10 @@
 from datetime import datetime
+import hashlib
 import logging
 import os
 import tempfile
 
-from astropy.io import fits
+import numpy as np
 from django.conf import settings
 from django.core.files import File
 from django.db import models
@@ -11,6 +12,9 @@ from django.core.exceptions import ValidationError
 from fits2image.conversions import fits_to_jpg
 from PIL import Image
 
+from tom_common.jobs import enqueue
+from tom_common.models import Job
+from tom_dataproducts.fits_files import get_image_size, get_science_hdu, open_fits
 from tom_targets.models import Target
 from tom_observations.models import ObservationRecord
 
@@ -22,6 +26,37 @@ except AttributeError:
     THUMBNAIL_DEFAULT_SIZE = (200, 200)
 
 
+def get_thumbnail_sizes():
+    """
+    Returns the named thumbnail sizes, which are ``THUMBNAIL_SIZES`` in settings and a ``default`` size of
+    ``THUMBNAIL_DEFAULT_SIZE``.
+
+    :returns: Dictionary of size names to (width, height) tuples
+    :rtype: dict
+    """
+    return {'default': THUMBNAIL_DEFAULT_SIZE, **getattr(settings, 'THUMBNAIL_SIZES', {})}
+
+
+def get_thumbnail_size(size):
+    """
+    Resolves a thumbnail size to a size name and dimensions. Sizes that are not named in ``THUMBNAIL_SIZES`` are named
+    after their dimensions.
+
+    :param size: Name of a size in ``THUMBNAIL_SIZES``, or a (width, height) tuple
+    :type size: str or tuple
+
+    :returns: Tuple of the size name and a (width, height) tuple
+    :rtype: tuple
+    """
+    sizes = get_thumbnail_sizes()
+    if isinstance(size, str):
+        return size, tuple(sizes[size])
+    for name, dimensions in sizes.items():
+        if tuple(dimensions) == tuple(size):
+            return name, tuple(dimensions)
+    return '{0}x{1}'.format(*size), tuple(size)
+
+
 def find_fits_img_size(filename):
     """
     Returns the size of a FITS image, given a valid FITS image file
@@ -36,16 +71,8 @@ def find_fits_img_size(filename):
     try:
         return settings.THUMBNAIL_MAX_SIZE
     except AttributeError:
-        hdul = fits.open(filename)
-        xsize = 0
-        ysize = 0
-        for hdu in hdul:
-            try:
-                xsize = max(xsize, hdu.header['NAXIS1'])
-                ysize = max(ysize, hdu.header['NAXIS2'])
-            except KeyError:
-                pass
-        return (xsize, ysize)
+        with open_fits(filename) as hdul:
+            return get_image_size(hdul)
 
 
 def is_fits_image_file(file):
@@ -59,15 +86,11 @@ def is_fits_image_file(file):
     :rtype: boolean
     """
 
-    with file.open() as f:
-        try:
-            hdul = fits.open(f)
-        except OSError:  # OSError is raised if file is not FITS format
-            return False
-        for hdu in hdul:
-            if hdu.header.get('EXTNAME') == 'SCI':
-                return True
-    return False
+    try:
+        with open_fits(file) as hdul:
+            return get_science_hdu(hdul) is not None
+    except OSError:  # OSError is raised if file is not FITS format
+        return False
 
 
 def data_product_path(instance, filename):
@@ -156,6 +179,13 @@ class DataProduct(models.Model):
 
     :param thumbnail: The thumbnail file associated with this object. Only generated for FITS image files.
     :type thumbnail: FileField
+
+    :param thumbnails: The thumbnails of this object by size name, with the storage name, the requested size and the
+        actual width and height of each. A size name maps to None if no thumbnail could be created.
+    :type thumbnails: dict
+
+    :param thumbnail_checksum: The MD5 checksum of the data file from which the thumbnails were created.
+    :type thumbnail_checksum: str
     """
 
     FITS_EXTENSIONS = {
@@ -179,6 +209,8 @@ class DataProduct(models.Model):
     data_product_type = models.CharField(max_length=50, blank=True, default='')
     featured = models.BooleanField(default=False)
     thumbnail = models.FileField(upload_to=data_product_path, null=True, default=None)
+    thumbnails = models.JSONField(default=dict, blank=True)
+    thumbnail_checksum = models.CharField(max_length=32, blank=True, default='')
 
     class Meta:
         ordering = ('-created',)
@@ -220,34 +252,135 @@ class DataProduct(models.Model):
         """
         return os.path.splitext(self.data.name)[1]
 
+    def get_thumbnail(self, size='default'):
+        """
+        Returns the stored details of a thumbnail of this data product, without opening any file.
+
+        :param size: Name of a size in ``THUMBNAIL_SIZES``, or a (width, height) tuple
+        :type size: str or tuple
+
+        :returns: Tuple of whether the thumbnail is up to date with the requested size, and a dictionary with the
+            storage ``name``, requested ``size`` and actual ``width`` and ``height`` of the thumbnail, or None if no
+            thumbnail could be created
+        :rtype: tuple
+        """
+        name, dimensions = get_thumbnail_size(size)
+        thumbnail = self.thumbnails.get(name)
+        up_to_date = name in self.thumbnails and (thumbnail is None or thumbnail['size'] == list(dimensions))
+        return up_to_date, thumbnail
+
     def get_preview(self, size=THUMBNAIL_DEFAULT_SIZE, redraw=False):
         """
-        Returns path to the thumbnail of this data product, and creates a thumbnail if none exists
+        Returns path to the thumbnail of this data product, and creates the thumbnails of all ``THUMBNAIL_SIZES`` if
+        it does not exist. Existing thumbnails are found from their stored dimensions, without opening any file.
 
        :Keyword Arguments:
-            * size (`tuple`): Desired size of the thumbnail, as a 2-tuple of ints for width/height
+            * size (`str` or `tuple`): Name of a size in ``THUMBNAIL_SIZES``, or a 2-tuple of ints for width/height
             * redraw (`boolean`): True if the thumbnail will be recreated despite existing, False otherwise
 
         :returns: Path to the thumbnail image
         :rtype: str
         """
-        if self.thumbnail:
-            im = Image.open(self.thumbnail)
-            if im.size != THUMBNAIL_DEFAULT_SIZE:
-                redraw = True
-
-        if not self.thumbnail or redraw:
-            width, height = THUMBNAIL_DEFAULT_SIZE
-            tmpfile = self.create_thumbnail(width=width, height=height)
-            if tmpfile:
-                outfile_name = os.path.basename(self.data.file.name)
-                filename = outfile_name.split(".")[0] + "_tb.jpg"
-                with open(tmpfile.name, 'rb') as f:
-                    self.thumbnail.save(filename, File(f), save=True)
-                    self.save()
-        if not self.thumbnail:
+        up_to_date, thumbnail = self.get_thumbnail(size)
+        if redraw or not up_to_date:
+            name, dimensions = get_thumbnail_size(size)
+            self.create_thumbnails(sizes={**get_thumbnail_sizes(), name: dimensions}, redraw=redraw)
+            _, thumbnail = self.get_thumbnail(size)
+        if not thumbnail:
+            return None
+        return self.thumbnail.storage.url(thumbnail['name'])
+
+    def get_preview_url(self, size='default'):
+        """
+        Returns the URL of a thumbnail of this data product without waiting for it to be created. If there is no
+        thumbnail, a job to create it is enqueued, and the thumbnail is shown once the job has run.
+
+        :param size: Name of a size in ``THUMBNAIL_SIZES``
+        :type size: str
+
+        :returns: URL of the thumbnail image, or None if there is no thumbnail yet
+        :rtype: str
+        """
+        up_to_date, thumbnail = self.get_thumbnail(size)
+        if not up_to_date:
+            job = enqueue('tom_dataproducts.tasks.create_thumbnail', args=[self.id],
+                          description=f'Create thumbnail of {self}', unique=True)
+            if job.status not in (Job.SUCCEEDED, Job.FAILED):
+                return None
+            # With the immediate job backend the thumbnail has just been created, or recorded as not created
+            self.refresh_from_db(fields=['thumbnail', 'thumbnails', 'thumbnail_checksum'])
+            _, thumbnail = self.get_thumbnail(size)
+        if not thumbnail:
             return None
-        return self.thumbnail.url
+        return self.thumbnail.storage.url(thumbnail['name'])
+
+    def get_data_checksum(self):
+        """
+        Computes the MD5 checksum of the file of this data product.
+
+        :returns: Hexadecimal checksum
+        :rtype: str
+        """
+        checksum = hashlib.md5()
+        with self.data.open('rb') as f:
+            for chunk in f.chunks():
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def create_thumbnails(self, sizes=None, redraw=False):
+        """
+        Creates the thumbnails of this data product in several sizes, if it is a valid FITS image file, and stores
+        their dimensions along with the checksum of the data file. Thumbnails that already exist in the requested size
+        are only recreated if the data file has changed since, or if ``redraw`` is True.
+
+        :Keyword Arguments:
+            * sizes (`dict`): Dictionary of size names to (width, height) tuples, defaults to ``THUMBNAIL_SIZES``
+            * redraw (`boolean`): True if the thumbnails will be recreated despite existing, False otherwise
+
+        :returns: Dictionary of thumbnails by size name, in the format of ``thumbnails``
+        :rtype: dict
+        """
+        sizes = sizes or get_thumbnail_sizes()
+        checksum = self.get_data_checksum()
+        source_changed = checksum != self.thumbnail_checksum
+        thumbnails = {} if source_changed else dict(self.thumbnails)
+        missing_sizes = {
+            name: dimensions for name, dimensions in sizes.items()
+            if redraw or name not in thumbnails or (thumbnails[name] and thumbnails[name]['size'] != list(dimensions))
+        }
+        if not missing_sizes and not source_changed:
+            return thumbnails
+
+        # Thumbnails that are replaced, or that were created from a previous version of the data file, are deleted
+        for name, thumbnail in self.thumbnails.items():
+            if thumbnail and (source_changed or name in missing_sizes):
+                self.thumbnail.storage.delete(thumbnail['name'])
+        if self.thumbnail and not self.thumbnails.get('default') and 'default' in missing_sizes:
+            # Thumbnail created before thumbnail sizes were stored
+            self.thumbnail.storage.delete(self.thumbnail.name)
+
+        is_image = is_fits_image_file(self.data.file)
+        basename = os.path.basename(self.data.name).split('.')[0]
+        for name, (width, height) in missing_sizes.items():
+            tmpfile = self._render_thumbnail(width, height) if is_image else None
+            if not tmpfile:
+                thumbnails[name] = None
+                continue
+            filename = f'{basename}_tb.jpg' if name == 'default' else f'{basename}_{name}_tb.jpg'
+            with open(tmpfile.name, 'rb') as f:
+                stored_name = self.thumbnail.storage.save(data_product_path(self, filename), File(f))
+            with Image.open(tmpfile.name) as im:
+                actual_width, actual_height = im.size
+            tmpfile.close()
+            thumbnails[name] = {'name': stored_name, 'size': [width, height], 'width': actual_width,
+                                'height': actual_height}
+
+        self.thumbnails = thumbnails
+        self.thumbnail_checksum = checksum
+        if 'default' in thumbnails:
+            self.thumbnail = thumbnails['default']['name'] if thumbnails['default'] else None
+        self.save()
+        return thumbnails
 
     def create_thumbnail(self, width=None, height=None):
         """
@@ -262,15 +395,20 @@ class DataProduct(models.Model):
         :rtype: file
         """
         if is_fits_image_file(self.data.file):
-            tmpfile = tempfile.NamedTemporaryFile(suffix='.jpg')
-            try:
-                if not width or not height:
-                    width, height = find_fits_img_size(self.data.file)
-                resp = fits_to_jpg(self.data.file, tmpfile.name, width=width, height=height)
-                if resp:
-                    return tmpfile
-            except Exception as e:
-                logger.warn(f'Unable to create thumbnail for {self}: {e}')
+            return self._render_thumbnail(width, height)
+        return
+
+    def _render_thumbnail(self, width=None, height=None):
+        tmpfile = tempfile.NamedTemporaryFile(suffix='.jpg')
+        try:
+            if not width or not height:
+                width, height = find_fits_img_size(self.data.file)
+            resp = fits_to_jpg(self.data.file, tmpfile.name, width=width, height=height)
+            if resp:
+                return tmpfile
+        except Exception as e:
+            logger.warn(f'Unable to create thumbnail for {self}: {e}')
+        tmpfile.close()
         return
 
 
@@ -322,6 +460,10 @@ class ReducedDatum(models.Model):
                     }
     :type value: dict
 
+    :param value_hash: Hash of the value of a datum ingested from a source such as a broker, with which the datum is
+                       deduplicated by ``tom_dataproducts.ingest.ingest_reduced_data``. Empty for other data.
+    :type value_hash: str
+
     """
 
     target = models.ForeignKey(Target, null=False, on_delete=models.CASCADE)
@@ -334,9 +476,18 @@ class ReducedDatum(models.Model):
     source_location = models.CharField(max_length=200, default='')
     timestamp = models.DateTimeField(null=False, blank=False, default=datetime.now, db_index=True)
     value = models.JSONField(null=False, blank=False)
+    value_hash = models.CharField(max_length=64, default='', blank=True)
 
     class Meta:
         get_latest_by = ('timestamp',)
+        constraints = [
+            # A datum from a source is only stored once, however many times the source is ingested
+            models.UniqueConstraint(
+                fields=['target', 'data_type', 'source_name', 'timestamp', 'value_hash'],
+                condition=models.Q(data_product__isnull=True) & ~models.Q(value_hash=''),
+                name='tom_dataproducts_unique_source_datum'
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         for _, dp_values in settings.DATA_PRODUCT_TYPES.items():
@@ -344,4 +495,95 @@ class ReducedDatum(models.Model):
                 break
         else:
             raise ValidationError('Not a valid DataProduct type.')
+        if self.pk:
+            from tom_dataproducts.photometry_series import invalidate_photometry_version
+            # New data is detected by PhotometrySeries itself, but changes to existing data are not
+            PhotometrySeries.objects.filter(target_id=self.target_id).delete()
+            invalidate_photometry_version(self.target_id)
         return super().save()
+
+
+class PhotometrySeries(models.Model):
+    """
+    Class representing the photometry of a target in one filter, stored as arrays rather than one ``ReducedDatum`` per
+    point. A ``PhotometrySeries`` is a read-only, columnar copy of the photometric ``ReducedDatum`` objects of a target,
+    which remain the source of truth, and is rebuilt automatically when they change. See
+    ``tom_dataproducts.photometry_series``.
+
+    :param target: The ``Target`` with which this object is associated.
+
+    :param filter: The filter of the photometry in this series.
+    :type filter: str
+
+    :param timestamp: Bytes of an int64 array of the timestamps of each point, in microseconds since the Unix epoch.
+    :type timestamp: bytes
+
+    :param magnitude: Bytes of a float64 array of the magnitude of each point, NaN if the point has none.
+    :type magnitude: bytes
+
+    :param error: Bytes of a float64 array of the magnitude error of each point, NaN if the point has none.
+    :type error: bytes
+
+    :param limit: Bytes of a float64 array of the limiting magnitude of each point, NaN if the point has none.
+    :type limit: bytes
+
+    :param datum_count: The number of photometric ``ReducedDatum`` objects of the target when this series was built.
+    :type datum_count: int
+
+    :param last_datum_id: The largest id of the photometric ``ReducedDatum`` objects of the target when this series was
+                          built.
+    :type last_datum_id: int
+    """
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
+    filter = models.CharField(max_length=100, blank=True, default='')
+    timestamp = models.BinaryField()
+    magnitude = models.BinaryField()
+    error = models.BinaryField()
+    limit = models.BinaryField()
+    datum_count = models.IntegerField()
+    last_datum_id = models.IntegerField(null=True)
+
+    class Meta:
+        unique_together = ['target', 'filter']
+
+    def __str__(self):
+        return f'{self.target} {self.filter}'
+
+    def as_arrays(self):
+        """
+        Returns the arrays of this series without copying the stored buffers.
+
+        :returns: Dictionary with ``time`` as a ``datetime64[us]`` array and ``magnitude``, ``error`` and ``limit`` as
+                  float64 arrays
+        :rtype: dict
+        """
+        return {
+            'time': np.frombuffer(self.timestamp, dtype='datetime64[us]'),
+            'magnitude': np.frombuffer(self.magnitude, dtype=np.float64),
+            'error': np.frombuffer(self.error, dtype=np.float64),
+            'limit': np.frombuffer(self.limit, dtype=np.float64),
+        }
+
+
+class DataSourceRefresh(models.Model):
+    """
+    Class representing when the data of a target were last fetched from a source, such as a broker, by the
+    ``updatereduceddata`` management command, so that targets that were refreshed recently can be skipped.
+
+    :param target: The ``Target`` with which this object is associated.
+
+    :param source_name: The name of the source, matching the ``source_name`` of the ``ReducedDatum`` objects from it.
+    :type source_name: str
+
+    :param refreshed: The time at which the data were last fetched successfully.
+    :type refreshed: datetime
+    """
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
+    source_name = models.CharField(max_length=100)
+    refreshed = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['target', 'source_name']
+
+    def __str__(self):
+        return f'{self.target} {self.source_name}'
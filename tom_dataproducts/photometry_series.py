@@ -0,0 +1,186 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from math import nan
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from tom_dataproducts.models import PhotometrySeries, ReducedDatum
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+PHOTOMETRY_VERSION_KEY = 'tom_dataproducts_photometry_version_{target_id}'
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return nan
+
+
+def photometry_arrays_from_values(rows):
+    """
+    Groups photometry points by filter into arrays, in order of increasing time.
+
+    :param rows: Iterable of ``(timestamp, value)`` tuples, where ``value`` is the ``value`` of a photometric
+                 ``ReducedDatum``
+    :type rows: iterable
+
+    :returns: Dictionary of filter name to a dictionary of ``time``, ``magnitude``, ``error`` and ``limit`` arrays
+    :rtype: dict
+    """
+    columns = {}
+    for timestamp, value in rows:
+        filter_columns = columns.setdefault(value.get('filter', ''), ([], [], [], []))
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        filter_columns[0].append((timestamp - EPOCH) // MICROSECOND)
+        filter_columns[1].append(_to_float(value.get('magnitude')))
+        filter_columns[2].append(_to_float(value.get('error')))
+        filter_columns[3].append(_to_float(value.get('limit')))
+
+    photometry = {}
+    for filter_name, (timestamps, magnitudes, errors, limits) in columns.items():
+        timestamps = np.array(timestamps, dtype=np.int64)
+        order = np.argsort(timestamps, kind='stable')
+        photometry[filter_name] = {
+            'time': timestamps[order].view('datetime64[us]'),
+            'magnitude': np.array(magnitudes, dtype=np.float64)[order],
+            'error': np.array(errors, dtype=np.float64)[order],
+            'limit': np.array(limits, dtype=np.float64)[order],
+        }
+    return photometry
+
+
+def _photometry_for_target(target):
+    return ReducedDatum.objects.filter(target=target, data_type=settings.DATA_PRODUCT_TYPES['photometry'][0])
+
+
+@transaction.atomic
+def rebuild_photometry_series(target):
+    """
+    Rebuilds the ``PhotometrySeries`` of a target from its photometric ``ReducedDatum`` objects, reading only their
+    timestamps and values rather than full model instances.
+
+    :param target: The ``Target`` to rebuild the photometry of
+    :type target: Target
+
+    :returns: Dictionary of filter name to photometry arrays, as returned by ``photometry_arrays_from_values``
+    :rtype: dict
+    """
+    datums = _photometry_for_target(target)
+    fingerprint = datums.aggregate(datum_count=Count('id'), last_datum_id=Max('id'))
+    photometry = photometry_arrays_from_values(datums.values_list('timestamp', 'value').iterator())
+
+    PhotometrySeries.objects.filter(target=target).delete()
+    PhotometrySeries.objects.bulk_create([
+        PhotometrySeries(
+            target=target,
+            filter=filter_name,
+            timestamp=arrays['time'].view(np.int64).tobytes(),
+            magnitude=arrays['magnitude'].tobytes(),
+            error=arrays['error'].tobytes(),
+            limit=arrays['limit'].tobytes(),
+            **fingerprint
+        ) for filter_name, arrays in photometry.items()
+    ], ignore_conflicts=True)  # Another request may have rebuilt the same series concurrently
+    return photometry
+
+
+def get_photometry_arrays(target):
+    """
+    Returns the photometry of a target as NumPy arrays per filter. The arrays are read from the stored
+    ``PhotometrySeries`` of the target, which are rebuilt first if photometric ``ReducedDatum`` objects have been added
+    or removed since they were built. This takes two queries and deserializes no per-point JSON when the series are up
+    to date.
+
+    Because the arrays hold all photometry of the target, they should not be used when ``ReducedDatum`` objects are
+    subject to row-level permissions, i.e. when ``TARGET_PERMISSIONS_ONLY`` is ``False``.
+
+    :param target: The ``Target`` to get the photometry of
+    :type target: Target
+
+    :returns: Dictionary of filter name to a dictionary of ``time``, ``magnitude``, ``error`` and ``limit`` arrays
+    :rtype: dict
+    """
+    fingerprint = _photometry_for_target(target).aggregate(datum_count=Count('id'), last_datum_id=Max('id'))
+    series = list(PhotometrySeries.objects.filter(target=target))
+    if fingerprint['datum_count'] == 0:
+        if series:
+            PhotometrySeries.objects.filter(target=target).delete()
+        return {}
+    if not series or any(
+        (s.datum_count, s.last_datum_id) != (fingerprint['datum_count'], fingerprint['last_datum_id']) for s in series
+    ):
+        return rebuild_photometry_series(target)
+    return {s.filter: s.as_arrays() for s in series}
+
+
+def get_photometry_version(target_id):
+    """
+    Returns an identifier that changes whenever existing photometry of a target is modified. Together with the count
+    and greatest id of the photometric ``ReducedDatum`` objects of the target, which change when photometry is added or
+    removed, it identifies the state of the photometry for caching.
+
+    :param target_id: The id of the ``Target``
+    :type target_id: int
+
+    :returns: photometry version of the target
+    :rtype: str
+    """
+    key = PHOTOMETRY_VERSION_KEY.format(target_id=target_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_photometry_version(target_id):
+    """
+    Marks anything cached from the photometry of a target as stale.
+
+    :param target_id: The id of the ``Target``
+    :type target_id: int
+    """
+    cache.set(PHOTOMETRY_VERSION_KEY.format(target_id=target_id), uuid.uuid4().hex, None)
+
+
+def downsample_extremes(times, values, max_points):
+    """
+    Selects at most ``max_points`` points of a time series for plotting. The time range is divided into
+    ``max_points // 2`` bins of equal duration, and the points with the smallest and greatest value in each bin are
+    kept, so that outbursts and dips survive downsampling. Series that are already small enough are not downsampled.
+
+    :param times: Times of the points, in increasing order
+    :type times: numpy.ndarray
+
+    :param values: Values of the points, none of which may be NaN
+    :type values: numpy.ndarray
+
+    :param max_points: Maximum number of points to select
+    :type max_points: int
+
+    :returns: Sorted indices of the selected points
+    :rtype: numpy.ndarray
+    """
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    bin_count = max(max_points // 2, 1)
+    times = np.asarray(times).astype(np.int64).astype(np.float64)
+    span = times[-1] - times[0]
+    if span > 0:
+        bins = np.minimum(((times - times[0]) / span * bin_count).astype(np.int64), bin_count - 1)
+    else:
+        bins = np.arange(count) * bin_count // count
+    # Within each bin, points are ordered by value, so the first and last points of a bin are its extremes
+    order = np.lexsort((values, bins))
+    starts = np.flatnonzero(np.diff(bins, prepend=-1))
+    ends = np.append(starts[1:], count) - 1
+    return np.union1d(order[starts], order[ends])
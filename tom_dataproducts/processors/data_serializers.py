@@ -1,14 +1,44 @@
+import base64
+
+import numpy as np
 from specutils import Spectrum1D
 from astropy.units import Quantity
 
 
 class SpectrumSerializer():
 
+    BINARY_ENCODING = 'base64'
+
+    def __init__(self, binary=True):
+        """
+        :param binary: Whether to serialize flux and wavelength as base64-encoded binary buffers, rather than as lists
+                       of numbers
+        :type binary: bool
+        """
+        self.binary = binary
+
+    @staticmethod
+    def encode_array(array):
+        # Buffers are stored little-endian so that they can be decoded without knowing the byte order of the source
+        array = np.ascontiguousarray(array)
+        dtype = np.dtype('<f4') if array.dtype == np.float32 else np.dtype('<f8')
+        return base64.b64encode(array.astype(dtype, copy=False).tobytes()).decode('ascii'), dtype.str
+
+    @staticmethod
+    def decode_array(spectrum, key):
+        if spectrum.get('encoding') == SpectrumSerializer.BINARY_ENCODING:
+            return np.frombuffer(base64.b64decode(spectrum[key]), dtype=spectrum[f'{key}_dtype'])
+        return spectrum[key]
+
     def serialize(self, spectrum: Spectrum1D) -> dict:
         """
         Serializes a Spectrum1D in order to store in a ReducedDatum object. The serialization stores only what's
         necessary to rebuild the Spectrum1D--namely, flux and wavelength, and their respective units.
 
+        Unless the serializer was created with ``binary=False``, flux and wavelength are stored as base64-encoded
+        little-endian buffers, with their dtypes under ``flux_dtype`` and ``wavelength_dtype``, and ``encoding`` set to
+        ``base64``. This is several times more compact than lists of numbers.
+
         :param spectrum: Spectrum1D to be serialized
         :type spectrum: specutils.Spectrum1D
 
@@ -16,15 +46,21 @@ class SpectrumSerializer():
         :rtype: dict
         """
         serialized = {}
-        serialized['flux'] = spectrum.flux.value.tolist()
+        if self.binary:
+            serialized['encoding'] = self.BINARY_ENCODING
+            serialized['flux'], serialized['flux_dtype'] = self.encode_array(spectrum.flux.value)
+            serialized['wavelength'], serialized['wavelength_dtype'] = self.encode_array(spectrum.wavelength.value)
+        else:
+            serialized['flux'] = spectrum.flux.value.tolist()
+            serialized['wavelength'] = spectrum.wavelength.value.tolist()
         serialized['flux_units'] = spectrum.flux.unit.to_string()
-        serialized['wavelength'] = spectrum.wavelength.value.tolist()
         serialized['wavelength_units'] = spectrum.wavelength.unit.to_string()
         return serialized
 
     def deserialize(self, spectrum: dict) -> Spectrum1D:
         """
-        Constructs a Spectrum1D from the spectrum value stored in a ReducedDatum
+        Constructs a Spectrum1D from the spectrum value stored in a ReducedDatum. Both binary and list encodings are
+        supported. Binary buffers are decoded with ``np.frombuffer``, without copying them.
 
         :param spectrum: JSON representation used to construct the Spectrum1D
         :type spectrum: dict
@@ -32,7 +68,8 @@ class SpectrumSerializer():
         :returns: Spectrum1D representing the spectrum information
         :rtype: specutil.Spectrum1D
         """
-        flux = Quantity(value=spectrum['flux'], unit=spectrum['flux_units'])
-        wavelength = Quantity(value=spectrum['wavelength'], unit=spectrum['wavelength_units'])
+        flux = Quantity(value=self.decode_array(spectrum, 'flux'), unit=spectrum['flux_units'], copy=False)
+        wavelength = Quantity(value=self.decode_array(spectrum, 'wavelength'), unit=spectrum['wavelength_units'],
+                              copy=False)
         spectrum = Spectrum1D(flux=flux, spectral_axis=wavelength)
         return spectrum
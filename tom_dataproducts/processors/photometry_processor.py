@@ -1,5 +1,6 @@
 import mimetypes
 
+import numpy as np
 from astropy import units
 from astropy.io import ascii
 from astropy.time import Time, TimezoneInfo
@@ -43,22 +44,17 @@ class PhotometryProcessor(DataProcessor):
         :rtype: list
         """
 
-        photometry = []
-
         data = ascii.read(data_product.data.path)
         if len(data) < 1:
             raise InvalidFileFormatException('Empty table or invalid file type')
 
-        for datum in data:
-            time = Time(float(datum['time']), format='mjd')
-            utc = TimezoneInfo(utc_offset=0*units.hour)
-            time.format = 'datetime'
-            value = {
-                'timestamp': time.to_datetime(timezone=utc),
-                'magnitude': datum['magnitude'],
-                'filter': datum['filter'],
-                'error': datum['error']
-            }
-            photometry.append(value)
+        # Convert whole columns at once, as building a Time per row dominates the cost of ingesting large light curves
+        utc = TimezoneInfo(utc_offset=0*units.hour)
+        timestamps = Time(np.asarray(data['time'], dtype=float), format='mjd').to_datetime(timezone=utc)
 
-        return photometry
+        return [
+            {'timestamp': timestamp, 'magnitude': magnitude, 'filter': filter_name, 'error': error}
+            for timestamp, magnitude, filter_name, error in zip(
+                timestamps.tolist(), data['magnitude'].tolist(), data['filter'].tolist(), data['error'].tolist()
+            )
+        ]
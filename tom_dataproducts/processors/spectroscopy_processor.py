@@ -4,15 +4,16 @@ import numpy as np
 from datetime import datetime
 
 from astropy import units
-from astropy.io import fits, ascii
+from astropy.io import ascii
 from astropy.time import Time
 from astropy.wcs import WCS
 from specutils import Spectrum1D
 
 from tom_dataproducts.data_processor import DataProcessor
 from tom_dataproducts.exceptions import InvalidFileFormatException
+from tom_dataproducts.fits_files import get_data_hdu, open_fits
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
-from tom_observations.facility import get_service_class, get_service_classes
+from tom_observations.facility import get_fits_facility, get_service_class
 
 
 class SpectroscopyProcessor(DataProcessor):
@@ -62,23 +63,25 @@ class SpectroscopyProcessor(DataProcessor):
         :rtype: AstroPy.Time
         """
 
-        flux, header = fits.getdata(data_product.data.path, header=True)
-
-        for facility_class in get_service_classes():
-            facility = get_service_class(facility_class)()
-            if facility.is_fits_facility(header):
-                flux_constant = facility.get_flux_constant()
-                date_obs = facility.get_date_obs_from_fits_header(header)
-                break
+        with open_fits(data_product.data) as hdul:
+            hdu = get_data_hdu(hdul)
+            header = hdu.header.copy()
+            # Only the first spectrum of multi-dimensional data is read from the memory-mapped file
+            if header['NAXIS'] == 3:
+                flux = hdu.section[0, 0, :]
+            elif header['NAXIS'] == 2 and header['NAXIS2'] == 2:
+                flux = hdu.section[0, :]
+            else:
+                flux = np.array(hdu.data)
+
+        facility = get_fits_facility(header)
+        if facility:
+            flux_constant = facility.get_flux_constant()
+            date_obs = facility.get_date_obs_from_fits_header(header)
         else:
             flux_constant = self.DEFAULT_FLUX_CONSTANT
             date_obs = datetime.now()
 
-        dim = len(flux.shape)
-        if dim == 3:
-            flux = flux[0, 0, :]
-        elif flux.shape[0] == 2:
-            flux = flux[0, :]
         flux = flux * flux_constant
 
         header['CUNIT1'] = 'Angstrom'
@@ -0,0 +1,103 @@
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from guardian.shortcuts import assign_perm
+
+from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.models import DataProduct, ReducedDatum, get_thumbnail_sizes
+from tom_dataproducts.utils import create_image_dataproduct
+
+
+def process_data_product(data_product_id, group_ids=None):
+    """
+    Processes a ``DataProduct`` into ``ReducedDatum`` objects with ``run_data_processor``, and gives the groups
+    permission to view the ``DataProduct`` and the ``ReducedDatum`` objects. If processing fails, the ``DataProduct`` is
+    deleted.
+
+    :param data_product_id: Id of the ``DataProduct`` to process
+    :type data_product_id: int
+
+    :param group_ids: Ids of the groups that may view the ``DataProduct`` and ``ReducedDatum`` objects
+    :type group_ids: list
+
+    :returns: Description of the result
+    :rtype: str
+    """
+    dp = DataProduct.objects.get(pk=data_product_id)
+    try:
+        reduced_data = run_data_processor(dp)
+        if not settings.TARGET_PERMISSIONS_ONLY:
+            for group in Group.objects.filter(pk__in=group_ids or []):
+                assign_perm('tom_dataproducts.view_dataproduct', group, dp)
+                assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
+                assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
+    except Exception:
+        ReducedDatum.objects.filter(data_product=dp).delete()
+        dp.delete()
+        raise
+    return f'Created {reduced_data.count()} reduced data from {dp}'
+
+
+def create_thumbnail(data_product_id):
+    """
+    Creates the thumbnails of a ``DataProduct`` in all ``THUMBNAIL_SIZES``, if it is a FITS image. If they cannot be
+    created, e.g. because the data file is missing, they are recorded as not created, as for data products that are not
+    images, so that showing the data product does not enqueue the job again. They can be recreated with
+    ``get_preview(redraw=True)``.
+
+    :param data_product_id: Id of the ``DataProduct``
+    :type data_product_id: int
+
+    :returns: Description of the result
+    :rtype: str
+    """
+    try:
+        thumbnails = DataProduct.objects.get(pk=data_product_id).create_thumbnails()
+    except DataProduct.DoesNotExist:
+        raise
+    except Exception:
+        DataProduct.objects.filter(pk=data_product_id).update(
+            thumbnails={name: None for name in get_thumbnail_sizes()}
+        )
+        raise
+    return 'Created thumbnails: {0}'.format(', '.join(name for name, thumbnail in thumbnails.items() if thumbnail))
+
+
+def create_image_dataproducts(data_product_ids):
+    """
+    Creates JPEG image ``DataProduct`` objects and thumbnails of ``DataProduct`` objects, for those that are FITS
+    images.
+
+    :param data_product_ids: Ids of the ``DataProduct`` objects
+    :type data_product_ids: list
+
+    :returns: Description of the result
+    :rtype: str
+    """
+    created = 0
+    for data_product in DataProduct.objects.filter(pk__in=data_product_ids):
+        if create_image_dataproduct(data_product):
+            created += 1
+        data_product.create_thumbnails()
+    return f'Created {created} images'
+
+
+def update_reduced_data(target_id=None):
+    """
+    Gets new time-series data for alert-generated targets from the brokers they came from, with the
+    ``updatereduceddata`` management command.
+
+    :param target_id: Id of a single target to update, defaults to all targets
+    :type target_id: int
+
+    :returns: Output of the management command
+    :rtype: str
+    """
+    out = StringIO()
+    if target_id:
+        call_command('updatereduceddata', target_id=target_id, stdout=out)
+    else:
+        call_command('updatereduceddata', stdout=out)
+    return out.getvalue()
@@ -1,23 +1,32 @@
+import hashlib
 from urllib.parse import urlencode
 
 from django import template
 from django.conf import settings
 from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Count, Max
 from django.shortcuts import reverse
 from datetime import datetime
 from guardian.shortcuts import get_objects_for_user
+import numpy as np
 from plotly import offline
 import plotly.graph_objs as go
 
 from tom_dataproducts.forms import DataProductUploadForm
 from tom_dataproducts.models import DataProduct, ReducedDatum
+from tom_dataproducts.photometry_series import (downsample_extremes, get_photometry_arrays, get_photometry_version,
+                                                photometry_arrays_from_values)
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_observations.models import ObservationRecord
 from tom_targets.models import Target
 
 register = template.Library()
 
+PHOTOMETRY_PLOT_MAX_POINTS = 2000
+PHOTOMETRY_PLOT_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 @register.inclusion_tag('tom_dataproducts/partials/dataproduct_list_for_target.html', takes_context=True)
 def dataproduct_list_for_target(context, target):
@@ -110,6 +119,9 @@ def photometry_for_target(context, target, width=700, height=600, background=Non
     This templatetag requires all ``ReducedDatum`` objects with a data_type of ``photometry`` to be structured with the
     following keys in the JSON representation: magnitude, error, filter
 
+    The rendered plot is cached until photometry of the target is added, removed or modified. Each series is
+    downsampled to at most ``PHOTOMETRY_PLOT_MAX_POINTS`` points, keeping the extreme points of each time bin.
+
     :param width: Width of generated plot
     :type width: int
 
@@ -126,49 +138,67 @@ def photometry_for_target(context, target, width=700, height=600, background=Non
     :type grid: bool
     """
 
+    photometry = ReducedDatum.objects.filter(target=target, data_type=settings.DATA_PRODUCT_TYPES['photometry'][0])
+    if settings.TARGET_PERMISSIONS_ONLY:
+        fingerprint = photometry.aggregate(count=Count('id'), last_id=Max('id'))
+    else:
+        photometry = get_objects_for_user(context['request'].user, 'tom_dataproducts.view_reduceddatum',
+                                          klass=photometry)
+        # Users may be able to view different subsets of the photometry, so the cache key covers the exact subset
+        datum_ids = np.fromiter(photometry.order_by('id').values_list('id', flat=True), dtype=np.int64)
+        fingerprint = hashlib.sha1(datum_ids.tobytes()).hexdigest()
+    max_points = getattr(settings, 'PHOTOMETRY_PLOT_MAX_POINTS', PHOTOMETRY_PLOT_MAX_POINTS)
+    cache_key = 'photometry_plot_' + hashlib.sha1(repr((
+        target.id, get_photometry_version(target.id), fingerprint, width, height, background, label_color, grid,
+        max_points
+    )).encode()).hexdigest()
+    plot = cache.get(cache_key)
+    if plot is None:
+        if settings.TARGET_PERMISSIONS_ONLY:
+            photometry_data = get_photometry_arrays(target)
+        else:
+            photometry_data = photometry_arrays_from_values(photometry.values_list('timestamp', 'value'))
+        plot = _photometry_plot(photometry_data, width, height, background, label_color, grid, max_points)
+        cache.set(cache_key, plot, PHOTOMETRY_PLOT_CACHE_TIMEOUT)
+    return {
+        'target': target,
+        'plot': plot
+    }
+
+
+def _photometry_plot(photometry_data, width, height, background, label_color, grid, max_points):
     color_map = {
         'r': 'red',
         'g': 'green',
         'i': 'black'
     }
 
-    photometry_data = {}
-    if settings.TARGET_PERMISSIONS_ONLY:
-        datums = ReducedDatum.objects.filter(target=target, data_type=settings.DATA_PRODUCT_TYPES['photometry'][0])
-    else:
-        datums = get_objects_for_user(context['request'].user,
-                                      'tom_dataproducts.view_reduceddatum',
-                                      klass=ReducedDatum.objects.filter(
-                                        target=target,
-                                        data_type=settings.DATA_PRODUCT_TYPES['photometry'][0]))
-
-    for datum in datums:
-        photometry_data.setdefault(datum.value['filter'], {})
-        photometry_data[datum.value['filter']].setdefault('time', []).append(datum.timestamp)
-        photometry_data[datum.value['filter']].setdefault('magnitude', []).append(datum.value.get('magnitude'))
-        photometry_data[datum.value['filter']].setdefault('error', []).append(datum.value.get('error'))
-        photometry_data[datum.value['filter']].setdefault('limit', []).append(datum.value.get('limit'))
-
     plot_data = []
     for filter_name, filter_values in photometry_data.items():
-        if filter_values['magnitude']:
+        detected = np.flatnonzero(~np.isnan(filter_values['magnitude']))
+        if len(detected):
+            detected = detected[downsample_extremes(filter_values['time'][detected],
+                                                    filter_values['magnitude'][detected], max_points)]
             series = go.Scatter(
-                x=filter_values['time'],
-                y=filter_values['magnitude'],
+                x=filter_values['time'][detected],
+                y=filter_values['magnitude'][detected],
                 mode='markers',
                 marker=dict(color=color_map.get(filter_name)),
                 name=filter_name,
                 error_y=dict(
                     type='data',
-                    array=filter_values['error'],
+                    array=filter_values['error'][detected],
                     visible=True
                 )
             )
             plot_data.append(series)
-        if filter_values['limit']:
+        limits = np.flatnonzero(~np.isnan(filter_values['limit']))
+        if len(limits):
+            limits = limits[downsample_extremes(filter_values['time'][limits], filter_values['limit'][limits],
+                                                max_points)]
             series = go.Scatter(
-                x=filter_values['time'],
-                y=filter_values['limit'],
+                x=filter_values['time'][limits],
+                y=filter_values['limit'][limits],
                 mode='markers',
                 opacity=0.5,
                 marker=dict(color=color_map.get(filter_name)),
@@ -189,10 +219,7 @@ def photometry_for_target(context, target, width=700, height=600, background=Non
     fig = go.Figure(data=plot_data, layout=layout)
     fig.update_yaxes(showgrid=grid, color=label_color, showline=True, linecolor=label_color, mirror=True)
     fig.update_xaxes(showgrid=grid, color=label_color, showline=True, linecolor=label_color, mirror=True)
-    return {
-        'target': target,
-        'plot': offline.plot(fig, output_type='div', show_link=False)
-    }
+    return offline.plot(fig, output_type='div', show_link=False)
 
 
 @register.inclusion_tag('tom_dataproducts/partials/spectroscopy_for_target.html', takes_context=True)
@@ -1,27 +1,38 @@
+from io import BytesIO
 import os
+import threading
+import time as time_module
 from http import HTTPStatus
 import tempfile
 
 from astropy import units
 from astropy.io import fits
 from astropy.table import Table
-from datetime import date, time
+from astropy.time import Time, TimezoneInfo
+from datetime import date, datetime, time, timezone
 from django.test import TestCase, override_settings
 from django.conf import settings
 from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.urls import reverse
 from guardian.shortcuts import assign_perm
 import numpy as np
 from specutils import Spectrum1D
 from unittest.mock import patch
 
+from tom_common.models import Job
+from tom_dataproducts.data_processor import run_data_processor
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import DataProductUploadForm
-from tom_dataproducts.models import DataProduct, is_fits_image_file
+from tom_dataproducts.ingest import ingest_reduced_data
+from tom_dataproducts.models import DataProduct, DataSourceRefresh, PhotometrySeries, ReducedDatum, is_fits_image_file
+from tom_dataproducts.photometry_series import downsample_extremes, get_photometry_arrays
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_dataproducts.processors.photometry_processor import PhotometryProcessor
 from tom_dataproducts.processors.spectroscopy_processor import SpectroscopyProcessor
+from tom_dataproducts.templatetags.dataproduct_extras import photometry_for_target
 from tom_dataproducts.utils import create_image_dataproduct
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.tests.factories import SiderealTargetFactory, ObservingRecordFactory
@@ -239,7 +250,7 @@ class TestDataProductListView(TestCase):
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
                    TARGET_PERMISSIONS_ONLY=True)
-@patch('tom_dataproducts.views.run_data_processor')
+@patch('tom_dataproducts.tasks.run_data_processor')
 class TestUploadDataProducts(TestCase):
     def setUp(self):
         self.target = SiderealTargetFactory.create()
@@ -292,6 +303,34 @@ class TestUploadDataProducts(TestCase):
             self.target.name, FakeRoboticFacility.name)
         )
 
+    @override_settings(JOB_BACKEND='tom_common.jobs.DatabaseJobBackend')
+    def test_upload_data_queued(self, run_data_processor_mock):
+        response = self.client.post(
+            reverse('dataproducts:upload'),
+            {
+                'facility': 'LCO',
+                'files': SimpleUploadedFile('afile.fits', b'afile'),
+                'target': self.target.id,
+                'data_product_type': settings.DATA_PRODUCT_TYPES['spectroscopy'][0],
+                'observation_timestamp_0': date(2019, 6, 1),
+                'observation_timestamp_1': time(12, 0, 0),
+                'referrer': reverse('targets:detail', kwargs={'pk': self.target.id})
+            },
+            follow=True
+        )
+        self.assertContains(response, 'Uploaded and queued for processing: {0}/none/afile.fits'.format(
+            self.target.name)
+        )
+        run_data_processor_mock.assert_not_called()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertEqual(job.user, self.user)
+
+        call_command('processjobs', once=True)
+        run_data_processor_mock.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+
 
 class TestDeleteDataProducts(TestCase):
     def setUp(self):
@@ -400,6 +439,27 @@ class TestDataSerializer(TestCase):
         with self.assertRaises(Exception):
             self.serializer.deserialize({'invalid_key': 'value'})
 
+    def test_serialize_spectrum_binary_round_trip(self):
+        flux = np.linspace(1, 2, 4000).astype(np.float32) * units.Jy
+        wavelength = np.linspace(3000, 9000, 4000) * units.Angstrom
+        serialized = self.serializer.serialize(Spectrum1D(spectral_axis=wavelength, flux=flux))
+
+        self.assertEqual(serialized['encoding'], 'base64')
+        self.assertEqual(serialized['flux_dtype'], '<f4')
+        self.assertEqual(serialized['wavelength_dtype'], '<f8')
+        deserialized = self.serializer.deserialize(serialized)
+        np.testing.assert_array_equal(deserialized.flux.value, flux.value)
+        np.testing.assert_array_equal(deserialized.wavelength.value, wavelength.value)
+        self.assertEqual(deserialized.flux.unit, units.Jy)
+
+    def test_serialize_spectrum_list(self):
+        flux = np.arange(1, 200) * units.Jy
+        wavelength = np.arange(1, 200) * units.Angstrom
+        serialized = SpectrumSerializer(binary=False).serialize(Spectrum1D(spectral_axis=wavelength, flux=flux))
+
+        self.assertNotIn('encoding', serialized)
+        self.assertEqual(serialized['flux'], flux.value.tolist())
+
 
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
 class TestDataProcessor(TestCase):
@@ -441,6 +501,20 @@ class TestDataProcessor(TestCase):
             self.assertAlmostEqual(spectrum.flux.mean().value, 2.295068e-14, places=19)
             self.assertAlmostEqual(spectrum.wavelength.mean().value, 6600.478789, places=5)
 
+    @override_settings(TOM_FACILITY_CLASSES=['tom_observations.facilities.lco.LCOFacility'])
+    def test_process_spectrum_from_fits_facility_header(self):
+        with fits.open('tom_dataproducts/tests/test_data/test_spectrum.fits') as hdul:
+            hdul[0].header['ORIGIN'] = 'LCOGT'
+            hdul[0].header['DATE-OBS'] = '2020-01-02T03:04:05'
+            with tempfile.TemporaryDirectory() as tmpdir:
+                spectrum_path = os.path.join(tmpdir, 'spectrum.fits')
+                hdul.writeto(spectrum_path)
+                with open(spectrum_path, 'rb') as spectrum_file:
+                    self.data_product.data.save('spectrum.fits', spectrum_file)
+        spectrum, obs_date = self.spectrum_data_processor._process_spectrum_from_fits(self.data_product)
+        self.assertEqual(obs_date, datetime(2020, 1, 2, 3, 4, 5))
+        self.assertAlmostEqual(spectrum.wavelength.mean().value, 6600.478789, places=5)
+
     def test_process_spectrum_from_plaintext(self):
         with open('tom_dataproducts/tests/test_data/test_spectrum.csv', 'rb') as spectrum_file:
             self.data_product.data.save('spectrum.csv', spectrum_file)
@@ -466,6 +540,22 @@ class TestDataProcessor(TestCase):
             lightcurve = self.photometry_data_processor._process_photometry_from_plaintext(self.data_product)
             self.assertTrue(isinstance(lightcurve, list))
             self.assertEqual(len(lightcurve), 3)
+            self.assertEqual(lightcurve[0]['timestamp'], Time(55959.06999999983, format='mjd').to_datetime(
+                timezone=TimezoneInfo()))
+            self.assertEqual(lightcurve[1], {'timestamp': lightcurve[1]['timestamp'], 'magnitude': 15.676,
+                                             'filter': 'V', 'error': 0.007})
+
+    @override_settings(DATA_PROCESSORS={
+        'photometry': 'tom_dataproducts.processors.photometry_processor.PhotometryProcessor'
+    })
+    @patch('tom_dataproducts.data_processor.REDUCED_DATUM_BATCH_SIZE', 2)
+    def test_run_data_processor_photometry(self):
+        with open('tom_dataproducts/tests/test_data/test_lightcurve.csv', 'rb') as lightcurve_file:
+            self.data_product.data_product_type = 'photometry'
+            self.data_product.data.save('lightcurve.csv', lightcurve_file)
+            reduced_data = run_data_processor(self.data_product)
+            self.assertEqual(reduced_data.count(), 3)
+            self.assertEqual(set(reduced_data.values_list('value__filter', flat=True)), {'r', 'V'})
 
 
 class TestDataProductModel(TestCase):
@@ -486,3 +576,278 @@ class TestDataProductModel(TestCase):
             self.assertIn(
                 f'WARNING:tom_dataproducts.models:Unable to create thumbnail for {self.data_product}: Empty or corrupt '
                 'FITS file', logs.output)
+
+
+@override_settings(THUMBNAIL_SIZES={'large': (60, 60)})
+class TestDataProductThumbnails(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.target = SiderealTargetFactory.create()
+        self.data_product = DataProduct.objects.create(product_id='image', target=self.target,
+                                                       data=SimpleUploadedFile('image.fits', self.fits_image(64, 48)))
+
+    def fits_image(self, height, width, seed=0):
+        image = fits.PrimaryHDU(np.random.default_rng(seed).normal(size=(height, width)).astype(np.float32))
+        image.header['EXTNAME'] = 'SCI'
+        buffer = BytesIO()
+        fits.HDUList([image]).writeto(buffer)
+        return buffer.getvalue()
+
+    def test_get_preview(self):
+        preview_url = self.data_product.get_preview()
+
+        self.data_product.refresh_from_db()
+        thumbnails = self.data_product.thumbnails
+        self.assertEqual(set(thumbnails), {'default', 'large'})
+        self.assertEqual(preview_url, self.data_product.thumbnail.url)
+        self.assertEqual(self.data_product.thumbnail.name, thumbnails['default']['name'])
+        self.assertEqual(thumbnails['large']['size'], [60, 60])
+        self.assertEqual(max(thumbnails['large']['width'], thumbnails['large']['height']), 60)
+        self.assertEqual(self.data_product.thumbnail_checksum, self.data_product.get_data_checksum())
+        self.assertTrue(self.data_product.get_preview('large').endswith('image_large_tb.jpg'))
+
+    def test_get_preview_does_not_open_files(self):
+        self.data_product.get_preview()
+        self.data_product.refresh_from_db()
+
+        with patch('tom_dataproducts.models.Image.open') as image_open_mock, \
+                patch('tom_dataproducts.models.is_fits_image_file') as is_fits_image_file_mock, \
+                patch.object(DataProduct, 'get_data_checksum') as checksum_mock:
+            self.assertEqual(self.data_product.get_preview(), self.data_product.thumbnail.url)
+            self.assertIsNotNone(self.data_product.get_preview_url('large'))
+        image_open_mock.assert_not_called()
+        is_fits_image_file_mock.assert_not_called()
+        checksum_mock.assert_not_called()
+
+    def test_get_preview_not_an_image(self):
+        data_product = DataProduct.objects.create(product_id='text', target=self.target,
+                                                  data=SimpleUploadedFile('afile.txt', b'somedata'))
+        self.assertIsNone(data_product.get_preview())
+        self.assertEqual(data_product.thumbnails, {'default': None, 'large': None})
+
+        with patch('tom_dataproducts.models.is_fits_image_file') as is_fits_image_file_mock:
+            self.assertIsNone(data_product.get_preview())
+        is_fits_image_file_mock.assert_not_called()
+
+    def test_get_preview_url_failed_job_is_not_enqueued_again(self):
+        with patch.object(DataProduct, 'create_thumbnails', side_effect=OSError('missing file')):
+            self.assertIsNone(self.data_product.get_preview_url())
+            self.assertIsNone(self.data_product.get_preview_url())
+
+        jobs = Job.objects.filter(function='tom_dataproducts.tasks.create_thumbnail')
+        self.assertEqual(list(jobs.values_list('status', flat=True)), [Job.FAILED])
+        self.data_product.refresh_from_db()
+        self.assertEqual(self.data_product.thumbnails, {'default': None, 'large': None})
+
+    def test_create_thumbnails_after_data_changed(self):
+        first_thumbnails = self.data_product.create_thumbnails()
+        first_checksum = self.data_product.thumbnail_checksum
+        self.assertEqual(self.data_product.create_thumbnails(), first_thumbnails)
+
+        self.data_product.data.delete(save=False)
+        self.data_product.data.save('image.fits', ContentFile(self.fits_image(64, 64, seed=1)))
+        thumbnails = self.data_product.create_thumbnails()
+
+        self.assertNotEqual(self.data_product.thumbnail_checksum, first_checksum)
+        self.assertEqual((thumbnails['large']['width'], thumbnails['large']['height']), (60, 60))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestPhotometrySeries(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.first = ReducedDatum.objects.create(
+            target=self.target, data_type='photometry', timestamp=datetime(2021, 1, 2, tzinfo=timezone.utc),
+            value={'filter': 'r', 'magnitude': 15.5, 'error': 0.1}
+        )
+        ReducedDatum.objects.create(
+            target=self.target, data_type='photometry', timestamp=datetime(2021, 1, 1, tzinfo=timezone.utc),
+            value={'filter': 'r', 'limit': 19.0}
+        )
+        ReducedDatum.objects.create(
+            target=self.target, data_type='photometry', timestamp=datetime(2021, 1, 1, tzinfo=timezone.utc),
+            value={'filter': 'g', 'magnitude': 16.0, 'error': 0.2}
+        )
+
+    def test_get_photometry_arrays(self):
+        photometry = get_photometry_arrays(self.target)
+        self.assertEqual(set(photometry.keys()), {'r', 'g'})
+        np.testing.assert_array_equal(photometry['r']['time'],
+                                      np.array(['2021-01-01', '2021-01-02'], dtype='datetime64[us]'))
+        np.testing.assert_array_equal(photometry['r']['magnitude'], [np.nan, 15.5])
+        np.testing.assert_array_equal(photometry['r']['limit'], [19.0, np.nan])
+        self.assertEqual(PhotometrySeries.objects.filter(target=self.target).count(), 2)
+
+        # Up-to-date series are read without touching the ReducedDatum values
+        with self.assertNumQueries(2):
+            cached = get_photometry_arrays(self.target)
+        np.testing.assert_array_equal(cached['g']['magnitude'], [16.0])
+
+    def test_photometry_arrays_rebuilt_on_change(self):
+        get_photometry_arrays(self.target)
+
+        ReducedDatum.objects.create(target=self.target, data_type='photometry', value={'filter': 'i', 'magnitude': 14})
+        self.assertIn('i', get_photometry_arrays(self.target))
+
+        self.first.value = {'filter': 'r', 'magnitude': 12.0, 'error': 0.1}
+        self.first.save()
+        np.testing.assert_array_equal(get_photometry_arrays(self.target)['r']['magnitude'], [np.nan, 12.0])
+
+        ReducedDatum.objects.filter(value__filter='r').delete()
+        self.assertNotIn('r', get_photometry_arrays(self.target))
+
+        ReducedDatum.objects.all().delete()
+        self.assertEqual(get_photometry_arrays(self.target), {})
+        self.assertFalse(PhotometrySeries.objects.filter(target=self.target).exists())
+
+    def test_photometry_for_target(self):
+        context = photometry_for_target({}, self.target)
+        self.assertIn('r non-detection', context['plot'])
+        self.assertNotIn('g non-detection', context['plot'])
+
+    def test_photometry_for_target_cached(self):
+        photometry_for_target({}, self.target)
+        with self.assertNumQueries(1):
+            cached = photometry_for_target({}, self.target)
+        self.assertIn('r non-detection', cached['plot'])
+
+        # Modifying existing photometry invalidates the cached plot
+        self.first.value = {'filter': 'i', 'magnitude': 15.5, 'error': 0.1}
+        self.first.save()
+        self.assertIn('"name":"i"', photometry_for_target({}, self.target)['plot'].replace(' ', ''))
+
+    def test_downsample_extremes(self):
+        times = np.arange(10000)
+        values = np.sin(times / 100.0)
+        values[1234] = 5
+        values[8765] = -5
+        selected = downsample_extremes(times, values, 200)
+
+        self.assertLessEqual(len(selected), 200)
+        self.assertIn(1234, selected)
+        self.assertIn(8765, selected)
+        np.testing.assert_array_equal(downsample_extremes(times[:100], values[:100], 200), np.arange(100))
+
+
+class TestIngestReducedData(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.photometry = [
+            (datetime(2021, 1, 1, tzinfo=timezone.utc), {'filter': 'r', 'magnitude': 15.5, 'error': 0.1}),
+            (datetime(2021, 1, 1, tzinfo=timezone.utc), {'filter': 'g', 'magnitude': 16.0, 'error': 0.2}),
+            (datetime(2021, 1, 2, tzinfo=timezone.utc), {'filter': 'r', 'limit': 19.0}),
+        ]
+
+    def test_ingest_new_data_only(self):
+        created = ingest_reduced_data(self.target, 'Broker', self.photometry, source_location='alert/1')
+        self.assertEqual(len(created), 3)
+
+        # Keys are compared regardless of their order, and repeated points in the input are stored once
+        new_point = (datetime(2021, 1, 3, tzinfo=timezone.utc), {'filter': 'r', 'magnitude': 15.0})
+        repeated_point = (self.photometry[0][0], {'error': 0.1, 'magnitude': 15.5, 'filter': 'r'})
+        with self.assertNumQueries(5):
+            created = ingest_reduced_data(self.target, 'Broker', [repeated_point, new_point, new_point])
+        self.assertEqual([datum.timestamp for datum in created], [new_point[0]])
+        self.assertEqual(ReducedDatum.objects.filter(target=self.target, source_name='Broker').count(), 4)
+
+        # Data from other sources are stored separately
+        self.assertEqual(len(ingest_reduced_data(self.target, 'Other Broker', self.photometry)), 3)
+
+    def test_ingest_with_existing_unhashed_data(self):
+        for _ in range(2):
+            ReducedDatum.objects.create(target=self.target, source_name='Broker', data_type='photometry',
+                                        timestamp=self.photometry[0][0], value=self.photometry[0][1])
+
+        created = ingest_reduced_data(self.target, 'Broker', self.photometry)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(ReducedDatum.objects.filter(target=self.target, value_hash='').count(), 1)
+        self.assertEqual(ingest_reduced_data(self.target, 'Broker', self.photometry), [])
+
+
+@override_settings(TOM_ALERT_CLASSES=['tom_alerts.tests.tests.TestBroker', 'tom_alerts.brokers.mars.MARSBroker'])
+@patch('tom_alerts.brokers.mars.MARSBroker.process_reduced_data')
+@patch('tom_alerts.tests.tests.TestBroker.process_reduced_data')
+class TestUpdateReducedDataCommand(TestCase):
+    def setUp(self):
+        self.test_target, self.mars_target, self.other_target = SiderealTargetFactory.create_batch(3)
+        for target, source_name in [(self.test_target, 'TEST'), (self.test_target, 'TEST'),
+                                    (self.mars_target, 'MARS'), (self.other_target, 'Other')]:
+            ReducedDatum.objects.create(target=target, source_name=source_name, data_type='photometry',
+                                        timestamp=datetime(2021, 1, 1, tzinfo=timezone.utc), value={'magnitude': 15})
+
+    def test_update_from_sources_of_data(self, mock_test_process, mock_mars_process):
+        result = call_command('updatereduceddata')
+        self.assertEqual(result, 'Update completed successfully')
+        mock_test_process.assert_called_once_with(self.test_target)
+        mock_mars_process.assert_called_once_with(self.mars_target)
+
+        call_command('updatereduceddata', target_id=self.mars_target.id)
+        self.assertEqual(mock_test_process.call_count, 1)
+        self.assertEqual(mock_mars_process.call_count, 2)
+
+    def test_update_stale_targets(self, mock_test_process, mock_mars_process):
+        mock_mars_process.side_effect = Exception('Unable to retrieve alert information from broker')
+        result = call_command('updatereduceddata', stale_after=1)
+        self.assertEqual(result, f"Update completed with errors: {{'MARS': [{self.mars_target.id}]}}")
+
+        # Only the failed update is retried
+        call_command('updatereduceddata', stale_after=1)
+        self.assertEqual(mock_test_process.call_count, 1)
+        self.assertEqual(mock_mars_process.call_count, 2)
+
+        DataSourceRefresh.objects.update(refreshed=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        call_command('updatereduceddata', stale_after=1)
+        self.assertEqual(mock_test_process.call_count, 2)
+
+    def test_update_in_parallel(self, mock_test_process, mock_mars_process):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def process_reduced_data(target):
+            with lock:
+                running.append(target)
+                max_running.append(len(running))
+            time_module.sleep(0.05)
+            with lock:
+                running.remove(target)
+
+        more_targets = SiderealTargetFactory.create_batch(3)
+        for target in more_targets:
+            ReducedDatum.objects.create(target=target, source_name='TEST', data_type='photometry',
+                                        timestamp=datetime(2021, 1, 1, tzinfo=timezone.utc), value={'magnitude': 15})
+        mock_test_process.side_effect = process_reduced_data
+        mock_mars_process.side_effect = process_reduced_data
+
+        result = call_command('updatereduceddata', workers=4, broker_concurrency=2)
+        self.assertEqual(result, 'Update completed successfully')
+        self.assertEqual(mock_test_process.call_count, 4)
+        # At most two updates from TEST and one from MARS run at once
+        self.assertLessEqual(max(max_running), 3)
+        self.assertEqual(DataSourceRefresh.objects.count(), 5)
+
+
+class TestConvertSpectraCommand(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.datum = ReducedDatum.objects.create(
+            target=self.target, data_type='spectroscopy', timestamp=datetime(2021, 1, 1, tzinfo=timezone.utc),
+            value={'flux': [1, 2], 'flux_units': 'Jy', 'wavelength': [3000, 4000], 'wavelength_units': 'Angstrom'}
+        )
+
+    def test_convert_spectra(self):
+        self.assertEqual(call_command('convertspectra'), 'Converted 1 spectra.')
+
+        self.datum.refresh_from_db()
+        self.assertEqual(self.datum.value['encoding'], 'base64')
+        deserialized = SpectrumSerializer().deserialize(self.datum.value)
+        np.testing.assert_array_equal(deserialized.flux.value, [1, 2])
+        np.testing.assert_array_equal(deserialized.wavelength.value, [3000, 4000])
+
+        # Spectra that are already binary-encoded are left untouched
+        self.assertEqual(call_command('convertspectra'), 'Converted 0 spectra.')
@@ -1,4 +1,3 @@
-from io import StringIO
 from urllib.parse import urlencode, urlparse
 
 from django.conf import settings
@@ -7,26 +6,27 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import Group
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
-from django.core.management import call_command
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect
 from django.urls import reverse, reverse_lazy
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from django.views.generic import View, ListView
 from django.views.generic.base import RedirectView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, FormView
 from django_filters.views import FilterView
-from guardian.shortcuts import assign_perm, get_objects_for_user
+from guardian.shortcuts import get_objects_for_user
 
 from tom_common.hooks import run_hook
 from tom_common.hints import add_hint
+from tom_common.jobs import enqueue
 from tom_common.mixins import Raise403PermissionRequiredMixin
+from tom_common.models import Job
 from tom_dataproducts.models import DataProduct, DataProductGroup, ReducedDatum
-from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import AddProductToGroupForm, DataProductUploadForm
 from tom_dataproducts.filters import DataProductFilter
-from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.tasks import process_data_product, update_reduced_data
 from tom_observations.models import ObservationRecord
 from tom_observations.facility import get_service_class
 
@@ -91,8 +91,8 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         """
-        Runs after ``DataProductUploadForm`` is validated. Saves each ``DataProduct`` and calls ``run_data_processor``
-        on each saved file. Redirects to the previous page.
+        Runs after ``DataProductUploadForm`` is validated. Saves each ``DataProduct`` and enqueues a job that calls
+        ``run_data_processor`` on each saved file. Redirects to the previous page.
         """
         target = form.cleaned_data['target']
         if not target:
@@ -103,6 +103,7 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
         dp_type = form.cleaned_data['data_product_type']
         data_product_files = self.request.FILES.getlist('files')
         successful_uploads = []
+        queued_uploads = []
         for f in data_product_files:
             dp = DataProduct(
                 target=target,
@@ -112,31 +113,38 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
                 data_product_type=dp_type
             )
             dp.save()
+            group_ids = []
+            if not settings.TARGET_PERMISSIONS_ONLY:
+                group_ids = [group.id for group in form.cleaned_data['groups']]
             try:
                 run_hook('data_product_post_upload', dp)
-                reduced_data = run_data_processor(dp)
-                if not settings.TARGET_PERMISSIONS_ONLY:
-                    for group in form.cleaned_data['groups']:
-                        assign_perm('tom_dataproducts.view_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
-                successful_uploads.append(str(dp))
-            except InvalidFileFormatException as iffe:
-                ReducedDatum.objects.filter(data_product=dp).delete()
+            except Exception:
                 dp.delete()
+                messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+                continue
+            job = enqueue(process_data_product, args=[dp.id, group_ids], description=f'Process {dp}',
+                          user=self.request.user)
+            if job.status == Job.FAILED:
                 messages.error(
                     self.request,
-                    'File format invalid for file {0} -- error was {1}'.format(str(dp), iffe)
+                    'There was a problem processing your file: {0} -- error was {1}'.format(str(dp), job.error)
                 )
-            except Exception:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+            elif job.status == Job.SUCCEEDED:
+                successful_uploads.append(str(dp))
+            else:
+                queued_uploads.append(str(dp))
         if successful_uploads:
             messages.success(
                 self.request,
                 'Successfully uploaded: {0}'.format('\n'.join([p for p in successful_uploads]))
             )
+        if queued_uploads:
+            messages.success(
+                self.request,
+                mark_safe('Uploaded and queued for processing: {0}. Progress can be followed on the '
+                          '<a href="{1}">jobs page</a>.'.format(
+                              escape('\n'.join(queued_uploads)), reverse('job-list')))
+            )
 
         return redirect(form.cleaned_data.get('referrer', '/'))
 
@@ -356,14 +364,17 @@ class UpdateReducedDataView(LoginRequiredMixin, RedirectView):
         # QueryDict is immutable, and we want to append the remaining params to the redirect URL
         query_params = request.GET.copy()
         target_id = query_params.pop('target_id', None)
-        out = StringIO()
-        if target_id:
-            if isinstance(target_id, list):
-                target_id = target_id[-1]
-            call_command('updatereduceddata', target_id=target_id, stdout=out)
+        if isinstance(target_id, list):
+            target_id = target_id[-1]
+        job = enqueue(update_reduced_data, kwargs={'target_id': target_id}, description='Update broker data',
+                      user=request.user)
+        if job.status == Job.SUCCEEDED:
+            messages.info(request, job.result)
+        elif job.status == Job.FAILED:
+            messages.error(request, 'Update failed: {0}'.format(job.error))
         else:
-            call_command('updatereduceddata', stdout=out)
-        messages.info(request, out.getvalue())
+            messages.info(request, mark_safe('Broker data update queued. Progress can be followed on the '
+                                             '<a href="{0}">jobs page</a>.'.format(reverse('job-list'))))
         add_hint(request, mark_safe(
                           'Did you know updating observation statuses can be automated? Learn how in '
                           '<a href=https://tom-toolkit.readthedocs.io/en/stable/customization/automation.html>'
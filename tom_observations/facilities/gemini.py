@@ -1,5 +1,4 @@
 import logging
-import requests
 
 from django.conf import settings
 from django import forms
@@ -8,6 +7,7 @@ from crispy_forms.layout import Div, HTML
 from astropy import units as u
 
 from tom_observations.facility import BaseRoboticObservationFacility, BaseRoboticObservationForm
+from tom_common import http_client
 from tom_common.exceptions import ImproperCredentialsException
 from tom_targets.models import Target
 
@@ -63,7 +63,7 @@ SITES = {
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = http_client.request(*args, **kwargs)
     if 400 <= response.status_code < 500:
         logger.log(msg=f'Gemini request failed: {response.content}', level=logging.WARN)
         raise ImproperCredentialsException('GEM')
@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 import logging
-import requests
 from urllib.parse import urlencode
 
 from astropy import units as u
@@ -11,6 +10,7 @@ from django import forms
 from django.conf import settings
 from django.core.cache import cache
 
+from tom_common import http_client
 from tom_common.exceptions import ImproperCredentialsException
 from tom_observations.cadence import CadenceForm
 from tom_observations.facility import BaseRoboticObservationFacility, BaseRoboticObservationForm, get_service_class
@@ -31,6 +31,8 @@ except (AttributeError, KeyError):
 
 # Module specific settings.
 PORTAL_URL = LCO_SETTINGS['portal_url']
+# Number of requests whose statuses are fetched per list call to the observation portal
+STATUS_BATCH_SIZE = 100
 # Valid observing states at LCO are defined here: https://developers.lco.global/#data-format-definition
 VALID_OBSERVING_STATES = [
     'PENDING', 'COMPLETED', 'WINDOW_EXPIRED', 'CANCELED', 'FAILURE_LIMIT_REACHED', 'NOT_ATTEMPTED'
@@ -106,7 +108,7 @@ muscat_exposure_mode_help = """
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = http_client.request(*args, **kwargs)
     if 401 <= response.status_code <= 403:
         raise ImproperCredentialsException('LCO: ' + str(response.content))
     elif 400 == response.status_code:
@@ -1010,6 +1012,7 @@ class LCOFacility(BaseRoboticObservationFacility):
     """
 
     name = 'LCO'
+    fits_header_keywords = {FITS_FACILITY_KEYWORD: FITS_FACILITY_KEYWORD_VALUE}
     # TODO: make the keys the display values instead
     observation_forms = {
         'IMAGING': LCOImagingObservationForm,
@@ -1111,19 +1114,6 @@ class LCOFacility(BaseRoboticObservationFacility):
     def get_date_obs_from_fits_header(self, header):
         return header.get(FITS_FACILITY_DATE_OBS_KEYWORD, None)
 
-    def is_fits_facility(self, header):
-        """
-        Returns True if the 'ORIGIN' keyword is in the given FITS header and contains the value 'LCOGT', False
-        otherwise.
-
-        :param header: FITS header object
-        :type header: dictionary-like
-
-        :returns: True if header matches LCOGT, False otherwise
-        :rtype: boolean
-        """
-        return FITS_FACILITY_KEYWORD_VALUE == header.get(FITS_FACILITY_KEYWORD, None)
-
     def get_start_end_keywords(self):
         return ('start', 'end')
 
@@ -1254,31 +1244,52 @@ class LCOFacility(BaseRoboticObservationFacility):
             PORTAL_URL + '/api/requests/{0}/observations/'.format(observation_id),
             headers=self._portal_headers()
         )
-        blocks = response.json()
-        current_block = None
-        for block in blocks:
-            if block['state'] == 'COMPLETED':
-                current_block = block
-                break
-            elif block['state'] == 'PENDING':
-                current_block = block
-        if current_block:
-            scheduled_start = current_block['start']
-            scheduled_end = current_block['end']
-        else:
-            scheduled_start, scheduled_end = None, None
+        scheduled_start, scheduled_end = self._get_scheduled_window(response.json())
 
         return {'state': state, 'scheduled_start': scheduled_start, 'scheduled_end': scheduled_end}
 
+    def get_observation_statuses(self, observation_ids):
+        """
+        Gets the statuses of many requests with paginated list calls filtered by request id, which take two requests
+        to the observation portal per ``STATUS_BATCH_SIZE`` requests, rather than two per request.
+        """
+        statuses = {}
+        for batch_start in range(0, len(observation_ids), STATUS_BATCH_SIZE):
+            batch = observation_ids[batch_start:batch_start + STATUS_BATCH_SIZE]
+            id_filter = ','.join(str(observation_id) for observation_id in batch)
+            states = {
+                str(request['id']): request['state']
+                for request in self._portal_list('/api/requests/', {'id__in': id_filter})
+            }
+            blocks = {}
+            for block in self._portal_list('/api/observations/', {'request_id__in': id_filter}):
+                request = block.get('request')
+                request_id = request['id'] if isinstance(request, dict) else block.get('request_id', request)
+                blocks.setdefault(str(request_id), []).append(block)
+            for observation_id in batch:
+                if str(observation_id) in states:
+                    scheduled_start, scheduled_end = self._get_scheduled_window(blocks.get(str(observation_id), []))
+                    statuses[observation_id] = {
+                        'state': states[str(observation_id)],
+                        'scheduled_start': scheduled_start,
+                        'scheduled_end': scheduled_end
+                    }
+        return statuses
+
     def data_products(self, observation_id, product_id=None):
         products = []
         for frame in self._archive_frames(observation_id, product_id):
-            products.append({
+            product = {
                 'id': frame['id'],
                 'filename': frame['filename'],
                 'created': parse(frame['DATE_OBS']),
                 'url': frame['url']
-            })
+            }
+            # The checksum of the latest version lets already downloaded files be verified rather than fetched again
+            versions = frame.get('version_set') or []
+            if versions and versions[0].get('md5'):
+                product['md5'] = versions[0]['md5']
+            products.append(product)
         return products
 
     # The following methods are used internally by this module
@@ -1290,6 +1301,27 @@ class LCOFacility(BaseRoboticObservationFacility):
         else:
             return {}
 
+    def _portal_list(self, path, params):
+        results = []
+        url = f'{PORTAL_URL}{path}?{urlencode({**params, "limit": 1000})}'
+        while url:
+            response = make_request('GET', url, headers=self._portal_headers()).json()
+            results += response['results']
+            url = response.get('next')
+        return results
+
+    def _get_scheduled_window(self, blocks):
+        current_block = None
+        for block in blocks:
+            if block['state'] == 'COMPLETED':
+                current_block = block
+                break
+            elif block['state'] == 'PENDING':
+                current_block = block
+        if current_block:
+            return current_block['start'], current_block['end']
+        return None, None
+
     def _get_requestgroup_id(self, observation_id):
         query_params = urlencode({'request_id': observation_id})
 
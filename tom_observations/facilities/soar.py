@@ -1,9 +1,9 @@
-import requests
 from django.conf import settings
 from django.core.cache import cache
 
 from tom_observations.facilities.lco import LCOFacility, LCOBaseObservationForm
 from tom_observations.facilities.lco import LCOImagingObservationForm, LCOSpectroscopyObservationForm
+from tom_common import http_client
 from tom_common.exceptions import ImproperCredentialsException
 
 
@@ -25,7 +25,7 @@ SPECTRAL_GRATING = 'SYZY_400'
 
 
 def make_request(*args, **kwargs):
-    response = requests.request(*args, **kwargs)
+    response = http_client.request(*args, **kwargs)
     if 400 <= response.status_code < 500:
         raise ImproperCredentialsException('SOAR: ' + str(response.content))
     response.raise_for_status()
@@ -1,16 +1,24 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
 import copy
+from functools import lru_cache
+import hashlib
 import logging
-import requests
 
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import ButtonHolder, Layout, Submit, Div, HTML
 from django import forms
 from django.conf import settings
 from django.contrib.auth.models import Group
-from django.core.files.base import ContentFile
-
+from django.core.files.base import File
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tom_common import http_client
+from tom_common.hooks import run_hook
+from tom_common.jobs import enqueue
 from tom_targets.models import Target
 
 logger = logging.getLogger(__name__)
@@ -28,6 +36,21 @@ except AttributeError:
     AUTO_THUMBNAILS = False
 
 
+class ChecksumFile(File):
+    """
+    ``File`` that computes the MD5 checksum of the data read from it, so that a stream can be verified while it is
+    written to storage.
+    """
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self.checksum = hashlib.md5()
+
+    def read(self, *args, **kwargs):
+        data = self.file.read(*args, **kwargs)
+        self.checksum.update(data)
+        return data
+
+
 def get_service_classes():
     try:
         TOM_FACILITY_CLASSES = settings.TOM_FACILITY_CLASSES
@@ -54,6 +77,62 @@ def get_service_class(name):
         raise ImportError('Could not a find a facility with that name. Did you add it to TOM_FACILITY_CLASSES?')
 
 
+def get_fits_facility(header):
+    """
+    Returns the facility that a FITS file is from, based on its header. Facilities are found by looking up the values
+    of their ``fits_header_keywords`` in an index, so only facilities with a matching keyword value, and those that
+    override ``is_fits_facility``, are checked with ``is_fits_facility``, in the order of ``TOM_FACILITY_CLASSES``.
+
+    :param header: FITS header
+    :type header: dictionary-like
+
+    :returns: Instance of the facility, or None if the header is not from any facility
+    :rtype: BaseObservationFacility
+    """
+    try:
+        facility_classes = tuple(settings.TOM_FACILITY_CLASSES)
+    except AttributeError:
+        facility_classes = tuple(DEFAULT_FACILITY_CLASSES)
+    keyword_index, other_facilities = _get_fits_facility_index(facility_classes)
+
+    candidates = set(other_facilities)
+    for keyword, values in keyword_index.items():
+        try:
+            candidates.update(values.get(header.get(keyword), []))
+        except TypeError:  # unhashable header value
+            pass
+    for name, clazz in get_service_classes().items():
+        if name in candidates:
+            facility = clazz()
+            if facility.is_fits_facility(header):
+                return facility
+    return None
+
+
+@lru_cache(maxsize=None)
+def _get_fits_facility_index(facility_classes):
+    # Maps header keywords to their values, and the values to the names of the facilities that they identify. The
+    # index is cached per list of facility classes, so that it is only rebuilt when TOM_FACILITY_CLASSES changes.
+    keyword_index = {}
+    other_facilities = []
+    for name, clazz in get_service_classes().items():
+        for keyword, value in clazz.fits_header_keywords.items():
+            keyword_index.setdefault(keyword, {}).setdefault(value, []).append(name)
+        if clazz.is_fits_facility is not BaseObservationFacility.is_fits_facility:
+            other_facilities.append(name)
+    return keyword_index, other_facilities
+
+
+def _parse_scheduled_time(value):
+    # Facilities such as LCO return the scheduled window as ISO 8601 strings, which are parsed so that they can be
+    # compared with the datetimes of the observation records. Times without a timezone are taken to be UTC.
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
 class BaseObservationForm(forms.Form):
     """
     This is the class that is responsible for displaying the observation request form.
@@ -180,6 +259,8 @@ class BaseObservationFacility(ABC):
     the other BaseObservationFacilities.
     """
     name = 'BaseObservation'
+    # FITS header keywords and the values that identify files from this facility, e.g. {'ORIGIN': 'LCOGT'}
+    fits_header_keywords = {}
 
     def all_data_products(self, observation_record):
         from tom_dataproducts.models import DataProduct
@@ -244,9 +325,11 @@ class BaseObservationFacility(ABC):
     def is_fits_facility(self, header):
         """
         Returns True if the FITS header is from this facility based on valid keywords and associated
-        values, False otherwise.
+        values, False otherwise. By default, the header must contain all of the ``fits_header_keywords``.
         """
-        return False
+        if not self.fits_header_keywords:
+            return False
+        return all(header.get(keyword) == value for keyword, value in self.fits_header_keywords.items())
 
     def get_start_end_keywords(self):
         """
@@ -358,13 +441,55 @@ class BaseRoboticObservationFacility(BaseObservationFacility):
         except ObservationRecord.DoesNotExist:
             raise Exception('No record exists for that observation id')
 
-    def update_all_observation_statuses(self, target=None):
+    def update_all_observation_statuses(self, target=None, concurrency=None):
+        """
+        Updates the status of all non-terminal observations of this facility, optionally only those of a single target.
+
+        If the facility implements ``get_observation_statuses``, all statuses are fetched with it at once. Otherwise,
+        with a concurrency greater than 1, statuses are fetched by that many threads in parallel. In both cases, the
+        records whose status or schedule changed are written back with a single bulk update, after which the
+        ``observation_change_state`` hook is run for each record whose status changed.
+
+        :param target: Target to update the observations of, defaults to all targets
+        :type target: Target
+
+        :param concurrency: Number of statuses to fetch in parallel, defaults to ``OBSERVATION_STATUS_CONCURRENCY``
+            in settings, or 1
+        :type concurrency: int
+
+        :returns: list of tuples of the observation id and error message for each observation that failed to update
+        :rtype: list
+        """
         from tom_observations.models import ObservationRecord
         failed_records = []
         records = ObservationRecord.objects.filter(facility=self.name)
         if target:
             records = records.filter(target=target)
-        records = records.exclude(status__in=self.get_terminal_observing_states())
+        records = list(records.exclude(status__in=self.get_terminal_observing_states()))
+        if concurrency is None:
+            concurrency = getattr(settings, 'OBSERVATION_STATUS_CONCURRENCY', 1)
+
+        try:
+            statuses = self.get_observation_statuses([record.observation_id for record in records]) if records else {}
+        except NotImplementedError:
+            pass
+        except Exception as e:
+            return [(record.observation_id, str(e)) for record in records]
+        else:
+            return self._save_observation_statuses(records, statuses, {})
+
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(self._fetch_observation_status, record.observation_id) for record in records]
+            statuses = {}
+            errors = {}
+            for record, future in zip(records, futures):
+                try:
+                    statuses[record.observation_id] = future.result()
+                except Exception as e:
+                    errors[record.observation_id] = str(e)
+            return self._save_observation_statuses(records, statuses, errors)
+
         for record in records:
             try:
                 self.update_observation_status(record.observation_id)
@@ -372,30 +497,151 @@ class BaseRoboticObservationFacility(BaseObservationFacility):
                 failed_records.append((record.observation_id, str(e)))
         return failed_records
 
-    def save_data_products(self, observation_record, product_id=None):
+    def get_observation_statuses(self, observation_ids):
+        """
+        Return the statuses of many observations at once, in the format returned by ``get_observation_status``.
+        Facilities whose API can report on many observations in a single request can implement this method to make
+        ``update_all_observation_statuses`` much faster. Observations that are missing from the result are reported
+        as failed updates.
+
+        :param observation_ids: ids of the observations to get the statuses of
+        :type observation_ids: list
+
+        :returns: dictionary of observation id to status
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def _fetch_observation_status(self, observation_id):
+        try:
+            return self.get_observation_status(observation_id)
+        finally:
+            # Worker threads get their own database connections, which would otherwise be left open
+            connection.close()
+
+    def _save_observation_statuses(self, records, statuses, errors):
+        from tom_observations.models import ObservationRecord
+        failed_records = []
+        updated_records = []
+        previous_statuses = []
+        now = timezone.now()
+        for record in records:
+            status = statuses.get(record.observation_id)
+            if status is None:
+                failed_records.append(
+                    (record.observation_id, errors.get(record.observation_id, 'No status returned by the facility'))
+                )
+                continue
+            previous = (record.status, record.scheduled_start, record.scheduled_end)
+            record.status = status['state']
+            record.scheduled_start = _parse_scheduled_time(status['scheduled_start'])
+            record.scheduled_end = _parse_scheduled_time(status['scheduled_end'])
+            if (record.status, record.scheduled_start, record.scheduled_end) != previous:
+                record.modified = now
+                updated_records.append(record)
+                previous_statuses.append(previous[0])
+
+        ObservationRecord.objects.bulk_update(
+            updated_records, ['status', 'scheduled_start', 'scheduled_end', 'modified'], batch_size=500
+        )
+        for record, previous_status in zip(updated_records, previous_statuses):
+            if record.status != previous_status:
+                run_hook('observation_change_state', record, previous_status)
+        return failed_records
+
+    def save_data_products(self, observation_record, product_id=None, concurrency=None):
+        """
+        Downloads the data products of an observation and saves them as ``DataProduct`` objects.
+
+        Files are streamed to storage in chunks by a pool of threads, so that large files are never held in memory.
+        Products whose file has already been stored are skipped if the stored file matches the ``size`` or, failing
+        that, the ``md5`` checksum reported for the product by ``data_products``, and are downloaded again otherwise.
+        New downloads are verified against the ``md5`` checksum if there is one. When ``AUTO_THUMBNAILS`` is set, a job
+        is enqueued to create thumbnails of the downloaded files once all downloads have finished.
+
+        :param observation_record: Observation to save the data products of
+        :type observation_record: ObservationRecord
+
+        :param product_id: Id of a single data product to save, defaults to all data products of the observation
+        :type product_id: str
+
+        :param concurrency: Number of files to download in parallel, defaults to
+            ``DATA_PRODUCT_DOWNLOAD_CONCURRENCY`` in settings, or 4
+        :type concurrency: int
+
+        :returns: list of ``DataProduct`` objects of the observation, in the order returned by ``data_products``
+        :rtype: list
+        """
         from tom_dataproducts.models import DataProduct
-        from tom_dataproducts.utils import create_image_dataproduct
+        from tom_dataproducts.tasks import create_image_dataproducts
+        if concurrency is None:
+            concurrency = getattr(settings, 'DATA_PRODUCT_DOWNLOAD_CONCURRENCY', 4)
         final_products = []
+        downloads = []
         products = self.data_products(observation_record.observation_id, product_id)
+        target = observation_record.target
 
         for product in products:
             dp, created = DataProduct.objects.get_or_create(
                 product_id=product['id'],
-                target=observation_record.target,
+                target=target,
                 observation_record=observation_record,
             )
-            if created:
-                product_data = requests.get(product['url']).content
-                dfile = ContentFile(product_data)
-                dp.data.save(product['filename'], dfile)
-                dp.save()
-                logger.info('Saved new dataproduct: {}'.format(dp.data))
-            if AUTO_THUMBNAILS:
-                create_image_dataproduct(dp)
-                dp.get_preview()
+            if created or not self._is_data_product_downloaded(dp, product):
+                # The file path is built from these, so they are set here rather than queried by the worker threads
+                dp.target = target
+                dp.observation_record = observation_record
+                downloads.append((dp, product))
             final_products.append(dp)
+
+        # Files are downloaded in worker threads, but the database is only written to from this thread
+        downloaded_products = []
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            futures = [executor.submit(self._download_data_product, dp, product) for dp, product in downloads]
+        for (dp, product), future in zip(downloads, futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error('Unable to download dataproduct {0}: {1}'.format(product['id'], e))
+                continue
+            dp.save()
+            downloaded_products.append(dp)
+            logger.info('Saved new dataproduct: {}'.format(dp.data))
+
+        if AUTO_THUMBNAILS and downloaded_products:
+            enqueue(create_image_dataproducts, args=[[dp.id for dp in downloaded_products]],
+                    description=f'Create images of data products of {observation_record}')
         return final_products
 
+    def _is_data_product_downloaded(self, data_product, product):
+        if not data_product.data:
+            return False
+        try:
+            if product.get('size') is not None:
+                return data_product.data.size == product['size']
+            if product.get('md5'):
+                checksum = hashlib.md5()
+                with data_product.data.open('rb') as stored_file:
+                    for chunk in stored_file.chunks():
+                        checksum.update(chunk)
+                return checksum.hexdigest() == product['md5']
+            return data_product.data.storage.exists(data_product.data.name)
+        except OSError:
+            return False
+
+    def _download_data_product(self, data_product, product):
+        if data_product.data:
+            # Replace a partial or outdated download rather than saving alongside it
+            data_product.data.delete(save=False)
+        with http_client.get(product['url'], stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            content = ChecksumFile(response.raw, name=product['filename'])
+            data_product.data.save(product['filename'], content, save=False)
+        if product.get('md5') and content.checksum.hexdigest() != product['md5']:
+            data_product.data.delete(save=False)
+            raise ValueError('Checksum of downloaded file does not match')
+
     @abstractmethod
     def get_observation_status(self, observation_id):
         """
@@ -411,6 +657,11 @@ class BaseRoboticObservationFacility(BaseObservationFacility):
         products that belong to this observation. In this case,
         the LCO module retrieves a list of frames from the LCO
         data archive.
+
+        Each data product is a dictionary with ``id``, ``filename``,
+        ``created`` and ``url``, and optionally the ``size`` in bytes
+        and ``md5`` checksum of the file, which are used to verify
+        downloads.
         """
         pass
 
@@ -0,0 +1,96 @@
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tom_observations import facility
+from tom_observations.models import NightlyVisibility
+from tom_observations.visibility import get_local_night, get_night_bounds, get_nightly_visibility
+from tom_targets.models import Target
+
+
+class Command(BaseCommand):
+    """
+    Precomputes the nightly visibility of all sidereal targets from every observing site, for use by the "Observable
+    Tonight" target filter. Visibility is computed for batches of targets at once, and the visibility of nights that
+    have ended is deleted. This command is intended to be run daily, e.g. as a cron job.
+
+    Example: ./manage.py computevisibility --nights 3 --airmass_limit 2.5
+    """
+
+    help = 'Precomputes the nightly visibility of all sidereal targets from every observing site'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            help='Local date, in YYYY-MM-DD format, on which the first night begins. Defaults to tonight at each site.'
+        )
+        parser.add_argument(
+            '--nights',
+            type=int,
+            default=1,
+            help='Number of consecutive nights to compute the visibility for.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help='Time interval, in minutes, at which to calculate airmass within each night.'
+        )
+        parser.add_argument(
+            '--airmass_limit',
+            type=float,
+            default=2,
+            help='Maximum airmass at which a target is considered observable when computing observable windows.'
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='Number of targets to compute the visibility of at once.'
+        )
+
+    def handle(self, *args, **options):
+        NightlyVisibility.objects.filter(night_end__lt=datetime.now(timezone.utc)).delete()
+
+        sites = []
+        for facility_name in facility.get_service_classes():
+            clazz = facility.get_service_class(facility_name)
+            for site, site_details in clazz().get_observing_sites().items():
+                first_night = options['date'] or get_local_night(site_details['longitude'])
+                nights = [first_night + timedelta(days=n) for n in range(options['nights'])]
+                sites.append((facility_name, site, site_details, nights))
+
+        computed = 0
+        targets = Target.objects.filter(
+            type=Target.SIDEREAL, ra__isnull=False, dec__isnull=False
+        ).order_by('id').values_list('id', 'ra', 'dec').iterator(chunk_size=options['batch_size'])
+        while True:
+            batch = list(islice(targets, options['batch_size']))
+            if not batch:
+                break
+            target_ids, ra, dec = zip(*batch)
+            for facility_name, site, site_details, nights in sites:
+                for night in nights:
+                    night_start, night_end = get_night_bounds(night, site_details['longitude'])
+                    visibility = get_nightly_visibility(ra, dec, site_details, night, options['interval'],
+                                                        options['airmass_limit'])
+                    with transaction.atomic():
+                        NightlyVisibility.objects.filter(
+                            target_id__in=target_ids, facility=facility_name, site=site, night=night
+                        ).delete()
+                        NightlyVisibility.objects.bulk_create([
+                            NightlyVisibility(
+                                target_id=target_id, facility=facility_name, site=site, night=night,
+                                night_start=night_start, night_end=night_end, min_airmass=min_airmass,
+                                observable_start=observable_start, observable_end=observable_end
+                            ) for target_id, min_airmass, observable_start, observable_end in zip(
+                                target_ids, visibility['min_airmass'], visibility['observable_start'],
+                                visibility['observable_end']
+                            )
+                        ])
+                    computed += len(target_ids)
+
+        return f'Computed {computed} nightly visibilities.'
@@ -8,7 +8,10 @@ from tom_observations import facility
 class Command(BaseCommand):
     """
     Updates the status of each observation request in the TOM. Target id can be specified to update the status for all
-    observations for a single target.
+    observations for a single target. The statuses of observations at robotic facilities can be fetched concurrently
+    with the concurrency option, which defaults to ``OBSERVATION_STATUS_CONCURRENCY`` in settings.
+
+    Example: ./manage.py updatestatus --concurrency 16
     """
 
     help = 'Updates the status of each observation request in the TOM'
@@ -18,6 +21,11 @@ class Command(BaseCommand):
             '--target_id',
             help='Update observation statuses for a single target'
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Number of observation statuses to fetch in parallel from each robotic facility'
+        )
 
     def handle(self, *args, **options):
         target = None
@@ -30,7 +38,12 @@ class Command(BaseCommand):
         failed_records = {}
         for facility_name in facility.get_service_classes():
             clazz = facility.get_service_class(facility_name)
-            failed_records[facility_name] = clazz().update_all_observation_statuses(target=target)
+            if options['concurrency'] and issubclass(clazz, facility.BaseRoboticObservationFacility):
+                failed_records[facility_name] = clazz().update_all_observation_statuses(
+                    target=target, concurrency=options['concurrency']
+                )
+            else:
+                failed_records[facility_name] = clazz().update_all_observation_statuses(target=target)
         success = True
         for facility_name, errors in failed_records.items():
             if len(errors) > 0:
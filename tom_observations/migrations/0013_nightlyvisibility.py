@@ -0,0 +1,38 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0020_target_sky_pixel'),
+        ('tom_observations', '0012_auto_20210205_1819'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NightlyVisibility',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facility', models.CharField(max_length=50)),
+                ('site', models.CharField(max_length=100)),
+                ('night', models.DateField()),
+                ('night_start', models.DateTimeField()),
+                ('night_end', models.DateTimeField()),
+                ('min_airmass', models.FloatField(null=True)),
+                ('observable_start', models.DateTimeField(null=True)),
+                ('observable_end', models.DateTimeField(null=True)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tom_targets.target')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='nightlyvisibility',
+            index=models.Index(fields=['site', 'night_end', 'min_airmass'], name='tom_observa_site_6891f7_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nightlyvisibility',
+            unique_together={('target', 'facility', 'site', 'night')},
+        ),
+    ]
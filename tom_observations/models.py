@@ -181,3 +181,57 @@ class ObservationTemplate(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class NightlyVisibility(models.Model):
+    """
+    Class representing the precomputed visibility of a sidereal target from an observing site during one night, as
+    computed in bulk by the ``computevisibility`` management command.
+
+    :param target: The ``Target`` with which this object is associated.
+    :type target: Target
+
+    :param facility: The facility that the site belongs to.
+    :type facility: str
+
+    :param site: The name of the observing site, as returned by the ``get_observing_sites`` method of the facility.
+    :type site: str
+
+    :param night: The local date on which the night begins.
+    :type night: date
+
+    :param night_start: Local mean noon before the night, which is when the night starts for the purposes of
+        deciding which night is "tonight".
+    :type night_start: datetime
+
+    :param night_end: Local mean noon after the night.
+    :type night_end: datetime
+
+    :param min_airmass: The lowest airmass of the target while the sun is below astronomical twilight, or None if the
+        target does not rise above the horizon during darkness.
+    :type min_airmass: float
+
+    :param observable_start: The first time during darkness at which the airmass of the target is within the airmass
+        limit that the visibility was computed with, if any.
+    :type observable_start: datetime
+
+    :param observable_end: The last time during darkness at which the airmass of the target is within the airmass limit
+        that the visibility was computed with, if any.
+    :type observable_end: datetime
+    """
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
+    facility = models.CharField(max_length=50)
+    site = models.CharField(max_length=100)
+    night = models.DateField()
+    night_start = models.DateTimeField()
+    night_end = models.DateTimeField()
+    min_airmass = models.FloatField(null=True)
+    observable_start = models.DateTimeField(null=True)
+    observable_end = models.DateTimeField(null=True)
+
+    class Meta:
+        unique_together = ('target', 'facility', 'site', 'night')
+        indexes = [models.Index(fields=['site', 'night_end', 'min_airmass'])]
+
+    def __str__(self):
+        return f'{self.target} from ({self.facility}) {self.site} on {self.night}'
@@ -14,7 +14,7 @@ class TestMakeRequest(TestCase):
     Tests make_request function of the Gemini facility, modeled after test_lco
     '''
 
-    @patch('tom_observations.facilities.gemini.requests.request')
+    @patch('tom_observations.facilities.gemini.http_client.request')
     def test_make_request(self, mock_request):
         '''
         Response object contains server's response to HTTP request
@@ -1,7 +1,10 @@
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
 from requests import Response
+from threading import Thread
 from unittest.mock import patch
+from urllib.parse import parse_qs, urlencode, urlparse
 
 from django.test import TestCase
 
@@ -10,7 +13,7 @@ from tom_observations.facilities.lco import make_request, LCOFacility
 from tom_observations.facilities.lco import LCOBaseForm, LCOBaseObservationForm, LCOImagingObservationForm
 from tom_observations.facilities.lco import LCOPhotometricSequenceForm, LCOSpectroscopicSequenceForm
 from tom_observations.facilities.lco import LCOSpectroscopyObservationForm, LCOMuscatImagingObservationForm
-from tom_observations.tests.factories import SiderealTargetFactory, NonSiderealTargetFactory
+from tom_observations.tests.factories import ObservingRecordFactory, SiderealTargetFactory, NonSiderealTargetFactory
 
 
 instrument_response = {
@@ -115,7 +118,7 @@ def generate_lco_proposal_choices():
 
 class TestMakeRequest(TestCase):
 
-    @patch('tom_observations.facilities.lco.requests.request')
+    @patch('tom_observations.facilities.lco.http_client.request')
     def test_make_request(self, mock_request):
         mock_response = Response()
         mock_response._content = str.encode(json.dumps({'test': 'test'}))
@@ -855,3 +858,92 @@ class TestLCOFacility(TestCase):
             }))
             requestgroup_id = self.lco._get_requestgroup_id(1234567)
             self.assertIsNone(requestgroup_id)
+
+
+class MockPortalHandler(BaseHTTPRequestHandler):
+    """
+    Serves paginated request and observation lists, two results per page, in the format of the LCO observation portal.
+    """
+    requests = {
+        '101': 'PENDING',
+        '102': 'COMPLETED',
+        '103': 'WINDOW_EXPIRED',
+    }
+    observations = [
+        {'request': {'id': 101}, 'state': 'PENDING', 'start': '2021-03-01T01:00:00Z', 'end': '2021-03-01T02:00:00Z'},
+        {'request': {'id': 102}, 'state': 'CANCELED', 'start': '2021-03-01T01:00:00Z', 'end': '2021-03-01T02:00:00Z'},
+        {'request': {'id': 102}, 'state': 'COMPLETED', 'start': '2021-03-02T01:00:00Z', 'end': '2021-03-02T02:00:00Z'},
+    ]
+    paths = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.paths.append(url.path)
+        if url.path == '/api/requests/':
+            ids = params['id__in'][0].split(',')
+            results = [{'id': int(i), 'state': self.requests[i]} for i in ids if i in self.requests]
+        elif url.path == '/api/observations/':
+            ids = params['request_id__in'][0].split(',')
+            results = [block for block in self.observations if str(block['request']['id']) in ids]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        offset = int(params.get('offset', ['0'])[0])
+        next_page = None
+        if offset + 2 < len(results):
+            next_params = {key: value[0] for key, value in params.items()}
+            next_params['offset'] = offset + 2
+            next_page = f'http://{self.headers["Host"]}{url.path}?{urlencode(next_params)}'
+        body = json.dumps({'count': len(results), 'next': next_page, 'results': results[offset:offset + 2]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLCOObservationStatuses(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockPortalHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        MockPortalHandler.paths = []
+        portal_url = patch('tom_observations.facilities.lco.PORTAL_URL', f'http://127.0.0.1:{self.server.server_port}')
+        portal_url.start()
+        self.addCleanup(portal_url.stop)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_get_observation_statuses(self):
+        statuses = LCOFacility().get_observation_statuses(['101', '102', '103', '104'])
+
+        self.assertEqual(statuses['101'], {'state': 'PENDING', 'scheduled_start': '2021-03-01T01:00:00Z',
+                                           'scheduled_end': '2021-03-01T02:00:00Z'})
+        self.assertEqual(statuses['102']['state'], 'COMPLETED')
+        self.assertEqual(statuses['102']['scheduled_start'], '2021-03-02T01:00:00Z')
+        self.assertEqual(statuses['103'], {'state': 'WINDOW_EXPIRED', 'scheduled_start': None, 'scheduled_end': None})
+        self.assertNotIn('104', statuses)
+        # Two pages of requests and two pages of observations
+        self.assertEqual(len(MockPortalHandler.paths), 4)
+
+    @patch('tom_observations.facilities.lco.STATUS_BATCH_SIZE', 2)
+    def test_update_all_observation_statuses(self):
+        target = SiderealTargetFactory.create()
+        records = [
+            ObservingRecordFactory.create(target_id=target.id, facility='LCO', observation_id=observation_id,
+                                          status='PENDING')
+            for observation_id in ['101', '102', '103', '104']
+        ]
+
+        with patch('tom_observations.facility.run_hook') as hook_mock:
+            failed_records = LCOFacility().update_all_observation_statuses()
+
+        self.assertEqual(failed_records, [('104', 'No status returned by the facility')])
+        for record, status in zip(records, ['PENDING', 'COMPLETED', 'WINDOW_EXPIRED', 'PENDING']):
+            record.refresh_from_db()
+            self.assertEqual(record.status, status)
+        self.assertEqual(hook_mock.call_count, 2)
+        self.assertTrue(all(path in ['/api/requests/', '/api/observations/'] for path in MockPortalHandler.paths))
@@ -1,21 +1,33 @@
 from datetime import datetime, timedelta
+import hashlib
 from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import tempfile
+from threading import Thread
 from unittest import mock
 
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
+from django.core.management import call_command
 from django.forms import ValidationError
 from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from astroplan import FixedTarget
-from astropy.coordinates import get_sun, SkyCoord
+from astropy.coordinates import get_moon, get_sun, SkyCoord
 from astropy.time import Time
+import numpy as np
 
 from .factories import ObservingRecordFactory, ObservationTemplateFactory, SiderealTargetFactory, TargetNameFactory
-from tom_observations.utils import get_astroplan_sun_and_time, get_sidereal_visibility
+from tom_observations.utils import (get_astroplan_sun_and_time, get_sidereal_visibility,
+                                    get_sidereal_visibility_for_targets)
+from tom_observations.facilities.lco import LCOFacility
+from tom_observations.facility import _get_fits_facility_index, get_fits_facility
 from tom_observations.tests.utils import FakeRoboticFacility
-from tom_observations.models import ObservationRecord, ObservationGroup, ObservationTemplate
+from tom_observations.visibility import get_moon_ephemeris, get_moon_position, get_moon_separations
+from tom_observations.models import NightlyVisibility, ObservationRecord, ObservationGroup, ObservationTemplate
 from tom_targets.models import Target
 from guardian.shortcuts import assign_perm
 
@@ -269,6 +281,31 @@ class TestFacilityStatusView(TestCase):
         self.assertContains(response, 'coj.domb.1m0a', status_code=HTTPStatus.OK)
 
 
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility',
+                                         'tom_observations.facilities.lco.LCOFacility',
+                                         'tom_observations.facilities.soar.SOARFacility'])
+class TestGetFitsFacility(TestCase):
+    def test_facility_from_header_keywords(self):
+        facility = get_fits_facility({'ORIGIN': 'LCOGT', 'DATE-OBS': '2020-01-01T00:00:00'})
+        # SOAR inherits the header keywords of LCO, so the first of them in TOM_FACILITY_CLASSES is returned
+        self.assertIsInstance(facility, LCOFacility)
+        self.assertIsNone(get_fits_facility({'ORIGIN': 'NOAO-IRAF FITS'}))
+        self.assertIsNone(get_fits_facility({}))
+
+    def test_only_candidate_facilities_checked(self):
+        get_fits_facility({})  # builds the index before the method is patched
+        with mock.patch.object(FakeRoboticFacility, 'is_fits_facility', return_value=False) as mock_is_fits_facility:
+            get_fits_facility({'ORIGIN': 'LCOGT'})
+            mock_is_fits_facility.assert_not_called()
+
+    @mock.patch('tom_observations.tests.utils.FakeRoboticFacility.is_fits_facility', return_value=True)
+    def test_facility_overriding_is_fits_facility(self, mock_is_fits_facility):
+        # The patched method counts as an override, and the index is rebuilt for the patched class
+        _get_fits_facility_index.cache_clear()
+        self.assertIsInstance(get_fits_facility({'ORIGIN': 'LCOGT'}), FakeRoboticFacility)
+        _get_fits_facility_index.cache_clear()
+
+
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
                    TARGET_PERMISSIONS_ONLY=False)
 class TestObservationViewsRowLevelPermissions(TestCase):
@@ -373,6 +410,144 @@ class TestUpdatingObservations(TestCase):
             FakeRoboticFacility().update_all_observation_statuses(target=self.t1)
             self.assertEquals(uos_mock.call_count, 2)
 
+    def test_update_all_observations_concurrently(self):
+        with mock.patch('tom_observations.facility.run_hook') as hook_mock:
+            failed_records = FakeRoboticFacility().update_all_observation_statuses(concurrency=4)
+
+        self.assertEqual(failed_records, [])
+        for record in [self.or1, self.or3]:
+            record.refresh_from_db()
+            self.assertEqual(record.status, 'COMPLETED')
+            self.assertIsNotNone(record.scheduled_start)
+            hook_mock.assert_any_call('observation_change_state', record, 'PENDING')
+        self.assertEqual(hook_mock.call_count, 2)
+
+    def test_update_all_observations_concurrently_with_failures(self):
+        self.or3.refresh_from_db()
+        status = FakeRoboticFacility().get_observation_status(self.or1.observation_id)
+
+        def get_observation_status(observation_id):
+            if observation_id == self.or3.observation_id:
+                raise Exception('Status unavailable')
+            return status
+
+        with mock.patch.object(FakeRoboticFacility, 'get_observation_status', side_effect=get_observation_status):
+            failed_records = FakeRoboticFacility().update_all_observation_statuses(concurrency=4)
+
+        self.assertEqual(failed_records, [(self.or3.observation_id, 'Status unavailable')])
+        self.or1.refresh_from_db()
+        self.or3.refresh_from_db()
+        self.assertEqual(self.or1.status, 'COMPLETED')
+        self.assertEqual(self.or3.status, 'PENDING')
+
+    def test_update_all_observations_unchanged_status(self):
+        scheduled_start = datetime(2021, 1, 1, 10, tzinfo=timezone.utc)
+        scheduled_end = datetime(2021, 1, 1, 11, tzinfo=timezone.utc)
+        ObservationRecord.objects.filter(pk__in=[self.or1.pk, self.or3.pk]).update(
+            scheduled_start=scheduled_start, scheduled_end=scheduled_end
+        )
+        self.or1.refresh_from_db()
+        # The scheduled window is returned as ISO 8601 strings, as by the LCO facility
+        status = {
+            'state': 'PENDING', 'scheduled_start': '2021-01-01T10:00:00Z', 'scheduled_end': '2021-01-01T11:00:00Z'
+        }
+
+        with mock.patch.object(FakeRoboticFacility, 'get_observation_status', return_value=status), \
+                mock.patch('tom_observations.facility.run_hook') as hook_mock, \
+                mock.patch.object(ObservationRecord.objects, 'bulk_update') as bulk_update_mock:
+            failed_records = FakeRoboticFacility().update_all_observation_statuses(concurrency=4)
+
+        self.assertEqual(failed_records, [])
+        self.assertEqual(bulk_update_mock.call_args[0][0], [])
+        hook_mock.assert_not_called()
+        modified = self.or1.modified
+        self.or1.refresh_from_db()
+        self.assertEqual(self.or1.modified, modified)
+
+
+class MockArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves the data product files of an observation, and counts the requests for each of them.
+    """
+    files = {
+        '/frame1.fits': b'SIMPLE  = T' * 1000,
+        '/frame2.fits': b'BITPIX  = 8' * 1000,
+    }
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        body = self.files[self.path]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+class TestSaveDataProducts(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockArchiveHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        MockArchiveHandler.paths = []
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        target = SiderealTargetFactory.create()
+        self.observation_record = ObservingRecordFactory.create(target_id=target.id, facility=FakeRoboticFacility.name,
+                                                                parameters={})
+        self.products = [
+            {'id': f'frame{i}', 'filename': f'frame{i}.fits', 'md5': hashlib.md5(body).hexdigest(),
+             'url': f'http://127.0.0.1:{self.server.server_port}{path}'}
+            for i, (path, body) in enumerate(MockArchiveHandler.files.items(), start=1)
+        ]
+        data_products = mock.patch.object(FakeRoboticFacility, 'data_products', return_value=self.products)
+        data_products.start()
+        self.addCleanup(data_products.stop)
+
+    def test_save_data_products(self):
+        data_products = FakeRoboticFacility().save_data_products(self.observation_record, concurrency=2)
+
+        self.assertEqual([dp.product_id for dp in data_products], ['frame1', 'frame2'])
+        for dp, body in zip(data_products, MockArchiveHandler.files.values()):
+            dp.refresh_from_db()
+            with dp.data.open('rb') as stored_file:
+                self.assertEqual(stored_file.read(), body)
+        self.assertCountEqual(MockArchiveHandler.paths, ['/frame1.fits', '/frame2.fits'])
+
+    def test_save_data_products_skips_downloaded_files(self):
+        data_products = FakeRoboticFacility().save_data_products(self.observation_record)
+        # A partially downloaded file is downloaded again
+        with open(data_products[1].data.path, 'wb') as stored_file:
+            stored_file.write(b'BITPIX')
+        MockArchiveHandler.paths = []
+
+        FakeRoboticFacility().save_data_products(self.observation_record)
+
+        self.assertEqual(MockArchiveHandler.paths, ['/frame2.fits'])
+        data_products[1].refresh_from_db()
+        self.assertEqual(data_products[1].data.size, len(MockArchiveHandler.files['/frame2.fits']))
+
+    def test_save_data_products_checksum_mismatch(self):
+        self.products[0]['md5'] = hashlib.md5(b'corrupted').hexdigest()
+
+        data_products = FakeRoboticFacility().save_data_products(self.observation_record)
+
+        data_products[0].refresh_from_db()
+        data_products[1].refresh_from_db()
+        self.assertFalse(data_products[0].data)
+        self.assertTrue(data_products[1].data)
+        self.assertEqual(os.listdir(os.path.dirname(data_products[1].data.path)), ['frame2.fits'])
+
 
 class TestGetVisibility(TestCase):
     def setUp(self):
@@ -423,7 +598,7 @@ class TestGetVisibility(TestCase):
             self.interval, self.airmass_limit
         )
 
-    @mock.patch('tom_observations.utils.facility.get_service_classes')
+    @mock.patch('tom_observations.visibility.facility.get_service_classes')
     def test_get_visibility_sidereal(self, mock_facility):
         mock_facility.return_value = {'Fake Robotic Facility': FakeRoboticFacility}
         end = self.start + timedelta(minutes=60)
@@ -436,3 +611,99 @@ class TestGetVisibility(TestCase):
         self.assertEqual(len(airmass_data), len(expected_airmass))
         for i in range(0, len(expected_airmass)):
             self.assertAlmostEqual(airmass_data[i], expected_airmass[i], places=3)
+
+    @mock.patch('tom_observations.visibility.facility.get_service_classes')
+    def test_get_visibility_for_targets(self, mock_facility):
+        mock_facility.return_value = {'Fake Robotic Facility': FakeRoboticFacility}
+        end = self.start + timedelta(days=1)
+        other_target = Target(ra=self.target.ra + 30, dec=self.target.dec, type=Target.SIDEREAL)
+        non_sidereal_target = Target(type=Target.NON_SIDEREAL)
+        visibilities = get_sidereal_visibility_for_targets(
+            [self.target, non_sidereal_target, other_target], self.start, end, self.interval, self.airmass_limit
+        )
+
+        self.assertEqual(len(visibilities), 3)
+        self.assertEqual(visibilities[1], {})
+        for target, visibility in [(self.target, visibilities[0]), (other_target, visibilities[2])]:
+            single_visibility = get_sidereal_visibility(target, self.start, end, self.interval, self.airmass_limit)
+            for site, (_, airmass) in single_visibility.items():
+                self.assertEqual(visibility[site][1], airmass)
+        siding_spring = visibilities[0]['(Fake Robotic Facility) Siding Spring'][1]
+        self.assertIn(None, siding_spring)
+        self.assertTrue(all(airmass is None or 1 < airmass < self.airmass_limit for airmass in siding_spring))
+
+
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'])
+class TestComputeVisibility(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.client.force_login(self.user)
+        # Near the south celestial pole, the target is always about 31 degrees up at Siding Spring, and never up at
+        # Los Angeles, whatever the date
+        self.target = SiderealTargetFactory.create(name='southpole', ra=0, dec=-89)
+        assign_perm('tom_targets.view_target', self.user, self.target)
+
+    def test_compute_visibility(self):
+        self.assertEqual(call_command('computevisibility'), 'Computed 2 nightly visibilities.')
+
+        siding_spring = NightlyVisibility.objects.get(target=self.target, site='Siding Spring')
+        self.assertTrue(1.8 < siding_spring.min_airmass < 2)
+        self.assertLess(siding_spring.observable_start, siding_spring.observable_end)
+        self.assertTrue(siding_spring.night_start <= timezone.now() < siding_spring.night_end)
+        los_angeles = NightlyVisibility.objects.get(target=self.target, site='Los Angeles')
+        self.assertIsNone(los_angeles.min_airmass)
+        self.assertIsNone(los_angeles.observable_start)
+
+        # Recomputing replaces the existing visibility
+        call_command('computevisibility', nights=2)
+        self.assertEqual(NightlyVisibility.objects.filter(target=self.target).count(), 4)
+
+    def test_observable_tonight_filter(self):
+        call_command('computevisibility')
+        response = self.client.get(reverse('targets:list') + '?observable_tonight=Siding Spring, 2')
+        self.assertContains(response, 'southpole')
+        response = self.client.get(reverse('targets:list') + '?observable_tonight=Siding Spring, 1.5')
+        self.assertNotContains(response, 'southpole')
+        response = self.client.get(reverse('targets:list') + '?observable_tonight=Los Angeles, 2')
+        self.assertNotContains(response, 'southpole')
+
+    def test_observable_tonight_filter_facility(self):
+        call_command('computevisibility')
+        url = reverse('targets:list') + '?observable_tonight='
+        self.assertContains(self.client.get(url + 'FakeRoboticFacility, Siding Spring, 2'), 'southpole')
+        self.assertNotContains(self.client.get(url + 'OtherFacility, Siding Spring, 2'), 'southpole')
+
+    def test_observable_tonight_filter_invalid(self):
+        for value in ['ogg', 'ogg,abc', 'a, b, c, 2', ', 2']:
+            response = self.client.get(reverse('targets:list'), {'observable_tonight': value})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['filter'].errors['observable_tonight'])
+            response = self.client.get(reverse('api:targets-list'), {'observable_tonight': value})
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestMoonEphemeris(TestCase):
+    def test_moon_separations(self):
+        start = datetime(2021, 3, 1, 12, 30)
+        ephemeris = get_moon_ephemeris(start, 2)
+        self.assertEqual(len(ephemeris['mjd']), 10)
+        self.assertEqual(ephemeris['mjd'][0], Time(datetime(2021, 3, 1, 12)).mjd)
+
+        ra, dec = [10, 150, 300], [-20, 5, 60]
+        separations = get_moon_separations(ra, dec, ephemeris)
+        expected = get_moon(Time(ephemeris['mjd'], format='mjd')).separation(
+            SkyCoord(ra, dec, unit='deg')[:, None]
+        ).deg
+        np.testing.assert_allclose(separations, expected, atol=0.01)
+
+        # The grid is shared by all requests starting within the same hour
+        with mock.patch('tom_observations.visibility.get_moon') as get_moon_mock:
+            get_moon_ephemeris(start + timedelta(minutes=20), 2)
+            get_moon_mock.assert_not_called()
+
+    def test_moon_position(self):
+        when = datetime(2021, 3, 1, 12, 30)
+        ra, dec = get_moon_position(when)
+        moon = get_moon(Time(when))
+        self.assertLess(moon.separation(SkyCoord(ra, dec, unit='deg')).deg, 0.01)
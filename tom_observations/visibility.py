@@ -0,0 +1,332 @@
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+from math import floor
+
+from astroplan import moon_illumination
+from astropy import units
+from astropy.coordinates import FK5, SkyCoord, get_moon, get_sun
+from astropy.time import Time
+from django.core.cache import cache
+import numpy as np
+
+from tom_observations import facility
+
+# Altitude of the sun, in degrees, at astronomical twilight. Targets are not visible while the sun is higher.
+TWILIGHT_SUN_ALTITUDE = -18
+
+# Number of positions of the sun computed per day. Positions in between are interpolated, which is accurate to well
+# under an arcsecond because the sun moves about a degree per day.
+SUN_EPHEMERIS_STEPS = 24
+
+MOON_EPHEMERIS_KEY = 'tom_observations_moon_ephemeris_{start}_{days}_{step}'
+MOON_EPHEMERIS_TIMEOUT = 60 * 60 * 24
+
+
+def get_visibility_sites():
+    """
+    Collects the observing sites of all facilities.
+
+    :returns: Dictionary of site details, keyed by the site name prepended with the observing facility
+    :rtype: dict
+    """
+    sites = {}
+    for observing_facility in facility.get_service_classes():
+        observing_facility_class = facility.get_service_class(observing_facility)
+        for site, site_details in observing_facility_class().get_observing_sites().items():
+            sites[f'({observing_facility}) {site}'] = site_details
+    return sites
+
+
+def radec_to_unit_vectors(ra, dec):
+    """
+    Converts arrays of equatorial coordinates into an (N, 3) array of cartesian unit vectors.
+
+    :param ra: Right Ascension values, in degrees
+    :type ra: array_like
+
+    :param dec: Declination values, in degrees
+    :type dec: array_like
+
+    :returns: cartesian unit vectors
+    :rtype: numpy.ndarray
+    """
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    cos_dec = np.cos(dec)
+    return np.column_stack((cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)))
+
+
+def greenwich_mean_sidereal_time(mjd):
+    """
+    Computes the Greenwich mean sidereal time, treating UTC as UT1. The resulting error of under a second of time is
+    negligible for visibility, and no IERS tables are needed.
+
+    :param mjd: Modified Julian Dates, in UTC
+    :type mjd: array_like
+
+    :returns: Greenwich mean sidereal times, in radians
+    :rtype: numpy.ndarray
+    """
+    days = np.asarray(mjd, dtype=float) - 51544.5
+    centuries = days / 36525
+    gmst = 280.46061837 + 360.98564736629 * days + 0.000387933 * centuries ** 2 - centuries ** 3 / 38710000
+    return np.radians(gmst % 360)
+
+
+def precess(ra, dec, mjd):
+    """
+    Precesses ICRS coordinates to the mean equator and equinox of a date, which is the frame that mean sidereal time
+    refers to.
+
+    :param ra: Right Ascension values, in degrees
+    :type ra: array_like
+
+    :param dec: Declination values, in degrees
+    :type dec: array_like
+
+    :param mjd: Modified Julian Date of the equinox
+    :type mjd: float
+
+    :returns: Right Ascension and Declination of date, in radians
+    :rtype: tuple
+    """
+    coords = SkyCoord(ra=np.asarray(ra, dtype=float) * units.deg, dec=np.asarray(dec, dtype=float) * units.deg,
+                      frame='icrs').transform_to(FK5(equinox=Time(mjd, format='mjd')))
+    return coords.ra.radian, coords.dec.radian
+
+
+@lru_cache(maxsize=64)
+def _sun_ephemeris(day):
+    nodes = np.linspace(day, day + 1, SUN_EPHEMERIS_STEPS + 1)
+    sun = get_sun(Time(nodes, format='mjd'))
+    ra, dec = precess(sun.ra.deg, sun.dec.deg, day + 0.5)
+    return nodes, np.unwrap(ra), dec
+
+
+def sun_position(mjd):
+    """
+    Computes the position of the sun from an ephemeris that is cached per day, so that repeated visibility
+    calculations for the same nights do not recompute it.
+
+    :param mjd: Modified Julian Dates, in UTC
+    :type mjd: array_like
+
+    :returns: Right Ascension and Declination of the sun, of date, in radians
+    :rtype: tuple
+    """
+    mjd = np.asarray(mjd, dtype=float)
+    ra = np.empty_like(mjd)
+    dec = np.empty_like(mjd)
+    days = np.floor(mjd)
+    for day in np.unique(days):
+        nodes, node_ra, node_dec = _sun_ephemeris(int(day))
+        in_day = days == day
+        ra[in_day] = np.interp(mjd[in_day], nodes, node_ra)
+        dec[in_day] = np.interp(mjd[in_day], nodes, node_dec)
+    return ra, dec
+
+
+def _sin_altitude(ra, dec, local_sidereal_time, latitude):
+    return np.sin(dec) * np.sin(latitude) + np.cos(dec) * np.cos(latitude) * np.cos(local_sidereal_time - ra)
+
+
+def get_airmass_grid(ra, dec, times, sites, airmass_limit=None):
+    """
+    Computes the airmass of many sidereal targets from many sites at many times in a single vectorized pass.
+
+    Airmasses at or above ``airmass_limit``, below the horizon, or while the sun is above astronomical twilight at the
+    site are set to NaN. Aberration and refraction are ignored, so altitudes agree with those from astroplan to within
+    about 20 arcseconds.
+
+    :param ra: Right Ascension of each target, in degrees
+    :type ra: array_like
+
+    :param dec: Declination of each target, in degrees
+    :type dec: array_like
+
+    :param times: Times at which to calculate the airmass
+    :type times: astropy.time.Time
+
+    :param sites: Dictionary of site details with ``latitude`` and ``longitude`` in degrees, as returned by
+                  ``get_visibility_sites``
+    :type sites: dict
+
+    :param airmass_limit: Maximum acceptable airmass, defaults to 10
+    :type airmass_limit: float
+
+    :returns: Dictionary of site name to an array of airmasses with one row per target and one column per time
+    :rtype: dict
+    """
+    if airmass_limit is None:
+        airmass_limit = 10
+    mjd = np.atleast_1d(times.utc.mjd)
+    target_ra, target_dec = precess(np.atleast_1d(ra), np.atleast_1d(dec), (mjd[0] + mjd[-1]) / 2)
+    sun_ra, sun_dec = sun_position(mjd)
+    gmst = greenwich_mean_sidereal_time(mjd)
+
+    site_names = list(sites.keys())
+    latitude = np.radians([sites[name]['latitude'] for name in site_names])[:, None]
+    longitude = np.radians([sites[name]['longitude'] for name in site_names])[:, None]
+    local_sidereal_time = gmst[None, :] + longitude  # (sites, times)
+
+    night = _sin_altitude(sun_ra, sun_dec, local_sidereal_time, latitude) <= np.sin(np.radians(TWILIGHT_SUN_ALTITUDE))
+    sin_altitude = _sin_altitude(target_ra[None, :, None], target_dec[None, :, None],
+                                 local_sidereal_time[:, None, :], latitude[:, :, None])  # (sites, targets, times)
+    with np.errstate(divide='ignore'):
+        airmass = 1 / sin_altitude
+    airmass[(airmass >= airmass_limit) | (airmass <= 1) | ~night[:, None, :]] = np.nan
+    return dict(zip(site_names, airmass))
+
+
+def get_local_night(longitude, when=None):
+    """
+    Determines the night that a time falls in at a site. A night runs from local mean noon to the following local mean
+    noon, and is identified by the local date on which it begins.
+
+    :param longitude: Longitude of the site, in degrees east
+    :type longitude: float
+
+    :param when: Time to find the night of, defaults to now
+    :type when: datetime
+
+    :returns: local date on which the night begins
+    :rtype: date
+    """
+    when = when or datetime.now(timezone.utc)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return (when.astimezone(timezone.utc) + timedelta(hours=longitude / 15 - 12)).date()
+
+
+def get_night_bounds(night, longitude):
+    """
+    Computes the local mean noons before and after a night at a site.
+
+    :param night: local date on which the night begins
+    :type night: date
+
+    :param longitude: Longitude of the site, in degrees east
+    :type longitude: float
+
+    :returns: start and end of the night, in UTC
+    :rtype: tuple
+    """
+    start = datetime.combine(night, time(12), tzinfo=timezone.utc) - timedelta(hours=longitude / 15)
+    return start, start + timedelta(days=1)
+
+
+def get_nightly_visibility(ra, dec, site_details, night, interval=10, airmass_limit=2):
+    """
+    Computes the visibility of many sidereal targets from a site during one night in a single vectorized pass.
+
+    :param ra: Right Ascension of each target, in degrees
+    :type ra: array_like
+
+    :param dec: Declination of each target, in degrees
+    :type dec: array_like
+
+    :param site_details: Site details with ``latitude`` and ``longitude`` in degrees
+    :type site_details: dict
+
+    :param night: local date on which the night begins
+    :type night: date
+
+    :param interval: time interval, in minutes, at which to calculate airmass within the night
+    :type interval: int
+
+    :param airmass_limit: maximum airmass at which a target is considered observable
+    :type airmass_limit: float
+
+    :returns: Dictionary with, for each target, the ``min_airmass`` during darkness and the ``observable_start`` and
+        ``observable_end`` of the period during which it is within the airmass limit, each of which is None if there
+        is no such time
+    :rtype: dict
+    """
+    night_start, _ = get_night_bounds(night, site_details['longitude'])
+    offsets = np.arange(0, 24 * 60, interval)
+    airmass = get_airmass_grid(ra, dec, Time(night_start) + offsets * units.minute, {'site': site_details})['site']
+
+    observable = airmass <= airmass_limit
+    any_observable = observable.any(axis=1)
+    first = np.argmax(observable, axis=1)
+    last = len(offsets) - 1 - np.argmax(observable[:, ::-1], axis=1)
+    min_airmass = np.fmin.reduce(airmass, axis=1)  # NaN only if the target is never above the horizon in darkness
+
+    def observable_time(index, is_observable):
+        return night_start + timedelta(minutes=int(offsets[index])) if is_observable else None
+
+    return {
+        'min_airmass': [None if np.isnan(value) else value for value in min_airmass.tolist()],
+        'observable_start': [observable_time(i, o) for i, o in zip(first, any_observable)],
+        'observable_end': [observable_time(i, o) for i, o in zip(last, any_observable)],
+    }
+
+
+def get_moon_ephemeris(start, days, step=0.2):
+    """
+    Returns a grid of positions and illuminations of the moon, which is shared by all targets. Grids start on the hour
+    at or before ``start`` and are cached, so that they are computed at most once an hour rather than on every request.
+
+    :param start: Time from which the grid should begin
+    :type start: datetime
+
+    :param days: Number of days covered by the grid
+    :type days: float
+
+    :param step: Interval between grid points, in days
+    :type step: float
+
+    :returns: Dictionary of ``mjd``, moon position ``vectors`` as cartesian unit vectors, and ``illumination`` arrays
+    :rtype: dict
+    """
+    start_mjd = floor(Time(start).utc.mjd * 24) / 24
+    key = MOON_EPHEMERIS_KEY.format(start=start_mjd, days=days, step=step)
+    ephemeris = cache.get(key)
+    if ephemeris is None:
+        mjd = start_mjd + np.arange(0, days, step)
+        times = Time(mjd, format='mjd', scale='utc')
+        moon = get_moon(times)
+        ephemeris = {
+            'mjd': mjd,
+            'vectors': radec_to_unit_vectors(moon.ra.deg, moon.dec.deg),
+            'illumination': np.asarray(moon_illumination(times)),
+        }
+        cache.set(key, ephemeris, MOON_EPHEMERIS_TIMEOUT)
+    return ephemeris
+
+
+def get_moon_separations(ra, dec, ephemeris):
+    """
+    Computes the separations between many sidereal targets and the moon at every point of a moon ephemeris grid.
+
+    :param ra: Right Ascension of each target, in degrees
+    :type ra: array_like
+
+    :param dec: Declination of each target, in degrees
+    :type dec: array_like
+
+    :param ephemeris: Moon ephemeris grid, as returned by ``get_moon_ephemeris``
+    :type ephemeris: dict
+
+    :returns: Separations, in degrees, with one row per target and one column per grid point
+    :rtype: numpy.ndarray
+    """
+    vectors = radec_to_unit_vectors(np.atleast_1d(ra), np.atleast_1d(dec))
+    return np.degrees(np.arccos(np.clip(vectors @ ephemeris['vectors'].T, -1, 1)))
+
+
+def get_moon_position(when=None):
+    """
+    Interpolates the position of the moon from an hourly moon ephemeris grid.
+
+    :param when: Time of the position, defaults to now
+    :type when: datetime
+
+    :returns: Right Ascension and Declination of the moon, in degrees
+    :rtype: tuple
+    """
+    when = Time(when or datetime.now(timezone.utc))
+    ephemeris = get_moon_ephemeris(when.datetime, 1, 1 / 24)
+    vector = np.array([np.interp(when.utc.mjd, ephemeris['mjd'], axis) for axis in ephemeris['vectors'].T])
+    x, y, z = vector / np.linalg.norm(vector)
+    return np.degrees(np.arctan2(y, x)) % 360, np.degrees(np.arcsin(z))
@@ -1,12 +1,21 @@
 from django_filters import rest_framework as drf_filters
 from guardian.mixins import PermissionListMixin
 from guardian.shortcuts import get_objects_for_user
+from rest_framework import status
+from rest_framework.decorators import action
 from rest_framework.mixins import DestroyModelMixin, RetrieveModelMixin
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
+from tom_common.parsers import NDJSONParser
+from tom_targets.bulk import bulk_create_targets, bulk_delete_targets, bulk_update_targets
+from tom_targets.crossmatch import crossmatch_targets
 from tom_targets.filters import TargetFilter
 from tom_targets.models import TargetExtra, TargetName
-from tom_targets.serializers import TargetSerializer, TargetExtraSerializer, TargetNameSerializer
+from tom_targets.serializers import (
+    TargetSerializer, TargetExtraSerializer, TargetNameSerializer, TargetCrossMatchSerializer
+)
 
 
 permissions_map = {  # TODO: Use the built-in DRF mapping or just switch to DRF entirely.
@@ -44,6 +53,8 @@ class TargetViewSet(ModelViewSet, PermissionListMixin):
 
     ``TargetName`` and ``TargetExtra`` objects can only be deleted or specifically retrieved via the
     ``/api/targetname/`` or ``/api/targetextra/`` endpoints.
+
+    Many targets can be created, updated or deleted at once with the ``/api/targets/bulk/`` endpoint. See ``bulk``.
     """
     serializer_class = TargetSerializer
     filter_backends = (drf_filters.DjangoFilterBackend,)
@@ -51,7 +62,63 @@ class TargetViewSet(ModelViewSet, PermissionListMixin):
 
     def get_queryset(self):
         permission_required = permissions_map.get(self.request.method)
-        return get_objects_for_user(self.request.user, f'tom_targets.{permission_required}')
+        return get_objects_for_user(self.request.user, f'tom_targets.{permission_required}').with_display_data()
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Creates (``POST``), updates (``PATCH``) or deletes (``DELETE``) many targets in one request. The body is a JSON
+        array, or newline-delimited JSON (``Content-Type: application/x-ndjson``) with one item per line. Items are
+        targets in the same form as for the ``CREATE`` endpoint, partial targets with the ``id`` of the target to
+        update, or the ids of the targets to delete. All of the valid items are saved in one transaction, with bulk
+        queries, and invalid items are skipped.
+
+        The response has one result per item, in order, with the ``index`` of the item, a ``status`` of ``created``,
+        ``updated``, ``deleted`` or ``failed``, and the ``id`` of the target, or the ``errors`` of the item.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of items.'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'POST':
+            results = bulk_create_targets(items, context=self.get_serializer_context())
+        elif request.method == 'PATCH':
+            results = bulk_update_targets(items, request.user, context=self.get_serializer_context())
+        else:
+            results = bulk_delete_targets(items, request.user)
+        return Response({'results': results})
+
+
+class TargetCrossMatchViewSet(GenericViewSet):
+    """
+    Viewset for cross-matching many positions against the ``Target`` table in one call. Only ``POST`` is permitted.
+
+    The request body contains lists of ``ra``, ``dec`` and ``radius`` values in degrees, where ``radius`` may also be a
+    single value applied to every position. The response contains, for each position in order, the nearest ``Target``
+    within the radius that the user is permitted to view, or ``null`` if there is none:
+
+    ``{"ra": [83.82, 10.0], "dec": [-5.39, 10.0], "radius": 0.001}``
+    """
+    serializer_class = TargetCrossMatchSerializer
+
+    def get_queryset(self):
+        return get_objects_for_user(self.request.user, 'tom_targets.view_target')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ra = serializer.validated_data['ra']
+        dec = serializer.validated_data['dec']
+        radius = serializer.validated_data['radius']
+
+        matches = crossmatch_targets(ra, dec, radius if len(radius) > 1 else radius[0], queryset=self.get_queryset())
+        results = []
+        for index, match in enumerate(matches):
+            result = {'ra': ra[index], 'dec': dec[index], 'target': None, 'separation': None}
+            if match:
+                target, separation = match
+                result.update({'target': {'id': target.id, 'name': target.name}, 'separation': separation})
+            results.append(result)
+        return Response({'results': results})
 
 
 class TargetNameViewSet(DestroyModelMixin, PermissionListMixin, RetrieveModelMixin, GenericViewSet):
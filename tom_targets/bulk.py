@@ -0,0 +1,421 @@
+from collections import Counter
+
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from guardian.models import GroupObjectPermission
+from guardian.shortcuts import get_objects_for_user
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from tom_common.hooks import run_multiple_targets_post_save
+from tom_targets.crossmatch import invalidate_crossmatch_index
+from tom_targets.models import Target, TargetExtra, TargetName
+from tom_targets.name_index import rebuild_name_index
+from tom_targets.serializers import TargetBulkItemSerializer
+from tom_targets.sky_index import sky_pixel
+from tom_targets.utils import _remove_name_conflicts, _save_target_batch
+
+# Permissions on a target that are given to each of its groups, as by TargetSerializer
+GROUP_PERMISSIONS = ['view_target', 'change_target', 'delete_target']
+# Number of objects in each query that inserts or updates rows
+BULK_BATCH_SIZE = 1000
+
+
+def _created(index, target):
+    return {'index': index, 'status': 'created', 'id': target.id, 'name': target.name}
+
+
+def _updated(index, target):
+    return {'index': index, 'status': 'updated', 'id': target.id, 'name': target.name}
+
+
+def _failed(index, errors):
+    return {'index': index, 'status': 'failed', 'errors': errors}
+
+
+def _get_group_ids(validated_data, groups, index, results):
+    """
+    Returns the ids of the groups of a validated target, or None after recording a failure if any group does not exist.
+    """
+    group_ids = [group['id'] for group in validated_data.pop('groups', []) if group.get('id') is not None]
+    missing_ids = [group_id for group_id in group_ids if group_id not in groups]
+    if missing_ids:
+        results[index] = _failed(index, {'groups': [f'Group with id {group_id} does not exist.'
+                                                    for group_id in missing_ids]})
+        return None
+    return group_ids
+
+
+def _validate(serializer, item):
+    """
+    Validates one item with a serializer, which is reused for all of the items so that its fields are only built once.
+    Returns the validated data and the errors, one of which is None.
+    """
+    try:
+        return serializer.run_validation(item), None
+    except ValidationError as e:
+        return None, as_serializer_error(e)
+
+
+def _fetch_groups(items):
+    group_ids = set()
+    for item in items:
+        groups = item.get('groups') if isinstance(item, dict) else None
+        for group in groups if isinstance(groups, list) else []:
+            if isinstance(group, dict) and isinstance(group.get('id'), int):
+                group_ids.add(group['id'])
+    return Group.objects.in_bulk(group_ids)
+
+
+def assign_group_permissions(group_targets):
+    """
+    Gives groups permission to view, change and delete targets, with one insert for all of the permissions.
+
+    :param group_targets: ``(group id, target)`` tuples
+    :type group_targets: list
+    """
+    content_type = ContentType.objects.get_for_model(Target)
+    permissions = Permission.objects.filter(content_type=content_type, codename__in=GROUP_PERMISSIONS)
+    GroupObjectPermission.objects.bulk_create([
+        GroupObjectPermission(group_id=group_id, permission=permission, content_type=content_type,
+                              object_pk=str(target.pk))
+        for group_id, target in group_targets for permission in permissions
+    ], batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+
+
+def bulk_create_targets(items, context=None):
+    """
+    Creates targets, with their aliases, extras and groups, from a list of their serialized representations, as
+    accepted by ``TargetSerializer``. Each target is validated on its own, but the names and aliases of all of them are
+    checked against the database at once, and the valid targets are saved in one transaction, with one bulk insert
+    per model. Invalid targets are reported and skipped.
+
+    Rather than ``target_post_save`` for each target, the ``multiple_targets_post_save`` hook is run once with all of
+    the created targets, if it is configured.
+
+    :param items: Serialized targets
+    :type items: list
+
+    :param context: Context of the serializer that validates each target
+    :type context: dict
+
+    :returns: one result per item, in order, with a status of ``created`` or ``failed``
+    :rtype: list
+    """
+    results = [None] * len(items)
+    groups = _fetch_groups(items)
+    serializer = TargetBulkItemSerializer(context=context)
+    batch = []
+    target_groups = {}
+    for index, item in enumerate(items):
+        validated_data, errors = _validate(serializer, item)
+        if errors:
+            results[index] = _failed(index, errors)
+            continue
+        validated_data = dict(validated_data)
+        group_ids = _get_group_ids(validated_data, groups, index, results)
+        if group_ids is None:
+            continue
+        aliases = [alias['name'] for alias in validated_data.pop('aliases', [])]
+        extras = [(extra['key'], extra['value']) for extra in validated_data.pop('targetextra_set', [])]
+        target = Target(**validated_data)
+        if target.name in aliases:
+            results[index] = _failed(index, {'aliases': [
+                f'Alias \'{target.name}\' conflicts with Target name \'{target.name}\'.'
+            ]})
+            continue
+        target_groups[index] = group_ids
+        batch.append((index, target, extras, aliases))
+
+    for index, conflicts in _remove_name_conflicts(batch):
+        results[index] = _failed(index, {'name': ['Name(s) already in use: {0}'.format(', '.join(conflicts))]})
+
+    created_targets = []
+    if batch:
+        try:
+            with transaction.atomic():
+                created_targets = _save_target_batch(batch)
+                assign_group_permissions([
+                    (group_id, target) for index, target, _, _ in batch for group_id in target_groups[index]
+                ])
+        except DatabaseError as e:
+            for index, _, _, _ in batch:
+                results[index] = _failed(index, {'non_field_errors': [str(e)]})
+        else:
+            for index, target, _, _ in batch:
+                results[index] = _created(index, target)
+
+    if created_targets:
+        run_multiple_targets_post_save(created_targets, created=True)
+    return results
+
+
+def _plan_aliases(target, name, aliases, index, results):
+    """
+    Returns the new aliases of a target, and its existing aliases with their new names, as ``(alias, name)`` tuples,
+    without changing them. Returns None after recording a failure if an alias is invalid.
+    """
+    existing_aliases = {alias.id: alias for alias in target.aliases.all()}
+    new_aliases = []
+    renamed_aliases = []
+    for alias_data in aliases:
+        if 'name' not in alias_data:
+            results[index] = _failed(index, {'aliases': [{'name': ['This field is required.']}]})
+            return None
+        if alias_data['name'] == name:
+            results[index] = _failed(index, {'aliases': [
+                f'Alias \'{alias_data["name"]}\' conflicts with Target name \'{name}\'.'
+            ]})
+            return None
+        if alias_data.get('id'):
+            alias = existing_aliases.get(alias_data['id'])
+            if alias is None:
+                results[index] = _failed(index, {'aliases': [
+                    f'TargetName identified by id \'{alias_data["id"]}\' is not an alias of Target \'{target.name}\''
+                ]})
+                return None
+            if alias.name != alias_data['name']:
+                renamed_aliases.append((alias, alias_data['name']))
+        else:
+            new_aliases.append(TargetName(target=target, name=alias_data['name']))
+    return new_aliases, renamed_aliases
+
+
+def _plan_extras(target, extras, index, results):
+    """
+    Returns the new extras of a target, and its existing extras with their new keys and values, as
+    ``(extra, key, value)`` tuples, without changing them. Returns None after recording a failure if an extra does not
+    belong to the target, or if a key would be repeated.
+    """
+    existing_extras = {extra.id: extra for extra in target.targetextra_set.all()}
+    keys = {extra.id: extra.key for extra in existing_extras.values()}
+    for extra_data in extras:
+        if 'key' not in extra_data:
+            results[index] = _failed(index, {'targetextra_set': [{'key': ['This field is required.']}]})
+            return None
+        if extra_data.get('id'):
+            if extra_data['id'] not in existing_extras:
+                results[index] = _failed(index, {'targetextra_set': [
+                    f'TargetExtra identified by id \'{extra_data["id"]}\' does not belong to Target \'{target.name}\''
+                ]})
+                return None
+            keys[extra_data['id']] = extra_data['key']
+        else:
+            keys[object()] = extra_data['key']
+    if len(set(keys.values())) < len(keys):
+        results[index] = _failed(index, {'targetextra_set': [
+            f'Target \'{target.name}\' would have more than one TargetExtra with the same key.'
+        ]})
+        return None
+
+    new_extras = []
+    changed_extras = []
+    for extra_data in extras:
+        if extra_data.get('id'):
+            extra = existing_extras[extra_data['id']]
+            changed_extras.append((extra, extra_data['key'], extra_data.get('value', extra.value)))
+        else:
+            new_extras.append(TargetExtra(target=target, key=extra_data['key'], value=extra_data.get('value', '')))
+    return new_extras, changed_extras
+
+
+def _find_update_name_conflicts(updates):
+    """
+    Returns the names, by index of the update, that would be used by more than one target or alias after the updates.
+    The names are checked against the database with one query per model.
+    """
+    target_names = {}
+    alias_names = {}
+    for update in updates:
+        index = update['index']
+        target_names.setdefault(update['name'], []).append((index, update['target'].id))
+        for alias in update['new_aliases']:
+            alias_names.setdefault(alias.name, []).append((index, None))
+        for alias, name in update['renamed_aliases']:
+            alias_names.setdefault(name, []).append((index, alias.id))
+
+    conflicts = {}
+    owners = Target.objects.filter(name__in=target_names).values_list('name', 'id')
+    for name, target_id in owners:
+        for index, updated_id in target_names[name]:
+            if updated_id != target_id:
+                conflicts.setdefault(index, []).append(name)
+    owners = TargetName.objects.filter(name__in=alias_names).values_list('name', 'id')
+    for name, alias_id in owners:
+        for index, updated_id in alias_names[name]:
+            if updated_id != alias_id:
+                conflicts.setdefault(index, []).append(name)
+    for names in (target_names, alias_names):
+        for name, users in names.items():
+            for index, _ in users[1:]:
+                conflicts.setdefault(index, []).append(name)
+    return conflicts
+
+
+def bulk_update_targets(items, user, context=None):
+    """
+    Updates targets, with their aliases, extras and groups, from a list of partial serialized representations, each
+    with the ``id`` of the target. As with ``TargetSerializer``, aliases and extras with an ``id`` are updated, others
+    are created, and groups are given permissions on the target. The targets that the user may change are read in one
+    query, the names of all of them are checked against the database at once, and the valid updates are saved in one
+    transaction, with one bulk update or insert per model. Invalid updates, and updates of a target that is updated by
+    more than one item, are reported and skipped.
+
+    Rather than ``target_post_save`` for each target, the ``multiple_targets_post_save`` hook is run once with all of
+    the updated targets, if it is configured.
+
+    :param items: Partial serialized targets, each with an ``id``
+    :type items: list
+
+    :param user: The user that updates the targets
+    :type user: User
+
+    :param context: Context of the serializer that validates each target
+    :type context: dict
+
+    :returns: one result per item, in order, with a status of ``updated`` or ``failed``
+    :rtype: list
+    """
+    results = [None] * len(items)
+    item_ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+    id_counts = Counter(target_id for target_id in item_ids if isinstance(target_id, int))
+    targets = get_objects_for_user(user, 'tom_targets.change_target').filter(
+        pk__in=list(id_counts)
+    ).prefetch_related('aliases', 'targetextra_set').in_bulk()
+    groups = _fetch_groups(items)
+    serializer = TargetBulkItemSerializer(partial=True, context=context)
+
+    # Each target is changed only after all of the checks on its update have passed
+    updates = []
+    for index, (item, target_id) in enumerate(zip(items, item_ids)):
+        if not isinstance(target_id, int):
+            results[index] = _failed(index, {'id': ['This field is required.']})
+            continue
+        if id_counts[target_id] > 1:
+            results[index] = _failed(index, {'id': ['The target is updated by more than one item.']})
+            continue
+        target = targets.get(target_id)
+        if target is None:
+            results[index] = _failed(index, {'id': ['Not found.']})
+            continue
+        validated_data, errors = _validate(serializer, item)
+        if errors:
+            results[index] = _failed(index, errors)
+            continue
+        validated_data = dict(validated_data)
+        group_ids = _get_group_ids(validated_data, groups, index, results)
+        if group_ids is None:
+            continue
+        aliases = validated_data.pop('aliases', [])
+        extras = validated_data.pop('targetextra_set', [])
+        name = validated_data.get('name', target.name)
+        planned_aliases = _plan_aliases(target, name, aliases, index, results)
+        if planned_aliases is None:
+            continue
+        planned_extras = _plan_extras(target, extras, index, results)
+        if planned_extras is None:
+            continue
+        updates.append({
+            'index': index, 'target': target, 'name': name, 'fields': validated_data, 'group_ids': group_ids,
+            'new_aliases': planned_aliases[0], 'renamed_aliases': planned_aliases[1],
+            'new_extras': planned_extras[0], 'changed_extras': planned_extras[1],
+        })
+
+    conflicts = _find_update_name_conflicts(updates)
+    for index, names in conflicts.items():
+        results[index] = _failed(index, {'name': ['Name(s) already in use: {0}'.format(', '.join(names))]})
+    updates = [update for update in updates if update['index'] not in conflicts]
+
+    updated_targets = []
+    if updates:
+        now = timezone.now()
+        update_fields = {'modified'}
+        new_aliases, renamed_aliases, new_extras, changed_extras, group_targets = [], [], [], [], []
+        for update in updates:
+            target = update['target']
+            for field, value in update['fields'].items():
+                setattr(target, field, value)
+            target.modified = now
+            target.sky_pixel = sky_pixel(target.ra, target.dec)
+            update_fields.update(update['fields'])
+            updated_targets.append(target)
+            for alias, name in update['renamed_aliases']:
+                alias.name = name
+                alias.modified = now
+                renamed_aliases.append(alias)
+            new_aliases += update['new_aliases']
+            for extra, key, value in update['changed_extras']:
+                extra.key = key
+                extra.value = value
+                changed_extras.append(extra)
+            new_extras += update['new_extras']
+            group_targets += [(group_id, target) for group_id in update['group_ids']]
+        if update_fields & {'ra', 'dec'}:
+            update_fields.add('sky_pixel')
+        for extra in new_extras + changed_extras:
+            extra.set_typed_values()
+        try:
+            with transaction.atomic():
+                Target.objects.bulk_update(updated_targets, list(update_fields), batch_size=BULK_BATCH_SIZE)
+                TargetName.objects.bulk_update(renamed_aliases, ['name', 'modified'], batch_size=BULK_BATCH_SIZE)
+                TargetName.objects.bulk_create(new_aliases, batch_size=BULK_BATCH_SIZE)
+                TargetExtra.objects.bulk_update(
+                    changed_extras, ['key', 'value', 'float_value', 'bool_value', 'time_value'],
+                    batch_size=BULK_BATCH_SIZE
+                )
+                TargetExtra.objects.bulk_create(new_extras, batch_size=BULK_BATCH_SIZE)
+                assign_group_permissions(group_targets)
+                # bulk_update does not send post_save, which would otherwise update the name index and invalidate the
+                # cross-match index
+                rebuild_name_index(updated_targets)
+        except DatabaseError as e:
+            for update in updates:
+                results[update['index']] = _failed(update['index'], {'non_field_errors': [str(e)]})
+            updated_targets = []
+        else:
+            invalidate_crossmatch_index()
+            for update in updates:
+                results[update['index']] = _updated(update['index'], update['target'])
+
+    if updated_targets:
+        run_multiple_targets_post_save(updated_targets, created=False)
+    return results
+
+
+def bulk_delete_targets(items, user):
+    """
+    Deletes targets, given as ids or as objects with an ``id``, that the user may delete, in one transaction.
+
+    :param items: Target ids, or objects with the ``id`` of each target
+    :type items: list
+
+    :param user: The user that deletes the targets
+    :type user: User
+
+    :returns: one result per item, in order, with a status of ``deleted`` or ``failed``
+    :rtype: list
+    """
+    target_ids = [item.get('id') if isinstance(item, dict) else item for item in items]
+    deletable_ids = set(get_objects_for_user(user, 'tom_targets.delete_target').filter(
+        pk__in=[target_id for target_id in target_ids if isinstance(target_id, int)]
+    ).values_list('id', flat=True))
+    results = []
+    for index, target_id in enumerate(target_ids):
+        if not isinstance(target_id, int):
+            results.append(_failed(index, {'id': ['This field is required.']}))
+        elif target_id not in deletable_ids:
+            results.append(_failed(index, {'id': ['Not found.']}))
+        else:
+            results.append({'index': index, 'status': 'deleted', 'id': target_id})
+    if deletable_ids:
+        try:
+            with transaction.atomic():
+                Target.objects.filter(pk__in=deletable_ids).delete()
+        except DatabaseError as e:
+            results = [
+                _failed(index, {'non_field_errors': [str(e)]}) if result['status'] == 'deleted' else result
+                for index, result in enumerate(results)
+            ]
+    return results
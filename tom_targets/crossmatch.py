@@ -0,0 +1,131 @@
+import threading
+import uuid
+
+import numpy as np
+from django.core.cache import cache
+from scipy.spatial import cKDTree
+
+from tom_observations.visibility import radec_to_unit_vectors
+from tom_targets.models import Target
+
+CROSSMATCH_INDEX_VERSION_KEY = 'tom_targets_crossmatch_index_version'
+
+_index_lock = threading.Lock()
+_index = None
+
+
+class TargetCrossMatchIndex:
+    """
+    In-memory KD-tree over the unit vectors of all ``Target`` objects with coordinates. Distances in the tree are
+    chord lengths on the unit sphere, which are monotonic in angular separation.
+
+    :param version: Identifier of the state of the ``Target`` table this index was built from
+    :type version: str
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        rows = np.array(
+            Target.objects.filter(ra__isnull=False, dec__isnull=False).values_list('id', 'ra', 'dec'), dtype=float
+        ).reshape(-1, 3)
+        self.target_ids = rows[:, 0].astype(int)
+        self.vectors = radec_to_unit_vectors(rows[:, 1], rows[:, 2])
+        self.tree = cKDTree(self.vectors) if len(self.target_ids) else None
+
+    def query(self, ra, dec, radius):
+        """
+        Finds all indexed targets within ``radius`` of each position.
+
+        :param ra: Right Ascension of each position, in degrees
+        :type ra: array_like
+
+        :param dec: Declination of each position, in degrees
+        :type dec: array_like
+
+        :param radius: Search radius of each position, or one radius for all positions, in degrees
+        :type radius: array_like or float
+
+        :returns: list with, for each position, a tuple of arrays of matching target ids and their separations in
+                  degrees, sorted by separation
+        :rtype: list
+        """
+        vectors = radec_to_unit_vectors(ra, dec)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(vectors),))
+        if self.tree is None:
+            return [(np.array([], dtype=int), np.array([])) for _ in range(len(vectors))]
+
+        chords = 2 * np.sin(np.radians(np.minimum(radius, 180)) / 2)
+        candidates = self.tree.query_ball_point(vectors, r=chords)
+
+        results = []
+        for vector, indices in zip(vectors, candidates):
+            indices = np.asarray(indices, dtype=int)
+            separations = np.degrees(np.arccos(np.clip(self.vectors[indices] @ vector, -1, 1)))
+            order = np.argsort(separations)
+            results.append((self.target_ids[indices[order]], separations[order]))
+        return results
+
+
+def invalidate_crossmatch_index():
+    """
+    Marks the cached cross-match index as stale in every process sharing the Django cache.
+    """
+    cache.set(CROSSMATCH_INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_crossmatch_index():
+    """
+    Returns the process-local cross-match index, rebuilding it if a ``Target`` has been saved or deleted since it was
+    built.
+
+    :returns: up-to-date cross-match index
+    :rtype: TargetCrossMatchIndex
+    """
+    global _index
+    version = cache.get(CROSSMATCH_INDEX_VERSION_KEY)
+    if version is None:
+        # Another process may have set the version in the meantime, in which case add() leaves it untouched
+        cache.add(CROSSMATCH_INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CROSSMATCH_INDEX_VERSION_KEY)
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = TargetCrossMatchIndex(version=version)
+        return _index
+
+
+def crossmatch_targets(ra, dec, radius, queryset=None):
+    """
+    Finds the nearest ``Target`` within ``radius`` of each of many positions in a single vectorized pass.
+
+    :param ra: Right Ascension of each position, in degrees
+    :type ra: array_like
+
+    :param dec: Declination of each position, in degrees
+    :type dec: array_like
+
+    :param radius: Search radius of each position, or one radius for all positions, in degrees
+    :type radius: array_like or float
+
+    :param queryset: Optional set of targets to restrict the matches to, e.g. the targets a user may view
+    :type queryset: QuerySet
+
+    :returns: list with, for each position, a tuple of the nearest matching ``Target`` and its separation in degrees,
+              or None if there is no match
+    :rtype: list
+    """
+    matches = get_crossmatch_index().query(ra, dec, radius)
+
+    candidate_ids = set(np.concatenate([ids for ids, _ in matches]).tolist()) if matches else set()
+    if queryset is None:
+        queryset = Target.objects.all()
+    targets = queryset.filter(id__in=candidate_ids).in_bulk() if candidate_ids else {}
+
+    results = []
+    for ids, separations in matches:
+        for target_id, separation in zip(ids.tolist(), separations.tolist()):
+            if target_id in targets:
+                results.append((targets[target_id], separation))
+                break
+        else:
+            results.append(None)
+    return results
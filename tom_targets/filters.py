@@ -1,11 +1,20 @@
+from datetime import datetime, timezone
+from functools import reduce
 from math import radians
+from operator import or_
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.models import ExpressionWrapper, FloatField, Q
+from django.db.models.functions import Greatest, Least
 from django.db.models.functions.math import ACos, Cos, Radians, Pi, Sin
 import django_filters
 
-from tom_targets.models import Target, TargetList
+from tom_observations.models import NightlyVisibility
+from tom_observations.visibility import get_moon_position
+from tom_targets.models import Target, TargetExtra, TargetList
+from tom_targets.name_index import search_target_ids
+from tom_targets.sky_index import sky_pixel_ranges
 
 
 def filter_for_field(field):
@@ -23,24 +32,78 @@ def filter_for_field(field):
         )
 
 
+def parse_observable_tonight(value):
+    """
+    Parses the value of the observable tonight filter, which is a site and a maximum airmass, optionally preceded by
+    the facility of the site, separated by commas, e.g. ``LCO, Siding Spring, 2``.
+
+    :returns: tuple of the facility, or None, the site and the maximum airmass
+    :rtype: tuple
+
+    :raises ValidationError: if the value is not in this format
+    """
+    parts = [part.strip() for part in value.split(',')]
+    if len(parts) not in (2, 3) or not all(parts):
+        raise ValidationError(
+            'Enter a site and a maximum airmass, optionally preceded by a facility, separated by commas.'
+        )
+    try:
+        airmass = float(parts[-1])
+    except ValueError:
+        raise ValidationError('The maximum airmass must be a number.')
+    return (parts[0] if len(parts) == 3 else None), parts[-2], airmass
+
+
+def extra_field_target_ids(name, **lookups):
+    """
+    Builds a subquery of the ids of targets with an extra field that matches the lookups. Each extra field filter is a
+    separate subquery, which is answered from the (key, typed value) indexes of ``TargetExtra``, rather than a join on
+    ``TargetExtra``, so that combining several extra field filters does not join ``TargetExtra`` with itself.
+    """
+    return TargetExtra.objects.filter(key=name, **lookups).values('target_id')
+
+
+def range_lookups(field_name, value):
+    """
+    Returns the lookups of a range filter value, of which either bound may be omitted.
+    """
+    lookups = {}
+    if value.start is not None:
+        lookups[f'{field_name}__gte'] = value.start
+    if value.stop is not None:
+        lookups[f'{field_name}__lte'] = value.stop
+    return lookups
+
+
 def filter_number(queryset, name, value):
-    return queryset.filter(
-        targetextra__key=name, targetextra__float_value__gte=value.start, targetextra__float_value__lte=value.stop
-    )
+    return queryset.filter(pk__in=extra_field_target_ids(name, **range_lookups('float_value', value)))
 
 
 def filter_datetime(queryset, name, value):
-    return queryset.filter(
-        targetextra__key=name, targetextra__time_value__gte=value.start, targetextra__time_value__lte=value.stop
-    )
+    return queryset.filter(pk__in=extra_field_target_ids(name, **range_lookups('time_value', value)))
 
 
 def filter_boolean(queryset, name, value):
-    return queryset.filter(targetextra__key=name, targetextra__bool_value=value)
+    return queryset.filter(pk__in=extra_field_target_ids(name, bool_value=value))
 
 
 def filter_text(queryset, name, value):
-    return queryset.filter(targetextra__key=name, targetextra__value__icontains=value)
+    return queryset.filter(pk__in=extra_field_target_ids(name, value__icontains=value))
+
+
+def separation_from(ra, dec):
+    """
+    Builds an expression for the angular separation, in degrees, of targets from the given coordinates. Formula is from
+    Wikipedia: https://en.wikipedia.org/wiki/Angular_distance
+    """
+    # The cosine is clamped to [-1, 1] so that rounding error cannot push it outside the domain of ACos
+    return ExpressionWrapper(
+        180 * ACos(Greatest(Least(
+            (Sin(radians(dec)) * Sin(Radians('dec'))) +
+            (Cos(radians(dec)) * Cos(Radians('dec')) * Cos(radians(ra) - Radians('ra'))),
+            1.0), -1.0)
+        ) / Pi(), FloatField()
+    )
 
 
 class TargetFilter(django_filters.FilterSet):
@@ -57,7 +120,7 @@ class TargetFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(method='filter_name', label='Name')
 
     def filter_name(self, queryset, name, value):
-        return queryset.filter(Q(name__icontains=value) | Q(aliases__name__icontains=value)).distinct()
+        return queryset.filter(pk__in=search_target_ids(value))
 
     cone_search = django_filters.CharFilter(method='filter_cone_search', label='Cone Search',
                                             help_text='RA, Dec, Search Radius (degrees)')
@@ -71,16 +134,15 @@ class TargetFilter(django_filters.FilterSet):
         the RA/Dec of the specified target. Formula is from Wikipedia: https://en.wikipedia.org/wiki/Angular_distance
         The result is converted to radians.
 
-        Cone search is preceded by a square search to reduce the search radius before annotating the queryset, in
-        order to make the query faster.
+        Cone search is preceded by a lookup on the indexed ``sky_pixel`` column, restricting the queryset to targets in
+        sky pixels that overlap the cone before annotating it. The pixel lookup is correct across RA=0/360 and at the
+        celestial poles.
         """
         if name == 'cone_search':
             ra, dec, radius = value.split(',')
         elif name == 'target_cone_search':
             target_name, radius = value.split(',')
-            targets = Target.objects.filter(
-                Q(name__icontains=target_name) | Q(aliases__name__icontains=target_name)
-            ).distinct()
+            targets = Target.objects.filter(pk__in=search_target_ids(target_name))[:2]
             if len(targets) == 1:
                 ra = targets[0].ra
                 dec = targets[0].dec
@@ -89,19 +151,48 @@ class TargetFilter(django_filters.FilterSet):
 
         ra = float(ra)
         dec = float(dec)
+        radius = float(radius)
 
-        double_radius = float(radius) * 2
-        queryset = queryset.filter(ra__gte=ra - double_radius, ra__lte=ra + double_radius,
-                                   dec__gte=dec - double_radius, dec__lte=dec + double_radius)
+        pixel_ranges = sky_pixel_ranges(ra, dec, radius)
+        queryset = queryset.filter(
+            reduce(or_, [Q(sky_pixel__gte=low, sky_pixel__lte=high) for low, high in pixel_ranges])
+        )
 
-        separation = ExpressionWrapper(
-            180 * ACos(
-                (Sin(radians(dec)) * Sin(Radians('dec'))) +
-                (Cos(radians(dec)) * Cos(Radians('dec')) * Cos(radians(ra) - Radians('ra')))
-            ) / Pi(), FloatField()
+        return queryset.annotate(separation=separation_from(ra, dec)).filter(separation__lte=radius)
+
+    moon_separation = django_filters.NumberFilter(method='filter_moon_separation', label='Moon Separation',
+                                                  help_text='Minimum current separation from the moon (degrees)')
+
+    def filter_moon_separation(self, queryset, name, value):
+        """
+        Filters for targets that are currently further than the specified number of degrees from the moon. The position
+        of the moon is interpolated from the cached moon ephemeris grid, and the separations of all targets are
+        computed by the database.
+        """
+        moon_ra, moon_dec = get_moon_position()
+        return queryset.annotate(moon_separation=separation_from(moon_ra, moon_dec)).filter(
+            moon_separation__gt=value
         )
 
-        return queryset.annotate(separation=separation).filter(separation__lte=radius)
+    observable_tonight = django_filters.CharFilter(method='filter_observable_tonight', label='Observable Tonight',
+                                                   help_text='[Facility,] Site, Maximum Airmass',
+                                                   validators=[parse_observable_tonight])
+
+    def filter_observable_tonight(self, queryset, name, value):
+        """
+        Filters for targets that reach the specified airmass or better during darkness tonight at the specified site,
+        using the visibility precomputed by the ``computevisibility`` management command. Targets whose visibility has
+        not been computed are excluded. Without a facility, the site is matched at any facility that has a site of
+        that name.
+        """
+        facility, site, airmass = parse_observable_tonight(value)
+        now = datetime.now(timezone.utc)
+        visible_targets = NightlyVisibility.objects.filter(
+            site=site, night_start__lte=now, night_end__gt=now, min_airmass__lte=airmass
+        )
+        if facility:
+            visible_targets = visible_targets.filter(facility=facility)
+        return queryset.filter(id__in=visible_targets.values('target_id'))
 
     # hide target grouping list if user not logged in
     def get_target_list_queryset(request):
@@ -123,4 +214,4 @@ class TargetFilter(django_filters.FilterSet):
 
     class Meta:
         model = Target
-        fields = ['type', 'name', 'key', 'value', 'cone_search', 'targetlist__name']
+        fields = ['type', 'name', 'key', 'value', 'cone_search', 'targetlist__name', 'observable_tonight']
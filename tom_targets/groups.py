@@ -1,6 +1,65 @@
 from .filters import TargetFilter
-from .models import Target
+from .models import Target, TargetList
 from django.contrib import messages
+from django.db import transaction
+from guardian.shortcuts import get_objects_for_user
+
+# Model of the table of memberships of targets in target groupings
+TargetListMembership = TargetList.targets.through
+# Number of target ids in each query that adds or removes memberships
+MEMBERSHIP_BATCH_SIZE = 500
+
+
+def _split_targets(target_queryset, grouping_object, request):
+    """
+    Splits the targets of a queryset into those that are in a grouping and those that are not, as lists of ids and
+    names, and the targets that the user is not permitted to change, as a list of failures. The targets, the targets
+    that the user may change, and the members of the grouping are each read in one query.
+    """
+    # Object permissions only, as with request.user.has_perm('tom_targets.change_target', target)
+    changeable_ids = set(get_objects_for_user(
+        request.user, 'tom_targets.change_target', klass=target_queryset, accept_global_perms=False
+    ).values_list('id', flat=True))
+    member_ids = set(TargetListMembership.objects.filter(
+        targetlist=grouping_object, target__in=target_queryset
+    ).values_list('target_id', flat=True))
+
+    members = []
+    non_members = []
+    failure_targets = []
+    seen_ids = set()
+    if not target_queryset.ordered:
+        # Reading only ids and names may use an index in name order, rather than the order of the table
+        target_queryset = target_queryset.order_by('pk')
+    for target_id, name in target_queryset.values_list('id', 'name'):
+        if target_id in seen_ids:
+            continue
+        seen_ids.add(target_id)
+        if target_id not in changeable_ids:
+            failure_targets.append((name, 'Permission denied.',))
+        elif target_id in member_ids:
+            members.append((target_id, name))
+        else:
+            non_members.append((target_id, name))
+    return members, non_members, failure_targets
+
+
+def _add_memberships(grouping_object, target_ids):
+    TargetListMembership.objects.bulk_create(
+        [TargetListMembership(targetlist_id=grouping_object.id, target_id=target_id) for target_id in target_ids],
+        batch_size=MEMBERSHIP_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def _remove_memberships(target_ids, grouping_object=None):
+    """
+    Removes targets from a grouping, or from all groupings if none is given.
+    """
+    memberships = TargetListMembership.objects.all()
+    if grouping_object is not None:
+        memberships = memberships.filter(targetlist=grouping_object)
+    for i in range(0, len(target_ids), MEMBERSHIP_BATCH_SIZE):
+        memberships.filter(target_id__in=target_ids[i:i + MEMBERSHIP_BATCH_SIZE]).delete()
 
 
 def add_all_to_grouping(filter_data, grouping_object, request):
@@ -17,26 +76,20 @@ def add_all_to_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []  # targets that are already in the grouping
-    failure_targets = []
     try:
         target_queryset = TargetFilter(request=request, data=filter_data, queryset=Target.objects.all()).qs
     except Exception:
         messages.error(request, "Error with filter parameters. No target(s) were added to group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            if not request.user.has_perm('tom_targets.change_target', target_object):
-                failure_targets.append((target_object.name, 'Permission denied.',))
-            elif target_object in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append((target_object.pk, e,))
+    members, non_members, failure_targets = _split_targets(target_queryset, grouping_object, request)
+    warning_targets = [name for _, name in members]  # targets that are already in the grouping
+    success_targets = []
+    try:
+        _add_memberships(grouping_object, [target_id for target_id, _ in non_members])
+        success_targets = [name for _, name in non_members]
+    except Exception as e:
+        failure_targets += [(target_id, e) for target_id, _ in non_members]
     messages.success(request, "{} target(s) successfully added to group '{}'."
                               .format(len(success_targets), grouping_object.name))
     if warning_targets:
@@ -100,26 +153,20 @@ def remove_all_from_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
     try:
         target_queryset = TargetFilter(request=request, data=filter_data, queryset=Target.objects.all()).qs
     except Exception:
         messages.error(request, "Error with filter parameters. No target(s) were removed from group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            if not request.user.has_perm('tom_targets.change_target', target_object):
-                failure_targets.append((target_object.name, 'Permission denied.',))
-            elif target_object not in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                grouping_object.targets.remove(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'name': target_object.name, 'error': e})
+    members, non_members, failure_targets = _split_targets(target_queryset, grouping_object, request)
+    warning_targets = [name for _, name in non_members]
+    success_targets = []
+    try:
+        _remove_memberships([target_id for target_id, _ in members], grouping_object)
+        success_targets = [name for _, name in members]
+    except Exception as e:
+        failure_targets += [(target_id, e) for target_id, _ in members]
     messages.success(request, "{} target(s) successfully removed from group '{}'."
                               .format(len(success_targets), grouping_object.name))
     if warning_targets:
@@ -127,7 +174,7 @@ def remove_all_from_grouping(filter_data, grouping_object, request):
                                   .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
     for failure_target in failure_targets:
         messages.error(request, "Failed to remove target with id={} from group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+                                .format(failure_target[0], grouping_object.name, failure_target[1]))
 
 
 def remove_selected_from_grouping(targets_ids, grouping_object, request):
@@ -185,27 +232,23 @@ def move_all_to_grouping(filter_data, grouping_object, request):
     :param request: request object passed to the calling view
     :type request: HTTPRequest
     """
-    success_targets = []
-    warning_targets = []
-    failure_targets = []
     try:
         target_queryset = TargetFilter(request=request, data=filter_data, queryset=Target.objects.all()).qs
     except Exception:
         messages.error(request, "Error with filter parameters. No target(s) were moved to group '{}'."
                                 .format(grouping_object.name))
         return
-    for target_object in target_queryset:
-        try:
-            if not request.user.has_perm('tom_targets.change_target', target_object):
-                failure_targets.append((target_object.name, 'Permission denied.',))
-            elif target_object in grouping_object.targets.all():
-                warning_targets.append(target_object.name)
-            else:
-                target_object.targetlist_set.clear()
-                grouping_object.targets.add(target_object)
-                success_targets.append(target_object.name)
-        except Exception as e:
-            failure_targets.append({'name': target_object.name, 'error': e})
+    members, non_members, failure_targets = _split_targets(target_queryset, grouping_object, request)
+    warning_targets = [name for _, name in members]
+    success_targets = []
+    try:
+        target_ids = [target_id for target_id, _ in non_members]
+        with transaction.atomic():
+            _remove_memberships(target_ids)
+            _add_memberships(grouping_object, target_ids)
+        success_targets = [name for _, name in non_members]
+    except Exception as e:
+        failure_targets += [(target_id, e) for target_id, _ in non_members]
     messages.success(request, "{} target(s) successfully moved to group '{}'."
                               .format(len(success_targets), grouping_object.name))
     if warning_targets:
@@ -213,7 +256,7 @@ def move_all_to_grouping(filter_data, grouping_object, request):
                                   .format(len(warning_targets), grouping_object.name, ', '.join(warning_targets)))
     for failure_target in failure_targets:
         messages.error(request, "Failed to move target with id={} to group '{}'; {}"
-                                .format(failure_target['id'], grouping_object.name, failure_target['error']))
+                                .format(failure_target[0], grouping_object.name, failure_target[1]))
 
 
 def move_selected_to_grouping(targets_ids, grouping_object, request):
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from tom_targets.utils import bulk_import_targets
+
+
+class Command(BaseCommand):
+    """
+    Imports targets from a CSV file in the same format accepted by the target import page. Rows are validated and saved
+    in batches, which makes this suitable for catalogues that are too large to upload through the web interface.
+
+    Example: ./manage.py importtargets catalogue.csv --batch_size 5000
+    """
+
+    help = 'Imports targets from a CSV file in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'csv_file',
+            help='Path to the CSV file of targets to import.'
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='Number of rows to validate and save per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        with open(options['csv_file'], newline='', encoding='utf-8') as csv_stream:
+            result = bulk_import_targets(csv_stream, batch_size=options['batch_size'])
+
+        for error in result['errors']:
+            self.stderr.write(error)
+
+        return 'Targets created: {}'.format(len(result['targets']))
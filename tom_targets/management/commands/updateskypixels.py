@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from tom_targets.models import Target
+from tom_targets.sky_index import sky_pixel
+
+
+class Command(BaseCommand):
+    """
+    This management command should be run once after upgrading to a version of the TOM Toolkit that indexes targets by
+    sky pixel, and after any bulk changes to target coordinates that bypass ``Target.save``. It recomputes the
+    ``sky_pixel`` of every ``Target`` from its ``ra`` and ``dec``, which is required for the target to be found by
+    cone searches.
+
+    Example: ./manage.py updateskypixels --batch_size 5000
+    """
+
+    help = 'Computes the sky pixel used by cone searches for all Targets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=2000,
+            help='Number of Targets to update per database query.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        updated = 0
+        batch = []
+        for target_id, ra, dec, current_pixel in Target.objects.values_list(
+                'id', 'ra', 'dec', 'sky_pixel').order_by('id').iterator(chunk_size=batch_size):
+            pixel = sky_pixel(ra, dec)
+            if pixel != current_pixel:
+                batch.append(Target(id=target_id, sky_pixel=pixel))
+            if len(batch) >= batch_size:
+                Target.objects.bulk_update(batch, ['sky_pixel'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            Target.objects.bulk_update(batch, ['sky_pixel'])
+            updated += len(batch)
+
+        return f'Updated the sky pixel of {updated} targets.'
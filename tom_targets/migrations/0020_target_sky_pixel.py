@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0019_auto_20210811_0018'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='sky_pixel',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, help_text='Index of the sky partition containing this target, used by cone searches.', null=True, verbose_name='Sky Pixel'),
+        ),
+    ]
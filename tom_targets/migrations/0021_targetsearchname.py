@@ -0,0 +1,92 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:55
+
+from django.db import DatabaseError, migrations, models, transaction
+import django.db.models.deletion
+
+SQLITE_FTS_TABLE = 'tom_targets_targetsearchname_fts'
+
+# External content FTS5 table with the trigram tokenizer (SQLite 3.34+), kept in sync with triggers. Triggers are
+# dropped if SQLite remakes the table, so migrations that alter TargetSearchName must recreate them.
+SQLITE_CREATE_INDEX = [
+    f"""CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5(
+        name, content='tom_targets_targetsearchname', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER tom_targets_targetsearchname_ai AFTER INSERT ON tom_targets_targetsearchname BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END""",
+    f"""CREATE TRIGGER tom_targets_targetsearchname_ad AFTER DELETE ON tom_targets_targetsearchname BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    f"""CREATE TRIGGER tom_targets_targetsearchname_au AFTER UPDATE ON tom_targets_targetsearchname BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+SQLITE_DROP_INDEX = [
+    'DROP TRIGGER IF EXISTS tom_targets_targetsearchname_ai',
+    'DROP TRIGGER IF EXISTS tom_targets_targetsearchname_ad',
+    'DROP TRIGGER IF EXISTS tom_targets_targetsearchname_au',
+    f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}',
+]
+POSTGRESQL_CREATE_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX tom_targets_targetsearchname_name_trgm ON tom_targets_targetsearchname USING gin (name gin_trgm_ops)',
+]
+POSTGRESQL_DROP_INDEX = ['DROP INDEX IF EXISTS tom_targets_targetsearchname_name_trgm']
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_CREATE_INDEX, 'postgresql': POSTGRESQL_CREATE_INDEX}
+    try:
+        # If the FTS5 trigram tokenizer or the pg_trgm extension is unavailable, names are searched without the index
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for statement in statements.get(schema_editor.connection.vendor, []):
+                schema_editor.execute(statement)
+    except DatabaseError:
+        pass
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP_INDEX, 'postgresql': POSTGRESQL_DROP_INDEX}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def index_target_names(apps, schema_editor):
+    Target = apps.get_model('tom_targets', 'Target')
+    TargetName = apps.get_model('tom_targets', 'TargetName')
+    TargetSearchName = apps.get_model('tom_targets', 'TargetSearchName')
+    search_names = [
+        TargetSearchName(target_id=target_id, name=name.lower())
+        for target_id, name in Target.objects.values_list('id', 'name').iterator()
+    ]
+    search_names += [
+        TargetSearchName(target_id=target_id, alias_id=alias_id, name=name.lower())
+        for alias_id, target_id, name in TargetName.objects.values_list('id', 'target_id', 'name').iterator()
+    ]
+    TargetSearchName.objects.bulk_create(search_names, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0020_target_sky_pixel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetSearchName',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=100)),
+                ('alias', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_name', to='tom_targets.targetname')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_names', to='tom_targets.target')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='targetsearchname',
+            constraint=models.UniqueConstraint(condition=models.Q(('alias__isnull', True)), fields=('target',), name='tom_targets_unique_search_name_per_target'),
+        ),
+        migrations.RunPython(create_search_index, reverse_code=drop_search_index),
+        migrations.RunPython(index_target_names, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.18 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_targets', '0021_targetsearchname'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='targetextra',
+            index=models.Index(fields=['key', 'float_value'], name='tom_targets_extra_float_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='targetextra',
+            index=models.Index(fields=['key', 'time_value'], name='tom_targets_extra_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='targetextra',
+            index=models.Index(fields=['key', 'bool_value'], name='tom_targets_extra_bool_idx'),
+        ),
+    ]
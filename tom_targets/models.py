@@ -4,10 +4,14 @@ from dateutil.parser import parse
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.forms.models import model_to_dict
 from django.urls import reverse
 
 from tom_common.hooks import run_hook
+from tom_targets.sky_index import sky_pixel
 
 GLOBAL_TARGET_FIELDS = ['name', 'type']
 
@@ -34,6 +38,53 @@ REQUIRED_NON_SIDEREAL_FIELDS_PER_SCHEME = {
 }
 
 
+_extra_field_types = (None, {})
+
+
+def get_extra_field_types():
+    """
+    Returns the types of the ``EXTRA_FIELDS`` in ``settings.py``, by name. The dictionary is only rebuilt when the
+    setting changes.
+
+    :returns: Dictionary of extra field names to their types
+    :rtype: dict
+    """
+    global _extra_field_types
+    extra_fields = settings.EXTRA_FIELDS
+    if _extra_field_types[0] is not extra_fields:
+        _extra_field_types = (extra_fields, {extra_field['name']: extra_field['type'] for extra_field in extra_fields})
+    return _extra_field_types[1]
+
+
+class TargetQuerySet(models.QuerySet):
+    def with_display_data(self):
+        """
+        Prefetches the data that is displayed with each target: its aliases, extras, target groupings and scheduled
+        observations, and annotates the numbers of its observations and data products as ``observation_count`` and
+        ``data_product_count``. Displaying any number of targets then takes a fixed number of queries, rather than
+        several per target.
+
+        :returns: QuerySet of targets with prefetched display data
+        :rtype: TargetQuerySet
+        """
+        # Imported here to avoid a circular import
+        from tom_dataproducts.models import DataProduct
+        from tom_observations.models import ObservationRecord
+
+        def count_of(model):
+            counts = model.objects.filter(target=models.OuterRef('pk')).order_by().values('target')
+            return Coalesce(models.Subquery(counts.annotate(count=models.Count('pk')).values('count')), 0)
+
+        return self.prefetch_related(
+            'aliases', 'targetextra_set', 'targetlist_set',
+            models.Prefetch(
+                'observationrecord_set',
+                queryset=ObservationRecord.objects.exclude(status='').order_by('scheduled_start'),
+                to_attr='scheduled_observations'
+            )
+        ).annotate(observation_count=count_of(ObservationRecord), data_product_count=count_of(DataProduct))
+
+
 class Target(models.Model):
     """
     Class representing a target in a TOM
@@ -121,6 +172,10 @@ class Target(models.Model):
 
     :param ephemeris_epoch_err: Days
     :type ephemeris_epoch_err: float
+
+    :param sky_pixel: Index of the sky partition containing the target's coordinates, used by cone searches. Computed
+                      from ``ra`` and ``dec`` on save.
+    :type sky_pixel: int
     """
 
     SIDEREAL = 'SIDEREAL'
@@ -227,6 +282,12 @@ class Target(models.Model):
     perihdist = models.FloatField(
         null=True, blank=True, verbose_name='Perihelion Distance', help_text='AU'
     )
+    sky_pixel = models.IntegerField(
+        null=True, blank=True, editable=False, db_index=True, verbose_name='Sky Pixel',
+        help_text='Index of the sky partition containing this target, used by cone searches.'
+    )
+
+    objects = TargetQuerySet.as_manager()
 
     @transaction.atomic
     def save(self, *args, **kwargs):
@@ -241,6 +302,10 @@ class Target(models.Model):
         names = kwargs.pop('names', [])
 
         created = False if self.id else True
+        self.sky_pixel = sky_pixel(self.ra, self.dec)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('ra' in update_fields or 'dec' in update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['sky_pixel']
         super().save(*args, **kwargs)
 
         if created:
@@ -303,9 +368,10 @@ class Target(models.Model):
         :returns: List of ``ObservationRecord`` objects without a terminal status
         :rtype: list
         """
-        return [
-            obs for obs in self.observationrecord_set.exclude(status='').order_by('scheduled_start') if not obs.terminal
-        ]
+        observations = getattr(self, 'scheduled_observations', None)
+        if observations is None:
+            observations = self.observationrecord_set.exclude(status='').order_by('scheduled_start')
+        return [obs for obs in observations if not obs.terminal]
 
     @property
     def extra_fields(self):
@@ -316,10 +382,9 @@ class Target(models.Model):
         :returns: Dictionary of key/value pairs representing target attributes
         :rtype: dict
         """
-        defined_extras = [extra_field['name'] for extra_field in settings.EXTRA_FIELDS]
-        types = {extra_field['name']: extra_field['type'] for extra_field in settings.EXTRA_FIELDS}
-        return {te.key: te.typed_value(types[te.key])
-                for te in self.targetextra_set.filter(key__in=defined_extras)}
+        types = get_extra_field_types()
+        # All extras are read, so that extras prefetched with the target are used
+        return {te.key: te.typed_value(types[te.key]) for te in self.targetextra_set.all() if te.key in types}
 
     @property
     def tags(self):
@@ -330,8 +395,8 @@ class Target(models.Model):
         :returns: Dictionary of key/value pairs representing target attributes
         :rtype: dict
         """
-        defined_extras = [extra_field['name'] for extra_field in settings.EXTRA_FIELDS]
-        return {te.key: te.value for te in self.targetextra_set.exclude(key__in=defined_extras)}
+        types = get_extra_field_types()
+        return {te.key: te.value for te in self.targetextra_set.all() if te.key not in types}
 
     def as_dict(self):
         """
@@ -389,6 +454,33 @@ class TargetName(models.Model):
                                       {self.target.name} (id={self.target.id})''')
 
 
+class TargetSearchName(models.Model):
+    """
+    Class representing the lowercase form of the name or of an alias of a ``Target``, against which target names are
+    searched. The table is indexed for substring searches, with a trigram index on PostgreSQL and an FTS5 trigram table
+    on SQLite, and is kept up to date automatically. See ``tom_targets.name_index``.
+
+    :param target: The ``Target`` object this name belongs to.
+
+    :param alias: The ``TargetName`` this name is the alias of, or None for the name of the target itself.
+
+    :param name: The lowercase name.
+    :type name: str
+    """
+    target = models.ForeignKey(Target, on_delete=models.CASCADE, related_name='search_names')
+    alias = models.OneToOneField(TargetName, null=True, on_delete=models.CASCADE, related_name='search_name')
+    name = models.CharField(max_length=100, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['target'], condition=models.Q(alias__isnull=True),
+                                    name='tom_targets_unique_search_name_per_target'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class TargetExtra(models.Model):
     """
     Class representing a list of targets in a TOM.
@@ -419,6 +511,12 @@ class TargetExtra(models.Model):
 
     class Meta:
         unique_together = ['target', 'key']
+        # Used by the filters of EXTRA_FIELDS, which look up the targets with a key in a range of typed values
+        indexes = [
+            models.Index(fields=['key', 'float_value'], name='tom_targets_extra_float_idx'),
+            models.Index(fields=['key', 'time_value'], name='tom_targets_extra_time_idx'),
+            models.Index(fields=['key', 'bool_value'], name='tom_targets_extra_bool_idx'),
+        ]
 
     def __str__(self):
         return f'{self.key}: {self.value}'
@@ -428,6 +526,14 @@ class TargetExtra(models.Model):
         Saves TargetExtra model data to the database. In the process, converts the string value of the ``TargetExtra``
         to the appropriate type, and stores it in the corresponding field as well.
         """
+        self.set_typed_values()
+        super().save(*args, **kwargs)
+
+    def set_typed_values(self):
+        """
+        Converts the string value of the ``TargetExtra`` to each supported type, and stores it in the corresponding
+        field. Called by ``save``, and should be called explicitly before creating objects with ``bulk_create``.
+        """
         try:
             self.float_value = float(self.value)
         except (TypeError, ValueError, OverflowError):
@@ -444,8 +550,6 @@ class TargetExtra(models.Model):
         except (TypeError, ValueError, OverflowError):
             self.time_value = None
 
-        super().save(*args, **kwargs)
-
     def typed_value(self, type_val):
         """
         Returns the value of this ``TargetExtra`` in the corresponding type provided by the caller. If the type is
@@ -497,3 +601,36 @@ class TargetList(models.Model):
 
     def __str__(self):
         return self.name
+
+
+@receiver([post_save, post_delete], sender=Target)
+def invalidate_target_crossmatch_index(sender, **kwargs):
+    """
+    Marks the in-memory cross-match index as stale whenever a ``Target`` is saved or deleted.
+    """
+    from tom_targets.crossmatch import invalidate_crossmatch_index  # Imported here to avoid a circular import
+    invalidate_crossmatch_index()
+
+
+@receiver(post_save, sender=Target)
+def index_target_search_name(sender, instance, raw=False, **kwargs):
+    """
+    Updates the search name of a ``Target`` whenever it is saved.
+    """
+    from tom_targets.name_index import normalize_name  # Imported here to avoid a circular import
+    if not raw:
+        TargetSearchName.objects.update_or_create(target=instance, alias=None,
+                                                  defaults={'name': normalize_name(instance.name)})
+
+
+@receiver(post_save, sender=TargetName)
+def index_alias_search_name(sender, instance, raw=False, **kwargs):
+    """
+    Updates the search name of a ``TargetName`` whenever it is saved. Search names are deleted along with their targets
+    and aliases.
+    """
+    from tom_targets.name_index import normalize_name  # Imported here to avoid a circular import
+    if not raw:
+        TargetSearchName.objects.update_or_create(
+            alias=instance, defaults={'target': instance.target, 'name': normalize_name(instance.name)}
+        )
@@ -0,0 +1,110 @@
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+
+from tom_targets.models import Target, TargetName, TargetSearchName
+
+# External content FTS5 table over TargetSearchName, created on SQLite by migration 0021_targetsearchname
+SQLITE_FTS_TABLE = 'tom_targets_targetsearchname_fts'
+# FTS5 trigram queries only match search terms of at least this length
+TRIGRAM_LENGTH = 3
+
+_has_fts_table = {}
+
+
+def normalize_name(name):
+    """
+    Returns the form of a target name that is stored in, and searched for in, the name index.
+
+    :param name: Name or alias of a target, or a search term
+    :type name: str
+
+    :returns: normalized name
+    :rtype: str
+    """
+    return name.lower()
+
+
+def _uses_fts_table(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _has_fts_table:
+        _has_fts_table[connection.alias] = SQLITE_FTS_TABLE in connection.introspection.table_names()
+    return _has_fts_table[connection.alias]
+
+
+def search_target_ids(value):
+    """
+    Returns the ids of the targets with a name or alias that contains a search term, ignoring case, as a queryset to
+    be used as a subquery, e.g. ``Target.objects.filter(pk__in=search_target_ids('2019'))``. On PostgreSQL the search
+    uses the trigram index of ``TargetSearchName``, and on SQLite its FTS5 trigram table, so that it does not scan all
+    names and aliases, and needs no DISTINCT.
+
+    :param value: The search term
+    :type value: str
+
+    :returns: values queryset of target ids
+    :rtype: QuerySet
+    """
+    value = normalize_name(value)
+    search_names = TargetSearchName.objects.all()
+    connection = connections[router.db_for_read(TargetSearchName)]
+    if len(value) >= TRIGRAM_LENGTH and _uses_fts_table(connection):
+        phrase = '"{0}"'.format(value.replace('"', '""'))
+        search_names = search_names.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s', [phrase])
+        )
+    else:
+        search_names = search_names.filter(name__contains=value)
+    return search_names.values('target_id')
+
+
+def index_new_target_names(targets, aliases):
+    """
+    Creates the search names of new targets and their aliases, which were created without being saved one by one,
+    e.g. with ``bulk_create``.
+
+    :param targets: The new targets
+    :type targets: list
+
+    :param aliases: The new aliases of the targets
+    :type aliases: list
+    """
+    if any(alias.pk is None for alias in aliases):
+        # Not all database backends return primary keys from a bulk insert
+        aliases = TargetName.objects.filter(target__in=targets)
+    search_names = [TargetSearchName(target=target, name=normalize_name(target.name)) for target in targets]
+    search_names += [
+        TargetSearchName(target_id=alias.target_id, alias=alias, name=normalize_name(alias.name)) for alias in aliases
+    ]
+    TargetSearchName.objects.bulk_create(search_names, batch_size=1000)
+
+
+def rebuild_name_index(targets=None):
+    """
+    Rebuilds the search names of targets from their names and aliases. Search names are kept up to date whenever a
+    ``Target`` or ``TargetName`` is saved, so this is only needed after names are changed without saving the objects,
+    e.g. with ``bulk_create`` or ``QuerySet.update``.
+
+    :param targets: The targets whose search names to rebuild, defaults to all targets
+    :type targets: list or QuerySet
+
+    :returns: number of search names created
+    :rtype: int
+    """
+    if targets is None:
+        targets = Target.objects.only('id', 'name')
+        search_names = TargetSearchName.objects.all()
+        aliases = TargetName.objects.all()
+    else:
+        targets = list(targets)
+        search_names = TargetSearchName.objects.filter(target__in=targets)
+        aliases = TargetName.objects.filter(target__in=targets)
+    search_names.delete()
+
+    new_search_names = [TargetSearchName(target_id=target.id, name=normalize_name(target.name)) for target in targets]
+    new_search_names += [
+        TargetSearchName(target_id=target_id, alias_id=alias_id, name=normalize_name(name))
+        for alias_id, target_id, name in aliases.values_list('id', 'target_id', 'name').iterator()
+    ]
+    TargetSearchName.objects.bulk_create(new_search_names, batch_size=1000)
+    return len(new_search_names)
@@ -1,6 +1,11 @@
 from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from guardian.models import GroupObjectPermission
 from guardian.shortcuts import assign_perm, get_groups_with_perms, get_objects_for_user
 from rest_framework import serializers
+from rest_framework.utils import html
+from rest_framework.validators import UniqueValidator
 
 from tom_common.serializers import GroupSerializer
 from tom_targets.models import Target, TargetExtra, TargetName
@@ -23,6 +28,27 @@ class TargetExtraSerializer(serializers.ModelSerializer):
         fields = ('id', 'key', 'value')
 
 
+class TargetListSerializer(serializers.ListSerializer):
+    """
+    Serializes a list of targets, with the groups that have permissions on all of the targets read in one query,
+    rather than one query per target.
+    """
+
+    def to_representation(self, data):
+        targets = list(data.all() if isinstance(data, models.Manager) else data)
+        group_permissions = GroupObjectPermission.objects.filter(
+            content_type=ContentType.objects.get_for_model(Target),
+            object_pk__in=[str(target.pk) for target in targets]
+        ).select_related('group').order_by('group_id')
+        groups_by_target = {}
+        for group_permission in group_permissions:
+            groups = groups_by_target.setdefault(group_permission.object_pk, {})
+            groups.setdefault(group_permission.group_id, group_permission.group)
+        for target in targets:
+            target.groups_with_perms = list(groups_by_target.get(str(target.pk), {}).values())
+        return super().to_representation(targets)
+
+
 class TargetSerializer(serializers.ModelSerializer):
     """Target serializer responsbile for transforming models to/from
     json (or other representations). See
@@ -35,6 +61,7 @@ class TargetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Target
         fields = '__all__'
+        list_serializer_class = TargetListSerializer
         # TODO: We should investigate if this validator logic can be reused in the forms to reduce code duplication.
         # TODO: Try to put validators in settings to allow user changes
         validators = [RequiredFieldsTogetherValidator('type', 'SIDEREAL', 'ra', 'dec'),
@@ -85,7 +112,11 @@ class TargetSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         groups = []
-        for group in get_groups_with_perms(instance):
+        # The groups of a list of targets are read at once by TargetListSerializer
+        groups_with_perms = getattr(instance, 'groups_with_perms', None)
+        if groups_with_perms is None:
+            groups_with_perms = get_groups_with_perms(instance)
+        for group in groups_with_perms:
             groups.append(GroupSerializer(group).data)
         representation['groups'] = groups
         return representation
@@ -149,6 +180,22 @@ class TargetSerializer(serializers.ModelSerializer):
         return instance
 
 
+class TargetBulkItemSerializer(TargetSerializer):
+    """
+    Validates one target of a bulk create or update, which is saved by ``tom_targets.bulk`` rather than by this
+    serializer. The uniqueness of names and aliases is checked for all of the targets at once, rather than with a query
+    for each of them.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for field in [fields['name'], fields['aliases'].child.fields['name']]:
+            field.validators = [
+                validator for validator in field.validators if not isinstance(validator, UniqueValidator)
+            ]
+        return fields
+
+
 class TargetFilteredPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
     # This PrimaryKeyRelatedField subclass is used to implement get_queryset based on the permissions of the user
     # submitting the request. The pattern was taken from this StackOverflow answer: https://stackoverflow.com/a/32683066
@@ -159,3 +206,27 @@ class TargetFilteredPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
         if not (request and queryset):
             return None
         return get_objects_for_user(request.user, 'tom_targets.change_target')
+
+
+class TargetCrossMatchSerializer(serializers.Serializer):
+    """
+    Validates a batch of positions to cross-match against the ``Target`` table. ``radius`` may be a single value used
+    for every position, or a list with one value per position. All values are in degrees.
+    """
+    ra = serializers.ListField(child=serializers.FloatField(min_value=-360, max_value=360), allow_empty=False)
+    dec = serializers.ListField(child=serializers.FloatField(min_value=-90, max_value=90), allow_empty=False)
+    radius = serializers.ListField(child=serializers.FloatField(min_value=0, max_value=180), allow_empty=False)
+
+    def to_internal_value(self, data):
+        # Form data is read with getlist by ListField, so a single radius is already a list of one value
+        if not html.is_html_input(data) and isinstance(data.get('radius'), (int, float, str)):
+            data = dict(data)
+            data['radius'] = [data['radius']]
+        return super().to_internal_value(data)
+
+    def validate(self, data):
+        if len(data['ra']) != len(data['dec']):
+            raise serializers.ValidationError('ra and dec must have the same length.')
+        if len(data['radius']) not in (1, len(data['ra'])):
+            raise serializers.ValidationError('radius must be a single value or have the same length as ra and dec.')
+        return data
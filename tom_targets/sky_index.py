@@ -0,0 +1,85 @@
+from math import asin, cos, degrees, floor, radians, sin
+
+# The sky is partitioned into declination zones of equal height, each of which is split into right ascension bins of
+# the same width. A sky pixel is the integer ``zone * SKY_PIXEL_RA_BINS + ra_bin``, so the pixels in a single zone are
+# contiguous and a cone can be expressed as a small number of integer ranges over an indexed column.
+SKY_PIXEL_SIZE = 0.25  # degrees
+SKY_PIXEL_DEC_ZONES = int(180 / SKY_PIXEL_SIZE)
+SKY_PIXEL_RA_BINS = int(360 / SKY_PIXEL_SIZE)
+
+# Padding, in degrees, applied to search areas so that floating point error never excludes a candidate pixel
+SKY_PIXEL_PADDING = 1e-6
+
+
+def _dec_zone(dec):
+    return min(max(int(floor((dec + 90) / SKY_PIXEL_SIZE)), 0), SKY_PIXEL_DEC_ZONES - 1)
+
+
+def _ra_bin(ra):
+    return min(int(floor((ra % 360) / SKY_PIXEL_SIZE)), SKY_PIXEL_RA_BINS - 1)
+
+
+def sky_pixel(ra, dec):
+    """
+    Computes the sky pixel containing the given coordinates.
+
+    :param ra: Right Ascension, in degrees
+    :type ra: float
+
+    :param dec: Declination, in degrees
+    :type dec: float
+
+    :returns: index of the sky pixel, or None if either coordinate is missing
+    :rtype: int
+    """
+    if ra is None or dec is None or ra == '' or dec == '':
+        return None
+    return _dec_zone(float(dec)) * SKY_PIXEL_RA_BINS + _ra_bin(float(ra))
+
+
+def sky_pixel_ranges(ra, dec, radius):
+    """
+    Computes the sky pixels that may contain points within ``radius`` of the given coordinates. The result is correct
+    across RA=0/360 and for cones that contain a celestial pole.
+
+    :param ra: Right Ascension of the cone center, in degrees
+    :type ra: float
+
+    :param dec: Declination of the cone center, in degrees
+    :type dec: float
+
+    :param radius: Radius of the cone, in degrees
+    :type radius: float
+
+    :returns: sorted, non-overlapping list of inclusive ``(first_pixel, last_pixel)`` ranges
+    :rtype: list
+    """
+    radius = abs(radius) + SKY_PIXEL_PADDING
+    first_zone = _dec_zone(dec - radius)
+    last_zone = _dec_zone(dec + radius)
+
+    # The maximum RA half-width of a cone that does not contain a pole is asin(sin(r) / cos(dec))
+    if abs(dec) + radius >= 90 or radius >= 90:
+        ra_bins = [(0, SKY_PIXEL_RA_BINS - 1)]
+    else:
+        half_width = degrees(asin(min(sin(radians(radius)) / cos(radians(dec)), 1))) + SKY_PIXEL_PADDING
+        if half_width >= 180:
+            ra_bins = [(0, SKY_PIXEL_RA_BINS - 1)]
+        else:
+            first_bin = _ra_bin(ra - half_width)
+            last_bin = _ra_bin(ra + half_width)
+            if first_bin <= last_bin:
+                ra_bins = [(first_bin, last_bin)]
+            else:
+                ra_bins = [(0, last_bin), (first_bin, SKY_PIXEL_RA_BINS - 1)]
+
+    ranges = []
+    for zone in range(first_zone, last_zone + 1):
+        for first_bin, last_bin in ra_bins:
+            low = zone * SKY_PIXEL_RA_BINS + first_bin
+            high = zone * SKY_PIXEL_RA_BINS + last_bin
+            if ranges and ranges[-1][1] + 1 >= low:
+                ranges[-1] = (ranges[-1][0], high)
+            else:
+                ranges.append((low, high))
+    return ranges
@@ -1,19 +1,17 @@
 from datetime import datetime, timedelta
 
-from astroplan import moon_illumination
 from astropy import units as u
-from astropy.coordinates import Angle, get_moon, SkyCoord
-from astropy.time import Time
+from astropy.coordinates import Angle
 from django import template
 from django.conf import settings
 from django.db.models import Q
 from guardian.shortcuts import get_objects_for_user
-import numpy as np
 from plotly import offline
 from plotly import graph_objs as go
 
 from tom_observations.utils import get_sidereal_visibility
-from tom_targets.models import Target, TargetExtra, TargetList
+from tom_observations.visibility import get_moon_ephemeris, get_moon_separations
+from tom_targets.models import Target, TargetExtra
 from tom_targets.forms import TargetVisibilityForm
 
 register = template.Library()
@@ -58,7 +56,8 @@ def target_data(target):
     """
     Displays the data of a target.
     """
-    extras = {k['name']: target.extra_fields.get(k['name'], '') for k in settings.EXTRA_FIELDS if not k.get('hidden')}
+    extra_fields = target.extra_fields
+    extras = {k['name']: extra_fields.get(k['name'], '') for k in settings.EXTRA_FIELDS if not k.get('hidden')}
     return {
         'target': target,
         'extras': extras
@@ -68,7 +67,7 @@ def target_data(target):
 @register.inclusion_tag('tom_targets/partials/target_unknown_statuses.html')
 def target_unknown_statuses(target):
     return {
-        'num_unknown_statuses': len(target.observationrecord_set.filter(Q(status='') | Q(status=None)))
+        'num_unknown_statuses': target.observationrecord_set.filter(Q(status='') | Q(status=None)).count()
     }
 
 
@@ -77,7 +76,8 @@ def target_groups(target):
     """
     Widget displaying groups this target is in and controls for modifying group association for the given target.
     """
-    groups = TargetList.objects.filter(targets=target)
+    # Uses the target groupings prefetched by Target.objects.with_display_data(), if any
+    groups = target.targetlist_set.all()
     return {'target': target,
             'groups': groups}
 
@@ -138,23 +138,17 @@ def moon_distance(target, day_range=30):
         return {'plot': None}
 
     day_range = 30
-    times = Time(
-        [str(datetime.utcnow() + timedelta(days=delta)) for delta in np.arange(0, day_range, 0.2)],
-        format='iso', scale='utc'
-    )
-
-    obj_pos = SkyCoord(target.ra, target.dec, unit=u.deg)
-    moon_pos = get_moon(times)
-
-    separations = moon_pos.separation(obj_pos).deg
-    phases = moon_illumination(times)
+    ephemeris = get_moon_ephemeris(datetime.utcnow(), day_range)
+    days = ephemeris['mjd'] - ephemeris['mjd'][0]
+    separations = get_moon_separations(target.ra, target.dec, ephemeris)[0]
+    phases = ephemeris['illumination']
 
     distance_color = 'rgb(0, 0, 255)'
     phase_color = 'rgb(255, 0, 0)'
     plot_data = [
-        go.Scatter(x=times.mjd-times[0].mjd, y=separations, mode='lines', name='Moon distance (degrees)',
+        go.Scatter(x=days, y=separations, mode='lines', name='Moon distance (degrees)',
                    line=dict(color=distance_color)),
-        go.Scatter(x=times.mjd-times[0].mjd, y=phases, mode='lines', name='Moon phase', yaxis='y2',
+        go.Scatter(x=days, y=phases, mode='lines', name='Moon phase', yaxis='y2',
                    line=dict(color=phase_color))
     ]
     layout = go.Layout(
@@ -1,6 +1,9 @@
 import copy
+import json
 
 from django.contrib.auth.models import User, Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from guardian.shortcuts import assign_perm, get_objects_for_user
 from rest_framework import status
@@ -9,6 +12,7 @@ from rest_framework.test import APITestCase
 from tom_targets.tests.factories import SiderealTargetFactory, NonSiderealTargetFactory
 from tom_targets.tests.factories import TargetExtraFactory, TargetNameFactory
 from tom_targets.models import Target, TargetExtra, TargetName
+from tom_targets.name_index import search_target_ids
 
 
 class TestTargetViewset(APITestCase):
@@ -204,6 +208,163 @@ class TestTargetViewset(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+class TestTargetBulkViewset(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.group = Group.objects.create(name='collaborators')
+        self.collaborator = User.objects.create(username='collaborator')
+        self.group.user_set.add(self.collaborator)
+        self.st = SiderealTargetFactory.create(name='existing target', targetextra_set=None, aliases=None)
+        self.alias = TargetNameFactory.create(target=self.st, name='existing alias')
+        self.extra = TargetExtraFactory.create(target=self.st, key='foo', value='bar')
+        for permission in ['view_target', 'change_target', 'delete_target']:
+            assign_perm(f'tom_targets.{permission}', self.user, self.st)
+        self.client.force_login(self.user)
+
+    def target_data(self, name, **kwargs):
+        target_data = {'name': name, 'type': Target.SIDEREAL, 'ra': 123.456, 'dec': -32.1, 'aliases': [],
+                       'targetextra_set': []}
+        target_data.update(kwargs)
+        return target_data
+
+    def test_bulk_create(self):
+        targets_data = [
+            self.target_data('new target', aliases=[{'name': 'new alias'}],
+                             targetextra_set=[{'key': 'foo', 'value': 5}], groups=[{'id': self.group.id}]),
+            self.target_data('existing target'),
+            self.target_data('other target', aliases=[{'name': 'existing alias'}]),
+            self.target_data('same name', aliases=[{'name': 'same name'}]),
+            self.target_data('grouped target', groups=[{'id': -1}]),
+            self.target_data('missing coordinates', dec=None),
+        ]
+        response = self.client.post(reverse('api:targets-bulk'), data=targets_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created'] + ['failed'] * 5)
+        self.assertEqual([result['index'] for result in results], list(range(6)))
+        self.assertEqual(results[1]['errors'], {'name': ['Name(s) already in use: existing target']})
+        self.assertEqual(results[2]['errors'], {'name': ['Name(s) already in use: existing alias']})
+        self.assertEqual(results[3]['errors'],
+                         {'aliases': ['Alias \'same name\' conflicts with Target name \'same name\'.']})
+        self.assertEqual(results[4]['errors'], {'groups': ['Group with id -1 does not exist.']})
+        self.assertIn('non_field_errors', results[5]['errors'])
+
+        target = Target.objects.get(pk=results[0]['id'])
+        self.assertEqual(target.names, ['new target', 'new alias'])
+        self.assertEqual(target.tags, {'foo': '5'})
+        self.assertEqual(list(get_objects_for_user(self.collaborator, 'tom_targets.change_target')), [target])
+        self.assertEqual(Target.objects.filter(name__in=['other target', 'same name', 'grouped target']).count(), 0)
+
+    def test_bulk_create_rejects_repeated_aliases(self):
+        targets_data = [
+            self.target_data('good target'),
+            self.target_data('repeated aliases', aliases=[{'name': 'x'}, {'name': 'x'}]),
+        ]
+        response = self.client.post(reverse('api:targets-bulk'), data=targets_data)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'failed'])
+        self.assertEqual(results[1]['errors'], {'name': ['Name(s) already in use: x']})
+        self.assertTrue(Target.objects.filter(name='good target').exists())
+        self.assertFalse(Target.objects.filter(name='repeated aliases').exists())
+
+    def test_bulk_create_ndjson(self):
+        body = '\n'.join(json.dumps(self.target_data(f'target {index}')) for index in range(3)) + '\n'
+        response = self.client.post(reverse('api:targets-bulk'), data=body, content_type='application/x-ndjson')
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created'] * 3)
+        self.assertEqual(Target.objects.filter(name__startswith='target ').count(), 3)
+
+    def test_bulk_create_queries_do_not_grow_with_targets(self):
+        def count_queries(names):
+            targets_data = [
+                self.target_data(name, aliases=[{'name': f'{name} alias'}],
+                                 targetextra_set=[{'key': 'foo', 'value': 1}], groups=[{'id': self.group.id}])
+                for name in names
+            ]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('api:targets-bulk'), data=targets_data)
+            self.assertEqual([result['status'] for result in response.json()['results']], ['created'] * len(names))
+            return len(context.captured_queries)
+
+        self.assertEqual(count_queries([f'a{index}' for index in range(2)]),
+                         count_queries([f'b{index}' for index in range(20)]))
+
+    def test_bulk_update(self):
+        other_target = SiderealTargetFactory.create(name='other target', targetextra_set=None, aliases=None)
+        assign_perm('tom_targets.change_target', self.user, other_target)
+        third_target = SiderealTargetFactory.create(targetextra_set=None, aliases=None)
+        assign_perm('tom_targets.change_target', self.user, third_target)
+        unauthorized_target = SiderealTargetFactory.create()
+        updates = [
+            {'id': self.st.id, 'name': 'renamed target', 'ra': 10.5,
+             'aliases': [{'id': self.alias.id, 'name': 'renamed alias'}, {'name': 'new alias'}],
+             'targetextra_set': [{'id': self.extra.id, 'key': 'foo', 'value': 'baz'}, {'key': 'new', 'value': '1'}],
+             'groups': [{'id': self.group.id}]},
+            {'id': other_target.id, 'name': 'renamed target'},
+            {'id': unauthorized_target.id, 'ra': 1},
+            {'ra': 1},
+            {'id': third_target.id, 'targetextra_set': [{'id': self.extra.id, 'key': 'foo', 'value': 'stolen'}]},
+        ]
+        response = self.client.patch(reverse('api:targets-bulk'), data=updates)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['updated'] + ['failed'] * 4)
+        self.assertEqual(results[1]['errors'], {'name': ['Name(s) already in use: renamed target']})
+        self.assertEqual(results[2]['errors'], {'id': ['Not found.']})
+        self.assertEqual(results[3]['errors'], {'id': ['This field is required.']})
+        self.assertIn('targetextra_set', results[4]['errors'])
+
+        self.st.refresh_from_db()
+        self.assertEqual((self.st.name, self.st.ra), ('renamed target', 10.5))
+        self.assertEqual(sorted(self.st.names), ['new alias', 'renamed alias', 'renamed target'])
+        self.assertEqual(self.st.tags, {'foo': 'baz', 'new': '1'})
+        self.assertEqual(TargetExtra.objects.get(pk=self.extra.id).float_value, None)
+        self.assertEqual(list(get_objects_for_user(self.collaborator, 'tom_targets.view_target')), [self.st])
+        self.assertEqual(list(Target.objects.filter(pk__in=search_target_ids('renamed alias'))), [self.st])
+
+    def test_bulk_update_rejects_repeated_targets(self):
+        updates = [
+            {'id': self.st.id, 'name': 'leaked', 'aliases': [{'id': 9999, 'name': 'zz'}]},
+            {'id': self.st.id, 'ra': 1},
+        ]
+        response = self.client.patch(reverse('api:targets-bulk'), data=updates)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['failed'] * 2)
+        self.assertEqual(response.json()['results'][1]['errors'],
+                         {'id': ['The target is updated by more than one item.']})
+        self.st.refresh_from_db()
+        self.assertEqual(self.st.name, 'existing target')
+
+    def test_bulk_update_failed_changes_are_not_applied(self):
+        other_target = SiderealTargetFactory.create(name='other target', targetextra_set=None, aliases=None)
+        assign_perm('tom_targets.change_target', self.user, other_target)
+        updates = [
+            {'id': self.st.id, 'name': 'leaked', 'aliases': [{'id': 9999, 'name': 'zz'}]},
+            {'id': other_target.id, 'name': 'existing target'},
+        ]
+        response = self.client.patch(reverse('api:targets-bulk'), data=updates)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['failed'] * 2)
+        self.assertEqual(response.json()['results'][1]['errors'], {'name': ['Name(s) already in use: existing target']})
+
+        response = self.client.patch(reverse('api:targets-bulk'), data=[{'id': self.st.id, 'dec': 5}])
+        self.assertEqual(response.json()['results'][0]['status'], 'updated')
+        self.st.refresh_from_db()
+        self.assertEqual((self.st.name, self.st.dec), ('existing target', 5))
+        self.assertEqual(list(Target.objects.filter(pk__in=search_target_ids('leaked'))), [])
+        self.assertEqual(list(Target.objects.filter(pk__in=search_target_ids('existing target'))), [self.st])
+
+    def test_bulk_delete(self):
+        unauthorized_target = SiderealTargetFactory.create()
+        response = self.client.delete(reverse('api:targets-bulk'), data=[self.st.id, {'id': unauthorized_target.id}])
+        self.assertEqual(response.json()['results'], [
+            {'index': 0, 'status': 'deleted', 'id': self.st.id},
+            {'index': 1, 'status': 'failed', 'errors': {'id': ['Not found.']}},
+        ])
+        self.assertFalse(Target.objects.filter(pk=self.st.id).exists())
+        self.assertTrue(Target.objects.filter(pk=unauthorized_target.id).exists())
+
+    def test_bulk_requires_list(self):
+        response = self.client.post(reverse('api:targets-bulk'), data=self.target_data('new target'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class TestTargetNameViewset(APITestCase):
     def setUp(self):
         user = User.objects.create(username='testuser')
@@ -256,3 +417,58 @@ class TestTargetExtraViewset(APITestCase):
         response = self.client.delete(reverse('api:targetextra-detail', args=(self.extra.id,)))
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(TargetExtra.objects.filter(pk=self.extra.id).exists())
+
+
+class TestTargetCrossMatchViewset(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.st = SiderealTargetFactory.create(name='M42', ra=83.8221, dec=-5.3911)
+        self.st2 = SiderealTargetFactory.create(name='wraptarget', ra=359.9999, dec=10)
+        self.st3 = SiderealTargetFactory.create(name='hiddentarget', ra=83.8222, dec=-5.3911)
+        assign_perm('tom_targets.view_target', self.user, self.st)
+        assign_perm('tom_targets.view_target', self.user, self.st2)
+
+        self.client.force_login(self.user)
+
+    def test_crossmatch(self):
+        data = {'ra': [83.8221, 0.0001, 180], 'dec': [-5.3911, 10, 0], 'radius': 0.001}
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual(results[0]['target']['id'], self.st.id)
+        self.assertAlmostEqual(results[0]['separation'], 0, places=6)
+        self.assertEqual(results[1]['target']['id'], self.st2.id)
+        self.assertIsNone(results[2]['target'])
+
+    def test_crossmatch_form_data(self):
+        data = 'ra=83.8221&ra=180&dec=-5.3911&dec=0&radius=0.001'
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data,
+                                    content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual(results[0]['target']['id'], self.st.id)
+        self.assertIsNone(results[1]['target'])
+
+    def test_crossmatch_excludes_unauthorized_targets(self):
+        data = {'ra': [83.8222], 'dec': [-5.3911], 'radius': [0.00005]}
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data)
+        self.assertIsNone(response.json()['results'][0]['target'])
+
+    def test_crossmatch_index_invalidated(self):
+        data = {'ra': [10], 'dec': [20], 'radius': 0.01}
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data)
+        self.assertIsNone(response.json()['results'][0]['target'])
+
+        new_target = SiderealTargetFactory.create(ra=10, dec=20)
+        assign_perm('tom_targets.view_target', self.user, new_target)
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data)
+        self.assertEqual(response.json()['results'][0]['target']['id'], new_target.id)
+
+        new_target.delete()
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data)
+        self.assertIsNone(response.json()['results'][0]['target'])
+
+    def test_crossmatch_mismatched_lengths(self):
+        data = {'ra': [10, 11], 'dec': [20], 'radius': 0.01}
+        response = self.client.post(reverse('api:targetcrossmatch-list'), data=data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,15 +1,29 @@
+import os
 import pytz
+import tempfile
 from datetime import datetime
+from io import StringIO
+from unittest.mock import call, patch
 
 from django.contrib.auth.models import User, Group
 from django.contrib.messages import get_messages
 from django.contrib.messages.constants import SUCCESS, WARNING
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from .factories import SiderealTargetFactory, NonSiderealTargetFactory, TargetGroupingFactory, TargetNameFactory
+from .factories import TargetExtraFactory
+from tom_observations.models import ObservationRecord
+from tom_observations.visibility import get_moon_position
+from tom_targets.filters import TargetFilter
+from tom_targets.groups import add_all_to_grouping, move_all_to_grouping
 from tom_targets.models import Target, TargetExtra, TargetList, TargetName
-from tom_targets.utils import import_targets
+from tom_targets.name_index import rebuild_name_index, search_target_ids
+from tom_targets.sky_index import sky_pixel
+from tom_targets.utils import bulk_import_targets, import_targets, export_targets
 from guardian.shortcuts import assign_perm
 
 
@@ -105,6 +119,59 @@ class TestTargetDetail(TestCase):
         self.assertContains(response, 'You do not have permission to access this page')
 
 
+class TestTargetDisplayQueries(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.group = Group.objects.create(name='group')
+        self.group.user_set.add(self.user)
+        self.grouping = TargetGroupingFactory.create()
+
+    def create_targets(self, count):
+        for _ in range(count):
+            target = SiderealTargetFactory.create()
+            TargetExtra.objects.create(target=target, key='redshift', value='0.1')
+            ObservationRecord.objects.create(target=target, facility='LCO', observation_id='1', status='PENDING',
+                                             parameters={})
+            self.grouping.targets.add(target)
+            assign_perm('tom_targets.view_target', self.group, target)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    @override_settings(EXTRA_FIELDS=[{'name': 'redshift', 'type': 'number'}])
+    def test_with_display_data(self):
+        self.create_targets(2)
+        targets = list(Target.objects.with_display_data().order_by('id'))
+        with self.assertNumQueries(0):
+            for target in targets:
+                self.assertEqual(target.observation_count, 1)
+                self.assertEqual(target.data_product_count, 0)
+                self.assertEqual(len(target.names), 3)
+                self.assertEqual(target.extra_fields, {'redshift': 0.1})
+                self.assertEqual(len(target.tags), 3)
+                self.assertEqual(len(target.future_observations), 1)
+                self.assertEqual(list(target.targetlist_set.all()), [self.grouping])
+
+    def test_list_queries_do_not_grow_with_targets(self):
+        self.client.force_login(self.user)
+        self.create_targets(2)
+        queries = self.count_queries(reverse('targets:list'))
+        self.create_targets(6)
+        self.assertEqual(self.count_queries(reverse('targets:list')), queries)
+
+    def test_api_list_queries_do_not_grow_with_targets(self):
+        self.client.force_login(self.user)
+        self.create_targets(2)
+        queries = self.count_queries(reverse('api:targets-list'))
+        self.create_targets(6)
+        self.assertEqual(self.count_queries(reverse('api:targets-list')), queries)
+        response = self.client.get(reverse('api:targets-list'))
+        self.assertEqual([group['name'] for group in response.json()['results'][0]['groups']], ['group'])
+
+
 class TestTargetNameSearch(TestCase):
     def setUp(self):
         self.user = User.objects.create(username='testuser')
@@ -537,6 +604,82 @@ class TestTargetImport(TestCase):
                 self.assertTrue(TargetName.objects.filter(target=target, name=alias).exists())
 
 
+class TestTargetBulkImport(TestCase):
+    @override_settings(EXTRA_FIELDS=[{'name': 'redshift', 'type': 'number'},
+                                     {'name': 'priority', 'type': 'number', 'default': 1}])
+    def test_bulk_import_csv(self):
+        csv = [
+            'name,type,ra,dec,redshift,name1,name2',
+            'm13,SIDEREAL,250.421,36.459,5,Tom,Joe',
+            'm27,SIDEREAL,299.901,22.721,6,John,'
+        ]
+        result = bulk_import_targets(csv)
+        self.assertEqual(len(result['targets']), 2)
+        self.assertEqual(result['errors'], [])
+        m13 = Target.objects.get(name='m13')
+        self.assertEqual(m13.sky_pixel, sky_pixel(250.421, 36.459))
+        self.assertEqual(m13.extra_fields, {'redshift': 5, 'priority': 1})
+        self.assertEqual(set(m13.aliases.values_list('name', flat=True)), {'Tom', 'Joe'})
+        self.assertEqual(list(Target.objects.get(name='m27').aliases.values_list('name', flat=True)), ['John'])
+
+    def test_bulk_import_reports_row_errors(self):
+        SiderealTargetFactory.create(name='existing')
+        TargetNameFactory.create(name='existingalias', target=Target.objects.get(name='existing'))
+        csv = [
+            'name,type,ra,dec,name1',
+            'existing,SIDEREAL,250.421,36.459,',
+            'badra,SIDEREAL,notanumber,22.721,',
+            'badalias,SIDEREAL,10,10,existingalias',
+            'good,SIDEREAL,10,10,goodalias',
+            'good,SIDEREAL,11,11,',
+        ]
+        result = bulk_import_targets(csv, batch_size=2)
+        self.assertEqual([target.name for target in result['targets']], ['good'])
+        self.assertEqual(len(result['errors']), 4)
+        self.assertTrue(result['errors'][0].startswith('Error on line 2'))
+        self.assertTrue(result['errors'][1].startswith('Error on line 3'))
+        self.assertTrue(result['errors'][2].startswith('Error on line 4'))
+        self.assertTrue(result['errors'][3].startswith('Error on line 6'))
+
+    def test_bulk_import_rejects_repeated_aliases(self):
+        csv = [
+            'name,type,ra,dec,name1,name2',
+            'good,SIDEREAL,10,10,goodalias,',
+            'repeated,SIDEREAL,11,11,samealias,samealias',
+        ]
+        result = bulk_import_targets(csv)
+        self.assertEqual([target.name for target in result['targets']], ['good'])
+        self.assertEqual(result['errors'], ['Error on line 3: Name(s) already in use: samealias'])
+        self.assertFalse(Target.objects.filter(name='repeated').exists())
+
+    @patch('tom_common.hooks.run_hook')
+    def test_bulk_import_runs_hook_once(self, mock_run_hook):
+        csv = ['name,type,ra,dec'] + [f'target{i},SIDEREAL,{i},{i}' for i in range(10)]
+        with CaptureQueriesContext(connection) as queries:
+            result = bulk_import_targets(csv, batch_size=100)
+        self.assertLessEqual(len(queries), 7)
+        self.assertEqual(len(result['targets']), 10)
+        mock_run_hook.assert_called_once_with('multiple_targets_post_save', targets=result['targets'], created=True)
+
+    @patch('tom_common.hooks.run_hook')
+    def test_bulk_import_runs_target_hook_without_multiple_targets_hook(self, mock_run_hook):
+        csv = ['name,type,ra,dec'] + [f'target{i},SIDEREAL,{i},{i}' for i in range(3)]
+        with self.settings(HOOKS={'target_post_save': 'tom_common.hooks.target_post_save'}):
+            result = bulk_import_targets(csv, batch_size=100)
+        self.assertEqual(mock_run_hook.call_args_list, [
+            call('target_post_save', target=target, created=True) for target in result['targets']
+        ])
+
+    def test_import_targets_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('name,type,ra,dec\nm13,SIDEREAL,250.421,36.459\n')
+        out = StringIO()
+        call_command('importtargets', csv_file.name, stdout=out)
+        os.remove(csv_file.name)
+        self.assertIn('Targets created: 1', out.getvalue())
+        self.assertTrue(Target.objects.filter(name='m13').exists())
+
+
 class TestTargetExport(TestCase):
     """
     The use of a list to handle the map returned by StreamingHttpResponse.streaming_content is taken directly from
@@ -581,6 +724,27 @@ class TestTargetExport(TestCase):
         self.assertIn('M42', content)
         self.assertNotIn('M52', content)
 
+    def test_export_query_count_independent_of_target_count(self):
+        TargetNameFactory.create(name='Messier 42', target=self.st)
+        with self.assertNumQueries(5):
+            content = ''.join(export_targets(Target.objects.all()))
+        self.assertIn('Messier 42', content)
+
+        for _ in range(10):
+            SiderealTargetFactory.create()
+        with self.assertNumQueries(5):
+            content = ''.join(export_targets(Target.objects.all()))
+        self.assertEqual(len(content.splitlines()), 13)
+
+    def test_export_in_chunks(self):
+        TargetExtraFactory.create(target=self.st2, key='redshift', value='0.1')
+        lines = list(export_targets(Target.objects.order_by('name'), chunk_size=1))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('M42', lines[1])
+        self.assertIn('M52', lines[2])
+        self.assertIn('redshift', lines[0])
+        self.assertIn('0.1', lines[2])
+
 
 class TestTargetSearch(TestCase):
     def setUp(self):
@@ -633,6 +797,29 @@ class TestTargetSearch(TestCase):
         response = self.client.get(reverse('targets:list') + '?checked=3')
         self.assertContains(response, '1337target')
 
+    @override_settings(EXTRA_FIELDS=[{'name': 'redshift', 'type': 'number'},
+                                     {'name': 'discovered', 'type': 'datetime'},
+                                     {'name': 'color', 'type': 'string'}])
+    def test_search_multiple_extra_fields(self):
+        for target, redshift, color in [(self.st, '0.1', 'red'), (self.target2, '0.3', 'red')]:
+            TargetExtra.objects.create(target=target, key='redshift', value=redshift)
+            TargetExtra.objects.create(target=target, key='discovered', value='2019-02-14')
+            TargetExtra.objects.create(target=target, key='color', value=color)
+
+        request = RequestFactory().get(reverse('targets:list'))
+        request.user = self.user
+        target_filter = TargetFilter(
+            request=request, data={'redshift_min': '0.05', 'discovered_after': '2019-02-13', 'color': 're'},
+            queryset=Target.objects.all()
+        )
+        self.assertEqual(set(target_filter.qs), {self.st, self.target2})
+        # Each extra field is filtered with a subquery, rather than another join on TargetExtra
+        self.assertNotIn('JOIN', str(target_filter.qs.query))
+
+        target_filter = TargetFilter(request=request, queryset=Target.objects.all(),
+                                     data={'redshift_min': '0.05', 'redshift_max': '0.2', 'color': 'red'})
+        self.assertEqual(list(target_filter.qs), [self.st])
+
     def test_cone_search_coordinates(self):
         response = self.client.get(reverse('targets:list') + '?cone_search=269.75891,-29.179583,0.25')
         self.assertContains(response, '1337target')
@@ -644,6 +831,103 @@ class TestTargetSearch(TestCase):
         self.assertNotContains(response, 'Target1309')
 
 
+class TestTargetNameIndex(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create(name='SN 2019abc')
+        self.alias = TargetNameFactory.create(name='ZTF19aaBcDe', target=self.target)
+        self.other_target = SiderealTargetFactory.create(name='M42')
+
+    def search(self, value):
+        return set(Target.objects.filter(pk__in=search_target_ids(value)))
+
+    def test_search_names_and_aliases(self):
+        self.assertEqual(self.search('2019ABC'), {self.target})
+        self.assertEqual(self.search('19aabc'), {self.target})
+        self.assertEqual(self.search('M4'), {self.other_target})
+        self.assertEqual(self.search('9'), {self.target})
+        self.assertEqual(self.search('"a'), set())
+
+    def test_index_follows_changes(self):
+        self.target.name = 'SN 2020xyz'
+        self.target.save()
+        self.alias.name = 'ZTF20xyz'
+        self.alias.save()
+        self.assertEqual(self.search('2019'), set())
+        self.assertEqual(self.search('20XYZ'), {self.target})
+
+        self.alias.delete()
+        self.assertEqual(self.search('ztf'), set())
+        self.target.delete()
+        self.assertEqual(self.search('2020'), set())
+
+    def test_rebuild_name_index(self):
+        Target.objects.filter(pk=self.other_target.pk).update(name='M31')
+        self.assertEqual(self.search('M31'), set())
+        self.assertEqual(rebuild_name_index(), Target.objects.count() + TargetName.objects.count())
+        self.assertEqual(self.search('M31'), {self.other_target})
+        self.assertEqual(self.search('ztf19'), {self.target})
+
+    def test_bulk_imported_names(self):
+        result = bulk_import_targets(['name,type,ra,dec,name1', 'NGC 1309,SIDEREAL,1,2,PGC 012626'])
+        self.assertEqual(self.search('pgc 0126'), set(result['targets']))
+
+
+class TestTargetConeSearch(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.client.force_login(self.user)
+
+    def create_target(self, name, ra, dec):
+        target = SiderealTargetFactory.create(name=name, ra=ra, dec=dec)
+        assign_perm('tom_targets.view_target', self.user, target)
+        return target
+
+    def test_sky_pixel_set_on_save(self):
+        target = self.create_target('pixeltarget', 10, 10)
+        self.assertEqual(target.sky_pixel, sky_pixel(10, 10))
+        target.ra = 200
+        target.save(update_fields=['ra'])
+        target.refresh_from_db()
+        self.assertEqual(target.sky_pixel, sky_pixel(200, 10))
+
+    def test_cone_search_across_ra_wrap(self):
+        self.create_target('wraptarget1', 359.95, 10)
+        self.create_target('wraptarget2', 0.05, 10)
+        self.create_target('wraptarget3', 180, 10)
+
+        response = self.client.get(reverse('targets:list') + '?cone_search=0,10,0.1')
+        self.assertContains(response, 'wraptarget1')
+        self.assertContains(response, 'wraptarget2')
+        self.assertNotContains(response, 'wraptarget3')
+
+    def test_cone_search_at_pole(self):
+        self.create_target('poletarget1', 10, 89.9)
+        self.create_target('poletarget2', 190, 89.9)
+        self.create_target('poletarget3', 100, 88)
+
+        response = self.client.get(reverse('targets:list') + '?cone_search=280,89.95,0.2')
+        self.assertContains(response, 'poletarget1')
+        self.assertContains(response, 'poletarget2')
+        self.assertNotContains(response, 'poletarget3')
+
+    def test_update_sky_pixels(self):
+        target = self.create_target('stalepixel', 150, -40)
+        Target.objects.filter(pk=target.pk).update(sky_pixel=None)
+
+        call_command('updateskypixels', stdout=StringIO())
+        target.refresh_from_db()
+        self.assertEqual(target.sky_pixel, sky_pixel(150, -40))
+
+    def test_moon_separation(self):
+        moon_ra, moon_dec = get_moon_position()
+        self.create_target('nearmoon', moon_ra, moon_dec)
+        self.create_target('oppositemoon', (moon_ra + 180) % 360, -moon_dec)
+
+        response = self.client.get(reverse('targets:list') + '?moon_separation=90')
+        self.assertContains(response, 'oppositemoon')
+        self.assertNotContains(response, 'nearmoon')
+
+
 class TestTargetGrouping(TestCase):
     def setUp(self):
         user = User.objects.create(username='testuser')
@@ -837,6 +1121,32 @@ class TestTargetAddRemoveGrouping(TestCase):
             WARNING), messages
         )
 
+    def test_add_all_to_grouping_queries_do_not_grow_with_targets(self):
+        user = User.objects.get(username='testuser')
+        for _ in range(20):
+            target = SiderealTargetFactory.create(targetextra_set=None, aliases=None)
+            assign_perm('tom_targets.change_target', user, target)
+        unchangeable_target = SiderealTargetFactory.create()
+        request = RequestFactory().get('/')
+        request.user = user
+        request._messages = []
+        grouping = TargetGroupingFactory.create()
+        with patch('tom_targets.groups.messages') as mock_messages, self.assertNumQueries(5):
+            add_all_to_grouping({'type': 'SIDEREAL'}, grouping, request)
+        self.assertEqual(grouping.targets.count(), 23)
+        mock_messages.success.assert_called_with(
+            request, f"23 target(s) successfully added to group '{grouping.name}'."
+        )
+        mock_messages.error.assert_called_once_with(
+            request, f"Failed to add target with id={unchangeable_target.name} to group '{grouping.name}'; "
+                     "Permission denied."
+        )
+
+        with patch('tom_targets.groups.messages'), self.assertNumQueries(8):
+            move_all_to_grouping({'type': 'SIDEREAL'}, self.fake_grouping, request)
+        self.assertEqual(self.fake_grouping.targets.count(), 23)
+        self.assertEqual(list(grouping.targets.all()), [self.fake_targets[0]])
+
     def test_remove_all_from_grouping_filtered_by_sidereal(self):
         data = {
             'grouping': self.fake_grouping.id,
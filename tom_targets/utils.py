@@ -1,53 +1,107 @@
-from django.db.models import Count
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Max
 
 import csv
+from collections import Counter, defaultdict
+from itertools import islice
+from tom_common.hooks import run_multiple_targets_post_save
+from .crossmatch import invalidate_crossmatch_index
 from .models import Target, TargetExtra, TargetName
-from io import StringIO
+from .name_index import index_new_target_names
+from .sky_index import sky_pixel
 
 
-# NOTE: This saves locally. To avoid this, create file buffer.
-# referenced https://www.codingforentrepreneurs.com/blog/django-queryset-to-csv-files-datasets/
-def export_targets(qs):
+EXPORT_CHUNK_SIZE = 1000
+
+
+class Echo:
     """
-    Exports all the specified targets into a csv file in folder csvTargetFiles
-    NOTE: This saves locally. To avoid this, create file buffer.
+    File-like object whose ``write`` returns the value written, so that ``csv`` writers return each formatted row
+    instead of buffering it. Taken from the Django docs on streaming large CSV files:
+    https://docs.djangoproject.com/en/3.2/howto/outputting-csv/#streaming-large-csv-files
+    """
+    def write(self, value):
+        return value
+
 
-    :param qs: List of targets to export
+def export_targets(qs, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Exports all the specified targets as lines of CSV. Rows are generated lazily, and the extras and aliases of the
+    targets are fetched with one query per chunk of targets, so that memory use and the number of queries per target
+    stay constant regardless of the size of the export.
+
+    :param qs: Targets to export
     :type qs: QuerySet
 
-    :returns: String buffer of exported targets
-    :rtype: StringIO
+    :param chunk_size: Number of targets to fetch, along with their extras and aliases, per round of queries
+    :type chunk_size: int
+
+    :returns: Generator of CSV lines, starting with the header
+    :rtype: generator
     """
-    qs_pk = [data['id'] for data in qs]
-    data_list = list(qs)
+    target_ids = qs.values('id')
     target_fields = [field.name for field in Target._meta.get_fields()]
-    target_extra_fields = list({field.key for field in TargetExtra.objects.filter(target__in=qs_pk)})
+    target_extra_fields = list(
+        TargetExtra.objects.filter(target__in=target_ids).order_by('key').values_list('key', flat=True).distinct()
+    )
     # Gets the count of the target names for the target with the most aliases in the database
     # This is to construct enough row headers of format "name2, name3, name4, etc" for exporting aliases
     # The alias headers are then added to the set of fields for export
-    aliases = TargetName.objects.filter(target__in=qs_pk).values('target_id').annotate(count=Count('target_id'))
-    max_alias_count = 0
-    if aliases:
-        max_alias_count = max([alias['count'] for alias in aliases])
+    max_alias_count = TargetName.objects.filter(target__in=target_ids).order_by().values('target_id').annotate(
+        count=Count('id')
+    ).aggregate(max_count=Max('count'))['max_count'] or 0
     all_fields = target_fields + target_extra_fields + [f'name{index+1}' for index in range(1, max_alias_count+1)]
-    for key in ['id', 'targetlist', 'dataproduct', 'observationrecord', 'reduceddatum', 'aliases', 'targetextra']:
+    for key in ['id', 'targetlist', 'dataproduct', 'observationrecord', 'reduceddatum', 'aliases', 'targetextra',
+                'sky_pixel']:
         all_fields.remove(key)
 
-    file_buffer = StringIO()
-    writer = csv.DictWriter(file_buffer, fieldnames=all_fields)
-    writer.writeheader()
-    for target_data in data_list:
-        extras = list(TargetExtra.objects.filter(target_id=target_data['id']))
-        names = list(TargetName.objects.filter(target_id=target_data['id']))
-        for e in extras:
-            target_data[e.key] = e.value
-        name_index = 2
-        for name in names:
-            target_data[f'name{str(name_index)}'] = name.name
-            name_index += 1
-        del target_data['id']  # do not export 'id'
-        writer.writerow(target_data)
-    return file_buffer
+    writer = csv.DictWriter(Echo(), fieldnames=all_fields, extrasaction='ignore')
+    yield writer.writeheader()
+
+    targets = qs.values().iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(targets, chunk_size))
+        if not chunk:
+            break
+        chunk_ids = [target_data['id'] for target_data in chunk]
+        extras = defaultdict(dict)
+        for target_id, key, value in TargetExtra.objects.filter(target_id__in=chunk_ids).values_list(
+                'target_id', 'key', 'value'):
+            extras[target_id][key] = value
+        names = defaultdict(list)
+        for target_id, name in TargetName.objects.filter(target_id__in=chunk_ids).order_by('id').values_list(
+                'target_id', 'name'):
+            names[target_id].append(name)
+
+        for target_data in chunk:
+            target_data.update(extras[target_data['id']])
+            for name_index, name in enumerate(names[target_data['id']], start=2):
+                target_data[f'name{name_index}'] = name
+            yield writer.writerow(target_data)
+
+
+def _parse_target_row(row, base_target_fields):
+    """
+    Splits a row of a target CSV into the fields of the ``Target``, its extras as ``(key, value)`` tuples and its
+    aliases.
+    """
+    # filter out empty values in base fields, otherwise converting empty string to float will throw error
+    row = {k: v for (k, v) in row.items() if not (k in base_target_fields and not v)}
+    target_extra_fields = []
+    target_names = []
+    target_fields = {}
+    for k in row:
+        # All fields starting with 'name' (e.g. name2, name3) that aren't literally 'name' will be added as
+        # TargetNames
+        if k != 'name' and k.startswith('name'):
+            target_names.append(row[k])
+        elif k not in base_target_fields:
+            target_extra_fields.append((k, row[k]))
+        else:
+            target_fields[k] = row[k]
+    return target_fields, target_extra_fields, target_names
 
 
 def import_targets(targets):
@@ -66,22 +120,7 @@ def import_targets(targets):
     errors = []
     base_target_fields = [field.name for field in Target._meta.get_fields()]
     for index, row in enumerate(targetreader):
-        # filter out empty values in base fields, otherwise converting empty string to float will throw error
-        row = {k: v for (k, v) in row.items() if not (k in base_target_fields and not v)}
-        target_extra_fields = []
-        target_names = []
-        target_fields = {}
-        for k in row:
-            # All fields starting with 'name' (e.g. name2, name3) that aren't literally 'name' will be added as
-            # TargetNames
-            if k != 'name' and k.startswith('name'):
-                target_names.append(row[k])
-            elif k not in base_target_fields:
-                target_extra_fields.append((k, row[k]))
-            else:
-                target_fields[k] = row[k]
-        for extra in target_extra_fields:
-            row.pop(extra[0])
+        target_fields, target_extra_fields, target_names = _parse_target_row(row, base_target_fields)
         try:
             target = Target.objects.create(**target_fields)
             for extra in target_extra_fields:
@@ -95,3 +134,147 @@ def import_targets(targets):
             errors.append(error)
 
     return {'targets': targets, 'errors': errors}
+
+
+def _validate_target_batch(batch):
+    """
+    Validates a batch of parsed target rows, checking field values in memory and the uniqueness of names and aliases
+    against the database with one query per model. Invalid rows are removed from the batch.
+
+    :returns: list of error messages for the invalid rows
+    :rtype: list
+    """
+    errors = []
+    valid = []
+    for line, target, target_extra_fields, target_names in batch:
+        try:
+            target.clean_fields(exclude=['sky_pixel'])
+            if target.name in target_names:
+                raise ValidationError('Target name and target aliases must be unique')
+            valid.append((line, target, target_extra_fields, target_names))
+        except ValidationError as e:
+            errors.append((line, 'Error on line {0}: {1}'.format(line, str(e))))
+
+    batch[:] = valid
+    for line, conflicts in _remove_name_conflicts(batch):
+        errors.append((line, 'Error on line {0}: Name(s) already in use: {1}'.format(line, ', '.join(conflicts))))
+    return [error for _, error in sorted(errors)]
+
+
+def _remove_name_conflicts(batch):
+    """
+    Removes the new targets whose name or aliases are already in use, in the database or by an earlier target of the
+    batch, or whose aliases repeat a name, from a batch of ``(key, target, target_extra_fields, target_names)``
+    tuples. The names are checked against the database with one query per model.
+
+    :returns: list of ``(key, conflicting names)`` tuples for the removed targets
+    :rtype: list
+    """
+    all_names = {target.name for _, target, _, _ in batch}
+    all_aliases = {name for _, _, _, names in batch for name in names}
+    existing_names = set(Target.objects.filter(name__in=all_names).values_list('name', flat=True))
+    existing_aliases = set(TargetName.objects.filter(name__in=all_aliases).values_list('name', flat=True))
+
+    conflicting = []
+    valid = []
+    for key, target, target_extra_fields, target_names in batch:
+        conflicts = ([target.name] if target.name in existing_names else []) + [
+            name for name, count in Counter(target_names).items() if count > 1 or name in existing_aliases
+        ]
+        if conflicts:
+            conflicting.append((key, conflicts))
+            continue
+        existing_names.add(target.name)
+        existing_aliases.update(target_names)
+        valid.append((key, target, target_extra_fields, target_names))
+    batch[:] = valid
+    return conflicting
+
+
+@transaction.atomic
+def _save_target_batch(batch):
+    """
+    Saves a validated batch of targets, along with their extras, default extras and aliases, using one bulk insert per
+    model.
+
+    :returns: list of the created ``Target`` objects
+    :rtype: list
+    """
+    targets = []
+    for _, target, _, _ in batch:
+        target.sky_pixel = sky_pixel(target.ra, target.dec)
+        targets.append(target)
+    Target.objects.bulk_create(targets)
+    if any(target.pk is None for target in targets):
+        # Not all database backends return primary keys from a bulk insert
+        ids = dict(Target.objects.filter(name__in=[t.name for t in targets]).values_list('name', 'id'))
+        for target in targets:
+            target.pk = ids[target.name]
+
+    default_extras = {
+        extra_field['name']: extra_field['default'] for extra_field in settings.EXTRA_FIELDS
+        if extra_field.get('default') is not None
+    }
+    extras = []
+    aliases = []
+    for _, target, target_extra_fields, target_names in batch:
+        for key, value in {**default_extras, **dict(target_extra_fields)}.items():
+            target_extra = TargetExtra(target=target, key=key, value=value)
+            target_extra.set_typed_values()
+            extras.append(target_extra)
+        aliases += [TargetName(target=target, name=name) for name in target_names]
+    TargetExtra.objects.bulk_create(extras)
+    TargetName.objects.bulk_create(aliases)
+    # bulk_create does not send post_save, which would otherwise invalidate the cross-match index and index the names
+    invalidate_crossmatch_index()
+    index_new_target_names(targets, aliases)
+    return targets
+
+
+def bulk_import_targets(targets, batch_size=1000):
+    """
+    Imports a set of targets into the TOM and saves them to the database in batches. Each batch is validated as a
+    whole and saved in its own transaction with one bulk insert each for targets, extras and aliases, so that large
+    catalogues can be imported in a small number of queries. Rows that fail validation are reported and skipped.
+
+    Rather than ``target_post_save`` for each target, the ``multiple_targets_post_save`` hook is run once with all of
+    the created targets, if it is configured.
+
+    :param targets: String buffer of targets
+    :type targets: StringIO
+
+    :param batch_size: Number of rows to validate and save per transaction
+    :type batch_size: int
+
+    :returns: dictionary of successfully imported targets, as well errors
+    :rtype: dict
+    """
+    targetreader = csv.DictReader(targets, dialect=csv.excel)
+    created_targets = []
+    errors = []
+    base_target_fields = [field.name for field in Target._meta.get_fields()]
+    rows = enumerate(targetreader)
+    while True:
+        rows_batch = list(islice(rows, batch_size))
+        if not rows_batch:
+            break
+        batch = []
+        for index, row in rows_batch:
+            target_fields, target_extra_fields, target_names = _parse_target_row(row, base_target_fields)
+            target_names = [name for name in target_names if name]
+            try:
+                batch.append((index + 2, Target(**target_fields), target_extra_fields, target_names))
+            except (TypeError, ValueError) as e:
+                errors.append('Error on line {0}: {1}'.format(index + 2, str(e)))
+        errors += _validate_target_batch(batch)
+        if not batch:
+            continue
+        try:
+            created_targets += _save_target_batch(batch)
+        except DatabaseError as e:
+            errors += ['Error on line {0}: {1}'.format(line, str(e)) for line, _, _, _ in batch]
+
+    if created_targets:
+        run_multiple_targets_post_save(created_targets, created=True)
+
+    return {'targets': created_targets, 'errors': errors}
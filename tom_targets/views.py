@@ -10,7 +10,6 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import Group
 from django.core.management import call_command
 from django.db import transaction
-from django.db.models import Q
 from django.http import HttpResponseRedirect, QueryDict, StreamingHttpResponse
 from django.forms import HiddenInput
 from django.shortcuts import redirect
@@ -40,7 +39,8 @@ from tom_targets.groups import (
     move_all_to_grouping, move_selected_to_grouping
 )
 from tom_targets.models import Target, TargetList
-from tom_targets.utils import import_targets, export_targets
+from tom_targets.name_index import search_target_ids
+from tom_targets.utils import bulk_import_targets, export_targets
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +57,16 @@ class TargetListView(PermissionListMixin, FilterView):
     permission_required = 'tom_targets.view_target'
     ordering = ['-created']
 
+    def get_queryset(self, *args, **kwargs):
+        """
+        Returns the targets that the user is authorized to view, with the data that is displayed in the list
+        prefetched, so that the number of queries does not grow with the number of targets.
+
+        :returns: Set of targets
+        :rtype: QuerySet
+        """
+        return super().get_queryset(*args, **kwargs).with_display_data()
+
     def get_context_data(self, *args, **kwargs):
         """
         Adds the number of targets visible, the available ``TargetList`` objects if the user is authenticated, and
@@ -83,14 +93,12 @@ class TargetNameSearchView(RedirectView):
 
     def get(self, request, *args, **kwargs):
         target_name = self.kwargs['name']
-        # Tests fail without distinct but it works in practice, it is unclear as to why
-        # The Django query planner shows different results between in practice and unit tests
-        # django-guardian related querying is present in the test planner, but not in practice
         targets = get_objects_for_user(request.user, 'tom_targets.view_target').filter(
-            Q(name__icontains=target_name) | Q(aliases__name__icontains=target_name)
-        ).distinct()
-        if targets.count() == 1:
-            return HttpResponseRedirect(reverse('targets:detail', kwargs={'pk': targets.first().id}))
+            pk__in=search_target_ids(target_name)
+        )
+        target_ids = list(targets.values_list('id', flat=True)[:2])
+        if len(target_ids) == 1:
+            return HttpResponseRedirect(reverse('targets:detail', kwargs={'pk': target_ids[0]}))
         else:
             return HttpResponseRedirect(reverse('targets:list') + f'?name={target_name}')
 
@@ -337,6 +345,9 @@ class TargetDetailView(Raise403PermissionRequiredMixin, DetailView):
     permission_required = 'tom_targets.view_target'
     model = Target
 
+    def get_queryset(self, *args, **kwargs):
+        return super().get_queryset(*args, **kwargs).with_display_data()
+
     def get_context_data(self, *args, **kwargs):
         """
         Adds the ``DataProductUploadForm`` to the context and prepopulates the hidden fields.
@@ -401,14 +412,14 @@ class TargetImportView(LoginRequiredMixin, TemplateView):
 
     def post(self, request):
         """
-        Handles the POST requests to this view. Creates a StringIO object and passes it to ``import_targets``.
+        Handles the POST requests to this view. Creates a StringIO object and passes it to ``bulk_import_targets``.
 
         :param request: the request object passed to this view
         :type request: HTTPRequest
         """
         csv_file = request.FILES['target_csv']
         csv_stream = StringIO(csv_file.read().decode('utf-8'), newline=None)
-        result = import_targets(csv_stream)
+        result = bulk_import_targets(csv_stream)
         messages.success(
             request,
             'Targets created: {}'.format(len(result['targets']))
@@ -432,10 +443,7 @@ class TargetExportView(TargetListView):
         :returns: response class with CSV
         :rtype: StreamingHttpResponse
         """
-        qs = context['filter'].qs.values()
-        file_buffer = export_targets(qs)
-        file_buffer.seek(0)  # goto the beginning of the buffer
-        response = StreamingHttpResponse(file_buffer, content_type="text/csv")
+        response = StreamingHttpResponse(export_targets(context['filter'].qs), content_type="text/csv")
         filename = "targets-{}.csv".format(slugify(datetime.utcnow()))
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
         return response